@@ -0,0 +1,16 @@
+-- Soma o estoque de várias revistas em um único comando (usado na entrada de notas de entrega).
+-- O incremento é feito no banco, então entregas simultâneas não perdem atualizações.
+--
+-- Parâmetro:
+--   itens: [{"id_revista": 12, "qtd": 3}, ...]  (um item por revista)
+-- Retorno: (id_revista, qtd_estoque) de cada revista atualizada, já com o novo estoque.
+create or replace function public.incrementar_estoque_revistas(itens jsonb)
+returns table (id_revista bigint, qtd_estoque integer)
+language sql
+as $$
+    update public.revistas r
+       set qtd_estoque = coalesce(r.qtd_estoque, 0) + i.qtd
+      from jsonb_to_recordset(itens) as i(id_revista bigint, qtd integer)
+     where r.id_revista = i.id_revista
+ returning r.id_revista::bigint, r.qtd_estoque::integer;
+$$;
@@ -0,0 +1,94 @@
+-- Registra uma chamada de devolução inteira em uma única transação (usado em /devolucoes/cadastrar-devolucao).
+-- Se qualquer passo falhar, nada é gravado: nem o cabeçalho, nem revistas legadas, nem relações.
+--
+-- Parâmetro:
+--   payload: {
+--     "chamada":  {"id_usuario": ..., "data_limite": "YYYY-MM-DD", "status": "aberta"},
+--     "revistas": [{
+--       "id_revista": 12 | null,          -- já resolvido pelo cache da API; null = procurar/criar
+--       "nome": "...", "numero_edicao": 3, "codigo_barras": "789..." | null,
+--       "preco_capa": 9.9, "preco_liquido": 6.93,
+--       "data_recebimento": "YYYY-MM-DD", "qtd_recebida": 2, "qtd_a_devolver": 2
+--     }, ...]
+--   }
+-- Retorno: {"id_chamada_devolucao", "revistas_criadas": [linhas de revistas], "codigos_atualizados": [{"id_revista", "codigo_barras"}], "qtd_revistas_na_devolucao"}
+--
+-- Os tipos das colunas vêm das próprias tabelas (jsonb_populate_record), então a função não depende de casts manuais.
+create or replace function public.registrar_chamada_devolucao(payload jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_chamada public.chamadasdevolucao;
+    v_item jsonb;
+    v_revista public.revistas;
+    v_id_revista public.revistas.id_revista%type;
+    v_criadas jsonb := '[]'::jsonb;
+    v_codigos jsonb := '[]'::jsonb;
+    v_associadas integer := 0;
+begin
+    insert into public.chamadasdevolucao (id_usuario, data_limite, status)
+    select c.id_usuario, c.data_limite, c.status
+      from jsonb_populate_record(null::public.chamadasdevolucao, payload->'chamada') c
+    returning * into v_chamada;
+
+    for v_item in select * from jsonb_array_elements(coalesce(payload->'revistas', '[]'::jsonb))
+    loop
+        v_revista := jsonb_populate_record(null::public.revistas, v_item);
+        v_id_revista := v_revista.id_revista;
+
+        -- A revista pode ter sido criada por outra requisição depois do snapshot do cache
+        if v_id_revista is null then
+            select r.id_revista into v_id_revista
+              from public.revistas r
+             where lower(trim(r.nome)) = lower(trim(v_revista.nome))
+               and coalesce(r.numero_edicao, 0) = coalesce(v_revista.numero_edicao, 0)
+             limit 1;
+        end if;
+
+        -- Código de barras já cadastrado em outra revista: reaproveita a existente
+        if v_id_revista is null and v_revista.codigo_barras is not null then
+            select r.id_revista into v_id_revista
+              from public.revistas r
+             where r.codigo_barras = v_revista.codigo_barras
+             limit 1;
+        end if;
+
+        if v_id_revista is null then
+            -- Revista legada: criada com estoque 0
+            insert into public.revistas (nome, numero_edicao, codigo_barras, qtd_estoque, preco_capa, preco_liquido)
+            values (v_revista.nome, v_revista.numero_edicao, v_revista.codigo_barras, 0,
+                    coalesce(v_revista.preco_capa, 0), coalesce(v_revista.preco_liquido, 0))
+            returning * into v_revista;
+
+            v_id_revista := v_revista.id_revista;
+            v_criadas := v_criadas || jsonb_build_array(to_jsonb(v_revista));
+
+        elsif v_revista.codigo_barras is not null then
+            -- Completa o código de barras de revistas existentes que ainda não têm um
+            update public.revistas r
+               set codigo_barras = v_revista.codigo_barras
+             where r.id_revista = v_id_revista
+               and r.codigo_barras is null
+               and not exists (select 1 from public.revistas o where o.codigo_barras = v_revista.codigo_barras);
+
+            if found then
+                v_codigos := v_codigos || jsonb_build_array(jsonb_build_object('id_revista', v_id_revista, 'codigo_barras', v_revista.codigo_barras));
+            end if;
+        end if;
+
+        insert into public.revistas_chamadasdevolucao (id_chamada_devolucao, id_revista, data_recebimento, qtd_recebida, qtd_a_devolver)
+        select v_chamada.id_chamada_devolucao, v_id_revista, rc.data_recebimento, rc.qtd_recebida, rc.qtd_a_devolver
+          from jsonb_populate_record(null::public.revistas_chamadasdevolucao, v_item) rc;
+
+        v_associadas := v_associadas + 1;
+    end loop;
+
+    return jsonb_build_object(
+        'id_chamada_devolucao', v_chamada.id_chamada_devolucao,
+        'revistas_criadas', v_criadas,
+        'codigos_atualizados', v_codigos,
+        'qtd_revistas_na_devolucao', v_associadas
+    );
+end;
+$$;
@@ -0,0 +1,218 @@
+-- Busca por prefixo do código de barras (registrar_carrinho): a faixa [prefixo, prefixo || U+10FFFF) é comparada
+-- byte a byte (~>=~ / ~<~), o que este índice atende mesmo com o prefixo vindo de cada item do carrinho.
+create index if not exists revistas_codigo_barras_prefixo_idx
+    on public.revistas (codigo_barras text_pattern_ops);
+
+
+-- Abate a quantidade vendida de 'qtd_a_devolver' nas chamadas de devolução pendentes da revista,
+-- começando pela mais antiga (FIFO por data_recebimento).
+-- Um único UPDATE: a soma acumulada das chamadas anteriores (window function) diz quanto sobra da venda para cada uma,
+-- então o custo não cresce com o número de chamadas abertas.
+-- Não há 'for update' aqui: quem chama (registrar_venda/registrar_carrinho) já travou a linha da revista, o que serializa as vendas dela.
+create or replace function public.atualizar_contagem_devolucao(p_id_revista bigint, p_qtd integer)
+returns void
+language sql
+as $$
+    with pendentes as (
+        select rc.id_chamada_devolucao,
+               rc.qtd_a_devolver,
+               coalesce(sum(rc.qtd_a_devolver) over (
+                   order by rc.data_recebimento, rc.id_chamada_devolucao
+                   rows between unbounded preceding and 1 preceding
+               ), 0) as anteriores
+          from public.revistas_chamadasdevolucao rc
+         where rc.id_revista = p_id_revista
+           and rc.qtd_a_devolver > 0
+    )
+    update public.revistas_chamadasdevolucao rc
+       set qtd_a_devolver = greatest(p.qtd_a_devolver - (p_qtd - p.anteriores), 0)
+      from pendentes p
+     where rc.id_chamada_devolucao = p.id_chamada_devolucao
+       and rc.id_revista = p_id_revista
+       and p.anteriores < p_qtd;
+$$;
+
+
+-- Registra uma venda em uma única transação (usado em /vendas/cadastrar-venda-por-*):
+--   1. decrementa o estoque somente se houver quantidade suficiente (qtd_estoque >= qtd_vendida);
+--   2. insere a venda;
+--   3. abate a contagem de devolução (FIFO).
+-- Como o decremento é condicional e feito no banco, dois terminais vendendo a mesma revista não perdem atualizações.
+--
+-- Parâmetro:
+--   venda: {"id_revista": 12} ou {"codigo_barras": "789..."} (prefixo), mais
+--          "id_usuario", "metodo_pagamento", "qtd_vendida", "desconto_aplicado", "valor_total", "data_venda"
+-- Retorno (jsonb):
+--   {"status": "ok", "id_revista", "nome", "id_venda", "novo_estoque"}
+--   {"status": "revista_inexistente"}
+--   {"status": "estoque_insuficiente", "id_revista", "nome", "estoque_atual"}
+--   {"status": "quantidade_invalida"} (qtd_vendida ausente, zero ou negativa: aumentaria o estoque)
+create or replace function public.registrar_venda(venda jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_revista public.revistas;
+    v_venda public.vendas;
+    v_novo_estoque public.revistas.qtd_estoque%type;
+    v_qtd integer := (venda->>'qtd_vendida')::integer;
+begin
+    if v_qtd is null or v_qtd <= 0 then
+        return jsonb_build_object('status', 'quantidade_invalida');
+    end if;
+
+    if venda ? 'id_revista' then
+        select * into v_revista
+          from public.revistas r
+         where r.id_revista = (venda->>'id_revista')::bigint;
+    else
+        select * into v_revista
+          from public.revistas r
+         where r.codigo_barras like (venda->>'codigo_barras') || '%'
+         limit 1;
+    end if;
+
+    if v_revista.id_revista is null then
+        return jsonb_build_object('status', 'revista_inexistente');
+    end if;
+
+    update public.revistas r
+       set qtd_estoque = r.qtd_estoque - v_qtd
+     where r.id_revista = v_revista.id_revista
+       and r.qtd_estoque >= v_qtd
+    returning r.qtd_estoque into v_novo_estoque;
+
+    if not found then
+        return jsonb_build_object(
+            'status', 'estoque_insuficiente',
+            'id_revista', v_revista.id_revista,
+            'nome', v_revista.nome,
+            'estoque_atual', v_revista.qtd_estoque
+        );
+    end if;
+
+    insert into public.vendas (id_usuario, metodo_pagamento, id_produto, qtd_vendida, desconto_aplicado, valor_total, data_venda)
+    select v.id_usuario, v.metodo_pagamento, v_revista.id_revista, v.qtd_vendida, v.desconto_aplicado, v.valor_total, v.data_venda
+      from jsonb_populate_record(null::public.vendas, venda) v
+    returning * into v_venda;
+
+    perform public.atualizar_contagem_devolucao(v_revista.id_revista, v_qtd);
+
+    return jsonb_build_object(
+        'status', 'ok',
+        'id_revista', v_revista.id_revista,
+        'nome', v_revista.nome,
+        'id_venda', v_venda.id_venda,
+        'novo_estoque', v_novo_estoque
+    );
+end;
+$$;
+
+
+-- Registra um carrinho (várias vendas de uma vez) em uma única transação (usado em /vendas/cadastrar-carrinho):
+--   1. resolve todas as revistas (por id ou prefixo do código de barras) e trava/lê o estoque em uma consulta;
+--   2. valida item a item, na ordem do carrinho, contra o estoque restante;
+--   3. aplica os decrementos e insere as vendas aceitas em lote;
+--   4. abate a contagem de devolução (FIFO) uma vez por revista.
+-- Itens sem estoque, inexistentes ou com qtd_vendida <= 0 ("quantidade_invalida") não impedem os demais.
+-- A busca é feita em duas subconsultas (por id e por prefixo do código de barras), cada uma no seu índice;
+-- com um OR na mesma condição o Postgres não usaria nenhum dos dois e leria a tabela a cada item.
+--
+-- Parâmetro:
+--   itens: [{"id_revista": 12 | "codigo_barras": "789...", "id_usuario", "metodo_pagamento", "qtd_vendida", "desconto_aplicado", "valor_total", "data_venda"}, ...]
+-- Retorno (jsonb): [{"posicao", "status", "id_revista", "nome", "novo_estoque" | "estoque_atual"}, ...] na ordem dos itens.
+create or replace function public.registrar_carrinho(itens jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_resolvidos jsonb;
+    v_estoques jsonb;
+    v_item jsonb;
+    v_id text;
+    v_qtd integer;
+    v_disponivel integer;
+    v_aceitos jsonb := '[]'::jsonb;
+    v_resultados jsonb := '[]'::jsonb;
+begin
+    select coalesce(jsonb_agg(i.item || jsonb_build_object('id_revista', r.id_revista, 'posicao', i.pos - 1) order by i.pos), '[]'::jsonb)
+      into v_resolvidos
+      from jsonb_array_elements(itens) with ordinality as i(item, pos)
+      left join lateral (
+            select coalesce(
+                (select rv.id_revista
+                   from public.revistas rv
+                  where rv.id_revista = (i.item->>'id_revista')::bigint),
+                (select rv.id_revista
+                   from public.revistas rv
+                  where not i.item ? 'id_revista'
+                    and rv.codigo_barras ~>=~ (i.item->>'codigo_barras')
+                    and rv.codigo_barras ~<~ ((i.item->>'codigo_barras') || chr(1114111))
+                  limit 1)
+            ) as id_revista
+      ) r on true;
+
+    select coalesce(jsonb_object_agg(t.id_revista::text, jsonb_build_object('nome', t.nome, 'estoque', t.qtd_estoque)), '{}'::jsonb)
+      into v_estoques
+      from (
+            select rv.id_revista, rv.nome, rv.qtd_estoque
+              from public.revistas rv
+             where rv.id_revista in (select (x->>'id_revista')::bigint from jsonb_array_elements(v_resolvidos) x)
+             order by rv.id_revista
+               for update
+      ) t;
+
+    for v_item in select * from jsonb_array_elements(v_resolvidos)
+    loop
+        v_id := v_item->>'id_revista';
+        v_qtd := (v_item->>'qtd_vendida')::integer;
+
+        if v_qtd is null or v_qtd <= 0 then
+            v_resultados := v_resultados || jsonb_build_array(jsonb_build_object('posicao', v_item->'posicao', 'status', 'quantidade_invalida'));
+            continue;
+        end if;
+
+        if v_id is null then
+            v_resultados := v_resultados || jsonb_build_array(jsonb_build_object('posicao', v_item->'posicao', 'status', 'revista_inexistente'));
+            continue;
+        end if;
+
+        v_disponivel := (v_estoques->v_id->>'estoque')::integer;
+        if v_disponivel < v_qtd then
+            v_resultados := v_resultados || jsonb_build_array(jsonb_build_object(
+                'posicao', v_item->'posicao', 'status', 'estoque_insuficiente', 'id_revista', v_id::bigint,
+                'nome', v_estoques->v_id->'nome', 'estoque_atual', v_disponivel));
+            continue;
+        end if;
+
+        v_estoques := jsonb_set(v_estoques, array[v_id, 'estoque'], to_jsonb(v_disponivel - v_qtd));
+        v_aceitos := v_aceitos || jsonb_build_array(v_item);
+        v_resultados := v_resultados || jsonb_build_array(jsonb_build_object(
+            'posicao', v_item->'posicao', 'status', 'ok', 'id_revista', v_id::bigint,
+            'nome', v_estoques->v_id->'nome', 'novo_estoque', v_disponivel - v_qtd));
+    end loop;
+
+    update public.revistas r
+       set qtd_estoque = r.qtd_estoque - a.total
+      from (
+            select (x->>'id_revista')::bigint as id_revista, sum((x->>'qtd_vendida')::integer) as total
+              from jsonb_array_elements(v_aceitos) x
+             group by 1
+      ) a
+     where r.id_revista = a.id_revista;
+
+    insert into public.vendas (id_usuario, metodo_pagamento, id_produto, qtd_vendida, desconto_aplicado, valor_total, data_venda)
+    select v.id_usuario, v.metodo_pagamento, (x->>'id_revista')::bigint, v.qtd_vendida, v.desconto_aplicado, v.valor_total, v.data_venda
+      from jsonb_array_elements(v_aceitos) x
+     cross join lateral jsonb_populate_record(null::public.vendas, x) v;
+
+    perform public.atualizar_contagem_devolucao(a.id_revista, a.total)
+       from (
+            select (x->>'id_revista')::bigint as id_revista, sum((x->>'qtd_vendida')::integer)::integer as total
+              from jsonb_array_elements(v_aceitos) x
+             group by 1
+       ) a;
+
+    return v_resultados;
+end;
+$$;
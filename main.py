@@ -1,15 +1,35 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, status, HTTPException
 from fastapi.responses import JSONResponse
-from routers import devolucoes, entradas, revistas, vendas, relatorios
+from routers import devolucoes, entradas, revistas, vendas, relatorios, jobs
 
 from settings.settings import importar_configs
-from services.auth import pegar_usuario_admin
+from services.auth import pegar_usuario_admin, iniciar_cliente_admin, encerrar_cliente_admin
+from services.processamento_pdf import iniciar_pool_pdf, encerrar_pool_pdf
+from services.llm import cliente_llm
+from services.jobs import gerenciador_jobs
 from fastapi.middleware.cors import CORSMiddleware
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Um único cliente Supabase (com pool de conexões) para toda a aplicação
+    iniciar_cliente_admin()
+    # Pool de processos para a leitura dos PDFs (pdfplumber), fora do event loop
+    iniciar_pool_pdf()
+    # Cliente da IA com executor próprio, para não disputar threads com as demais rotas
+    cliente_llm.iniciar()
+    yield
+    # Jobs ainda na fila/em andamento são cancelados (ficam com status de erro)
+    await gerenciador_jobs.encerrar()
+    cliente_llm.encerrar()
+    encerrar_pool_pdf()
+    await encerrar_cliente_admin()
+
 # Configurações iniciais
 app = FastAPI(
     title="AndreaController API's Swagger",
-    tags=["Global"]
+    tags=["Global"],
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -69,4 +89,5 @@ app.include_router(devolucoes.router)
 app.include_router(entradas.router)
 app.include_router(revistas.router)
 app.include_router(vendas.router)
-app.include_router(relatorios.router)
\ No newline at end of file
+app.include_router(relatorios.router)
+app.include_router(jobs.router)
\ No newline at end of file
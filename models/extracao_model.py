@@ -0,0 +1,88 @@
+from pydantic import BaseModel, BeforeValidator, ConfigDict, TypeAdapter, ValidationError
+from typing import Annotated, Any, Dict, List, Optional
+
+# Formato da resposta da IA (e do parser local) na extração dos PDFs.
+# Só os campos que as rotas usam: o modelo é enviado ao Gemini como response_schema
+# e a mesma classe valida/converte a resposta (TypeAdapter) em uma passada.
+
+def _decimal_com_virgula(valor):
+    """'13,90' -> '13.90' (o router sempre aceitou preço com vírgula); o resto segue para a validação normal."""
+    if isinstance(valor, str) and "," in valor:
+        return valor.replace(".", "").replace(",", ".")
+    return valor
+
+Preco = Annotated[Optional[float], BeforeValidator(_decimal_com_virgula)]
+
+class _ModeloExtracao(BaseModel):
+    # IDs/códigos podem vir como número do parser local ou da IA ("48507" e 48507 são o mesmo PDV)
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+class NotaEntregaIA(_ModeloExtracao):
+    nota_entrega_id: Optional[str] = None
+    ponto_venda_id: Optional[str] = None
+    data: Optional[str] = None                # YYYY-MM-DD
+
+class RevistaEntregaIA(_ModeloExtracao):
+    nome: Optional[str] = None
+    numero_edicao: Optional[int] = None
+    qtd_estoque: Optional[int] = None
+    preco_capa: Preco = None
+
+class RespostaEntradaIA(_ModeloExtracao):
+    notasentrega: NotaEntregaIA
+    revistas: List[RevistaEntregaIA]
+
+class ChamadaDevolucaoIA(_ModeloExtracao):
+    ponto_venda_id: Optional[str] = None
+    data_limite: Optional[str] = None         # YYYY-MM-DD
+
+class RevistaDevolucaoIA(_ModeloExtracao):
+    nome: Optional[str] = None
+    numero_edicao: Optional[int] = None
+    codigo_barras: Optional[str] = None
+    data_entrega: Optional[str] = None        # YYYY-MM-DD
+    qtd_estoque: Optional[int] = None
+    preco_capa: Preco = None
+    preco_liquido: Preco = None
+
+class RespostaDevolucaoIA(_ModeloExtracao):
+    chamadasdevolucao: ChamadaDevolucaoIA
+    revistas: List[RevistaDevolucaoIA]
+
+# Validadores criados uma única vez (montar o TypeAdapter tem custo).
+# Cabeçalho e revistas são validados separados: uma linha ruim não derruba o documento.
+ADAPTADOR_NOTA_ENTREGA = TypeAdapter(NotaEntregaIA)
+ADAPTADOR_REVISTA_ENTREGA = TypeAdapter(RevistaEntregaIA)
+ADAPTADOR_CHAMADA_DEVOLUCAO = TypeAdapter(ChamadaDevolucaoIA)
+ADAPTADOR_REVISTA_DEVOLUCAO = TypeAdapter(RevistaDevolucaoIA)
+
+def _descrever_erros(e: ValidationError) -> str:
+    """'numero_edicao: Input should be a valid integer; ...' (sem o campo quando o erro é do objeto inteiro)."""
+    return "; ".join(
+        f"{'.'.join(str(parte) for parte in erro['loc'])}: {erro['msg']}" if erro["loc"] else erro["msg"]
+        for erro in e.errors()
+    )
+
+def validar_resposta(dados: Any, chave_cabecalho: str, adaptador_cabecalho: TypeAdapter, adaptador_revista: TypeAdapter) -> Dict[str, Any]:
+    """
+    Valida a resposta linha a linha. Cabeçalho ausente/inválido (ou 'revistas' que não seja lista) levanta ValueError;
+    uma revista inválida sai de 'revistas' e vai para 'linhas_invalidas' ({"linha", "erro"}), somada às que já vierem em 'dados'.
+    """
+    if not isinstance(dados, dict):
+        raise ValueError("a resposta não é um objeto JSON.")
+    try:
+        cabecalho = adaptador_cabecalho.validate_python(dados.get(chave_cabecalho)).model_dump()
+    except ValidationError as e:
+        raise ValueError(f"cabeçalho '{chave_cabecalho}' inválido: {_descrever_erros(e)}")
+    linhas = dados.get("revistas")
+    if not isinstance(linhas, list):
+        raise ValueError("'revistas' ausente ou não é uma lista.")
+
+    revistas: List[Dict[str, Any]] = []
+    linhas_invalidas: List[Dict[str, Any]] = list(dados.get("linhas_invalidas") or [])
+    for linha in linhas:
+        try:
+            revistas.append(adaptador_revista.validate_python(linha).model_dump())
+        except ValidationError as e:
+            linhas_invalidas.append({"linha": linha, "erro": _descrever_erros(e)})
+    return {chave_cabecalho: cabecalho, "revistas": revistas, "linhas_invalidas": linhas_invalidas}
@@ -6,7 +6,7 @@ class RevistaResposta(BaseModel):
     nome: str
     apelido_revista: str | None = None
     numero_edicao: int
-    codigo_barras: str
+    codigo_barras: str | None = None
     qtd_estoque: int
     preco_capa: float
     preco_liquido: float | None = None
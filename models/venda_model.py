@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Union
 from enum import Enum
 from datetime import datetime
 
@@ -22,4 +23,7 @@ class VendaFormularioId(BaseModel):
     qtd_vendida: int
     desconto_aplicado: float
     valor_total: float
-    data_venda: datetime
\ No newline at end of file
+    data_venda: datetime
+
+class CarrinhoFormulario(BaseModel):
+    itens: List[Union[VendaFormularioId, VendaFormularioCodBarras]] = Field(..., min_length=1)
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, UploadFile, HTTPException, File, Depends, status, Path
 from datetime import datetime
-from supabase import Client
-from typing import List, Dict, Any
+from supabase import AsyncClient
+from typing import Awaitable, List, Dict, Any, Optional, Tuple
 import json
 
 from models.chamada_model import ChamadaDevolucaoResposta
 from settings.settings import importar_configs
 from services.auth import validar_token, pegar_usuario_admin
 from services.extracao_devolucao import processar_pdf_para_json
-from services.extracao import extrair_dados_devolucao_local
+from services.extracao_especulativa import extrair_durante_verificacao
+from services.extracao import DocumentoPdf, ler_cabecalho_pdf, extrair_dados_devolucao_local, CAMPOS_DEVOLUCAO
+from services.processamento_pdf import executar_em_processo
+from services.llm import LLMIndisponivel
+from services.jobs import Job, gerenciador_jobs, registrar_etapa
 from routers.revistas import pegar_revistas
+from services.catalogo import catalogo
 
 
 router = APIRouter(
@@ -19,22 +24,26 @@ router = APIRouter(
 
 st = importar_configs()
 
-def _cadastrar_revistas_db(chamada_json: Dict[str, Any], supabase_admin: Client, id_devolucao_criada: str) -> tuple[int, int]:
+def _normalizar_codigo_barras(codigo) -> str | None:
+    """Mantém apenas códigos numéricos com 13 dígitos (EAN-13); qualquer outro valor vira None."""
+    codigo_barras = str(codigo)
+    if codigo_barras and codigo_barras.isdigit():
+        codigo_barras = codigo_barras.strip()[:13]
+        if len(codigo_barras) == 13:
+            return codigo_barras
+    return None
+
+async def _montar_payload_chamada(chamada_json: Dict[str, Any], dados_chamada: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Processa as revistas do JSON (da devolução).
+    Monta o JSON único enviado à função 'registrar_chamada_devolucao' (RPC).
     Lógica de Negócio (CONFORME SOLICITADO):
-    1. Verifica por NOME e EDIÇÃO se a revista já existe no banco.
-    2. SE EXISTIR: Pega o ID. NÃO FAZ NADA com a tabela 'revistas'.
-    3. SE NÃO EXISTIR: Cria a revista (legada) com ESTOQUE 0. Pega o ID.
-    4. Associa o ID (existente ou novo) à devolução na tabela 'revistas_chamadasdevolucao'.
-
-    Retorna (novas_revistas_criadas, revistas_associadas_total).
+    1. Verifica por NOME e EDIÇÃO se a revista já existe no catálogo; se existir, envia o ID.
+    2. SE NÃO EXISTIR: a função cria a revista (legada) com ESTOQUE 0.
+    3. Revistas existentes sem código de barras recebem o código do PDF.
+    4. Cada revista é associada à devolução em 'revistas_chamadasdevolucao'.
+    Tudo roda em uma única transação no banco: ou a chamada inteira é gravada, ou nada é.
     """
-    lista_revistas_json = chamada_json.get("revistas", [])
-    if not lista_revistas_json:
-        return (0, 0)
-
-    revistas_banco = pegar_revistas()
+    revistas_banco = await pegar_revistas()
     revistas_existentes = revistas_banco.data if revistas_banco and revistas_banco.data else []
 
     lookup_revistas: Dict[tuple[str, str], dict] = {}
@@ -47,132 +56,66 @@ def _cadastrar_revistas_db(chamada_json: Dict[str, Any], supabase_admin: Client,
         except Exception as e:
             print(f"Aviso: Ignorando revista do banco com dados inválidos: {rev.get('id_revista')} - {e}")
 
-
-    novas_revistas_criadas = 0
-    revistas_associadas = 0
-
-    def inserir_revista_legada(revista):
-        """
-        Cria uma revista que não existe no banco (legada) com estoque 0.
-        """
-        try:
-            nome_revista = revista.get("nome")
-            edicao_revista = revista.get("numero_edicao")
-            codigo_barras = str(revista.get("codigo_barras"))
-            if codigo_barras and codigo_barras.isdigit():
-                codigo_barras = codigo_barras.strip()[:13]
-                if len(codigo_barras) != 13:
-                    codigo_barras = None
-            else:
-                codigo_barras = None
-            print(f"INFO: Revista '{nome_revista}' (Ed: {edicao_revista}) não encontrada. Criando como legada com estoque 0.")
-
-            resposta_insert = supabase_admin.table("revistas").insert({
-                "nome": nome_revista,
-                "numero_edicao": edicao_revista,
-                "codigo_barras": codigo_barras,
-                "qtd_estoque": 0,
-                "preco_capa": revista.get("preco_capa", 0.0),
-                "preco_liquido": revista.get("preco_liquido", 0.0)
-            }).execute()
-
-            revista_criada = resposta_insert.data[0]
-            return revista_criada
-        except Exception as e:
-            if "violates unique constraint" in str(e):
-                print(f"AVISO: Revista legada '{nome_revista}' não criada, provável código de barras duplicado. Erro: {e}")
-                resp = supabase_admin.table("revistas").select("id_revista").eq("codigo_barras", revista.get("codigo_barras")).execute()
-                if resp.data:
-                    return resp.data[0]
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao inserir revista legada: {e}; Revista: {revista}")
-
-    def inserir_relacao_chamada(id_revista, revista):
-        """Associa a revista à devolução com a quantidade a ser devolvida."""
-        try:
-            qtd_a_devolver = revista.get("qtd_estoque", 0)
-
-            supabase_admin.table("revistas_chamadasdevolucao").insert({
-                "id_chamada_devolucao": id_devolucao_criada,
-                "id_revista": id_revista,
-                "data_recebimento": revista.get("data_entrega"),
-                "qtd_recebida": qtd_a_devolver,
-                "qtd_a_devolver": qtd_a_devolver,
-            }).execute()
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao inserir relação entre revista e chamada: {e}; ID da revista: {id_revista}; Revista: {revista}")
-
-    for revista_json in lista_revistas_json:
+    revistas_payload = []
+    for revista_json in chamada_json.get("revistas", []) or []:
         try:
             nome = str(revista_json.get("nome", "")).strip()
             if not nome:
                 print("Aviso: Ignorando revista sem nome no JSON.")
                 continue
 
-            nome_normalizado = nome.lower()
-
             numero_edicao_json = revista_json.get("numero_edicao")
             edicao_str = "0" if numero_edicao_json is None else str(int(numero_edicao_json))
 
-            id_revista_final = None
-
-            chave_busca = (nome_normalizado, edicao_str)
-            revista_existente = lookup_revistas.get(chave_busca)
-
-            if revista_existente:
-                id_revista_final = revista_existente["id_revista"]
-
-                if revista_existente["codigo_barras"] is None and revista_json.get("codigo_barras"):
-                    try:
-                        codigo_barras = str(revista_json.get("codigo_barras"))
-                        if codigo_barras and codigo_barras.isdigit():
-                            codigo_barras = codigo_barras.strip()[:13]
-                            if len(codigo_barras) != 13:
-                                codigo_barras = None
-                        else:
-                            codigo_barras = None
-                        supabase_admin.table("revistas").update({
-                            "codigo_barras": codigo_barras
-                        }).eq("id_revista", id_revista_final).execute()
-                    except Exception as e:
-                        print(f"Aviso: Não foi possível atualizar o código de barras da revista existente ID {id_revista_final}: {e}")
-
-            else:
-                nova_revista = inserir_revista_legada(revista_json)
-                id_revista_final = nova_revista["id_revista"]
-                novas_revistas_criadas += 1
-
-                lookup_revistas[chave_busca] = nova_revista
-
-            if id_revista_final:
-                inserir_relacao_chamada(id_revista_final, revista_json)
-                revistas_associadas += 1
+            revista_existente = lookup_revistas.get((nome.lower(), edicao_str))
+            qtd_a_devolver = revista_json.get("qtd_estoque") or 0
+
+            revistas_payload.append({
+                "id_revista": revista_existente["id_revista"] if revista_existente else None,
+                "nome": revista_json.get("nome"),
+                "numero_edicao": revista_json.get("numero_edicao"),
+                "codigo_barras": _normalizar_codigo_barras(revista_json.get("codigo_barras")),
+                "preco_capa": revista_json.get("preco_capa") or 0.0,
+                "preco_liquido": revista_json.get("preco_liquido") or 0.0,
+                "data_recebimento": revista_json.get("data_entrega"),
+                "qtd_recebida": qtd_a_devolver,
+                "qtd_a_devolver": qtd_a_devolver,
+            })
 
         except (ValueError, TypeError) as e:
             print(f"Aviso: Ignorando revista com dados inválidos no JSON: {revista_json.get('nome')}. Erro: {e}")
             continue
-        except HTTPException as e:
-            raise e
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao processar revista: {e}; Revista: {revista_json}")
 
-    return (novas_revistas_criadas, revistas_associadas)
+    return {
+        "chamada": dados_chamada,
+        "revistas": revistas_payload,
+    }
 
 
-@router.post("/cadastrar-devolucao", status_code=status.HTTP_201_CREATED)
-async def cadastrar_devolucao(file: UploadFile = File(...), user: dict = Depends(validar_token), supabase_admin: Client = Depends(pegar_usuario_admin)):
-    """
-    ETAPA 1: Recebe um ARQUIVO PDF, usa IA para extrair dados,
-    e salva o registro da tarefa de devolução com status 'aberta'.
-    NÃO ATUALIZA O ESTOQUE PRINCIPAL.
-    """
-    arquivo_bytes = await file.read()
+def _chave_job(user: dict, data_limite_iso: str) -> str:
+    return f"devolucao:{user['sub']}:{data_limite_iso}"
+
+
+async def _ler_cabecalho_devolucao(arquivo_bytes: bytes) -> Tuple[DocumentoPdf, str]:
+    """Lê só as páginas necessárias para achar o cabeçalho. Retorna (documento, data_limite_iso)."""
     if not arquivo_bytes:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O arquivo enviado está vazio.")
 
     try:
-        data_limite_iso_local = extrair_dados_devolucao_local(arquivo_bytes)
+        documento = await executar_em_processo(ler_cabecalho_pdf, arquivo_bytes, CAMPOS_DEVOLUCAO)
+        data_limite_iso_local = extrair_dados_devolucao_local(documento)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro na pré-verificação do PDF: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao verificar duplicatas: {e}")
+
+    return (documento, data_limite_iso_local)
+
 
-        resposta_duplicata = (
+async def _verificar_duplicata_devolucao(data_limite_iso_local: str, user: dict, supabase_admin: AsyncClient):
+    """Recusa (409) chamadas já gravadas ou ainda em processamento com a mesma data limite."""
+    try:
+        resposta_duplicata = await (
             supabase_admin.table("chamadasdevolucao")
             .select("id_chamada_devolucao")
             .eq("id_usuario", user["sub"])
@@ -185,16 +128,54 @@ async def cadastrar_devolucao(file: UploadFile = File(...), user: dict = Depends
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"Chamada de devolução duplicada. Já existe um cadastro com data limite {data_limite_iso_local}.",
             )
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro na pré-verificação do PDF: {e}")
+        if gerenciador_jobs.ativo_com_chave(_chave_job(user, data_limite_iso_local)):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Chamada de devolução duplicada. A chamada com data limite {data_limite_iso_local} já está sendo processada.",
+            )
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao verificar duplicatas: {e}")
 
 
+async def _pre_verificar_devolucao(arquivo_bytes: bytes, user: dict, supabase_admin: AsyncClient) -> Tuple[DocumentoPdf, str]:
+    """
+    Pré-verificação (sempre síncrona, mesmo no envio por job): lê o cabeçalho do PDF e recusa chamadas
+    duplicadas, já gravadas ou ainda em processamento. Retorna (documento, data_limite_iso).
+    """
+    (documento, data_limite_iso_local) = await _ler_cabecalho_devolucao(arquivo_bytes)
+    await _verificar_duplicata_devolucao(data_limite_iso_local, user, supabase_admin)
+    return (documento, data_limite_iso_local)
+
+
+async def _processar_devolucao(
+    documento: DocumentoPdf,
+    arquivo_bytes: bytes,
+    user: dict,
+    supabase_admin: AsyncClient,
+    job: Optional[Job] = None,
+    verificacao: Optional[Awaitable[None]] = None,
+) -> Dict[str, Any]:
+    """
+    Extrai os dados do PDF e grava a chamada (RPC única). Retorna o corpo da resposta.
+    Sem 'verificacao', o PDF já passou pela verificação de duplicata. Com ela (e EXTRACAO_ESPECULATIVA),
+    a extração começa junto com a verificação e é cancelada se a chamada for duplicada.
+    """
+    extracao = None
+    if verificacao is not None and st.EXTRACAO_ESPECULATIVA:
+        extracao = await extrair_durante_verificacao(verificacao, processar_pdf_para_json(documento, arquivo_bytes))
+    elif verificacao is not None:
+        await verificacao
+
     try:
-        chamada_json = await processar_pdf_para_json(arquivo_bytes)
+        registrar_etapa(job, "Extraindo dados do PDF", 0.1)
+        if extracao is None:
+            # Não é duplicata: lê o restante das páginas (ou usa o cache de extração) e interpreta
+            extracao = processar_pdf_para_json(documento, arquivo_bytes)
+        chamada_json = await extracao
+    except LLMIndisponivel as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro ao processar PDF (IA): {str(e)}")
 
@@ -221,9 +202,8 @@ async def cadastrar_devolucao(file: UploadFile = File(...), user: dict = Depends
             "status": "aberta"
         }
 
-        resposta_insert = supabase_admin.table("chamadasdevolucao").insert(dados_chamada).execute()
-        chamada_criada = resposta_insert.data[0]
-        id_devolucao_criada = chamada_criada["id_chamada_devolucao"]
+        registrar_etapa(job, "Conferindo as revistas no catálogo", 0.7)
+        payload = await _montar_payload_chamada(chamada_json, dados_chamada)
 
     except (KeyError, ValueError) as e:
         detail = f"Erro ao processar dados da devolução (IA): {e}"
@@ -234,22 +214,68 @@ async def cadastrar_devolucao(file: UploadFile = File(...), user: dict = Depends
         detail = f"Erro geral ao inserir devolução: {e}"
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
 
-    revistas_inseridas, revistas_associadas = _cadastrar_revistas_db(chamada_json, supabase_admin, id_devolucao_criada)
+    try:
+        registrar_etapa(job, "Gravando a devolução", 0.8)
+        resposta_rpc = await supabase_admin.rpc("registrar_chamada_devolucao", {"payload": payload}).execute()
+        resultado = resposta_rpc.data
+    except Exception as e:
+        detail = f"Erro ao registrar a devolução no banco (nenhum dado foi gravado): {e}"
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
+
+    for revista_criada in resultado.get("revistas_criadas", []):
+        catalogo.registrar(revista_criada)
+    for codigo in resultado.get("codigos_atualizados", []):
+        catalogo.atualizar(codigo["id_revista"], codigo_barras=codigo["codigo_barras"])
 
     return {
         "data": {
-            "id_devolucao": id_devolucao_criada,
-            "qtd_revistas_legadas_criadas": revistas_inseridas,
-            "qtd_revistas_na_devolucao": revistas_associadas,
+            "id_devolucao": resultado["id_chamada_devolucao"],
+            "qtd_revistas_legadas_criadas": len(resultado.get("revistas_criadas", [])),
+            "qtd_revistas_na_devolucao": resultado.get("qtd_revistas_na_devolucao", 0),
+            "linhas_invalidas": chamada_json.get("linhas_invalidas") or [],
         },
         "message": "Devolução (Chamada) registrada com status 'aberta'. Estoque não alterado."
     }
 
+
+@router.post("/cadastrar-devolucao", status_code=status.HTTP_201_CREATED)
+async def cadastrar_devolucao(file: UploadFile = File(...), user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
+    """
+    ETAPA 1: Recebe um ARQUIVO PDF, usa IA para extrair dados,
+    e salva o registro da tarefa de devolução com status 'aberta'.
+    NÃO ATUALIZA O ESTOQUE PRINCIPAL.
+    """
+    arquivo_bytes = await file.read()
+    (documento, data_limite_iso_local) = await _ler_cabecalho_devolucao(arquivo_bytes)
+    verificacao = _verificar_duplicata_devolucao(data_limite_iso_local, user, supabase_admin)
+    return await _processar_devolucao(documento, arquivo_bytes, user, supabase_admin, verificacao=verificacao)
+
+
+@router.post("/enfileirar-devolucao", status_code=status.HTTP_202_ACCEPTED)
+async def enfileirar_devolucao(file: UploadFile = File(...), user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
+    """
+    Igual a /cadastrar-devolucao, mas responde logo após a pré-verificação (duplicatas, cabeçalho).
+    A extração e a gravação seguem em segundo plano; acompanhe por GET /jobs/{id_job}.
+    """
+    arquivo_bytes = await file.read()
+    (documento, data_limite_iso_local) = await _pre_verificar_devolucao(arquivo_bytes, user, supabase_admin)
+
+    job = gerenciador_jobs.enfileirar(
+        "devolucao",
+        user["sub"],
+        lambda job: _processar_devolucao(documento, arquivo_bytes, user, supabase_admin, job),
+        chave=_chave_job(user, data_limite_iso_local),
+    )
+    return {
+        "data": {"id_job": job.id_job, "status": job.situacao, "url_status": f"/jobs/{job.id_job}"},
+        "message": "Devolução recebida. O processamento continua em segundo plano.",
+    }
+
 @router.post("/{id_devolucao}/confirmar", status_code=status.HTTP_200_OK)
 async def confirmar_devolucao(
     id_devolucao: int = Path(..., title="ID da Devolução a ser confirmada", ge=1),
     user: dict = Depends(validar_token),
-    supabase_admin: Client = Depends(pegar_usuario_admin)
+    supabase_admin: AsyncClient = Depends(pegar_usuario_admin)
 ):
     """
     ETAPA 2: Confirma uma devolução (tarefa concluída).
@@ -258,7 +284,7 @@ async def confirmar_devolucao(
     """
 
     try:
-        resposta_update = supabase_admin.table("chamadasdevolucao").update(
+        resposta_update = await supabase_admin.table("chamadasdevolucao").update(
             {"status": "fechada"}
         ).eq("id_chamada_devolucao", id_devolucao).eq("id_usuario", user["sub"]).execute()
 
@@ -280,12 +306,12 @@ async def confirmar_devolucao(
 
 
 @router.get("/listar-devolucoes-usuario")
-async def listar_devolucoes_por_usuario(user: dict = Depends(validar_token), supabase_admin: Client = Depends(pegar_usuario_admin)):
+async def listar_devolucoes_por_usuario(user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Lista todas as devoluções (antigas chamadas) associadas ao usuário autenticado.
     """
     try:
-        resposta = (
+        resposta = await (
             supabase_admin.table("chamadasdevolucao")
             .select("*")
             .eq("id_usuario", user["sub"])
@@ -302,14 +328,14 @@ async def listar_devolucoes_por_usuario(user: dict = Depends(validar_token), sup
         )
 
 @router.get("/{id_devolucao}")
-async def get_devolucao_por_id(id_devolucao: int, user: dict = Depends(validar_token), supabase_admin: Client = Depends(pegar_usuario_admin)):
+async def get_devolucao_por_id(id_devolucao: int, user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Retorna os dados de uma devolução (antiga chamada) pelo ID,
     incluindo as revistas associadas.
     O frontend pode usar isso para a "Consulta".
     """
     try:
-        resposta = (
+        resposta = await (
             supabase_admin.table("chamadasdevolucao")
             .select("*, revistas_chamadasdevolucao(*, revistas(nome, numero_edicao))")
             .eq("id_chamada_devolucao", id_devolucao)
@@ -1,15 +1,22 @@
 from fastapi import APIRouter, UploadFile, HTTPException, File, Depends, status, Path
 from datetime import datetime
-from supabase import Client
-from typing import List, Dict, Any
+from supabase import AsyncClient
+from typing import Awaitable, List, Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
 import json
 
 from models.chamada_model import ChamadaDevolucaoResposta
 from settings.settings import importar_configs
 from services.auth import validar_token, pegar_usuario_admin
 from services.extracao_entrada import processar_pdf_para_json
-from services.extracao import extrair_dados_entrada_local
+from services.extracao_especulativa import extrair_durante_verificacao
+from services.extracao import DocumentoPdf, ler_cabecalho_pdf, extrair_dados_entrada_local, CAMPOS_ENTRADA
+from services.processamento_pdf import executar_em_processo
+from services.llm import LLMIndisponivel
+from services.jobs import Job, gerenciador_jobs, registrar_etapa
 from routers.revistas import pegar_revistas
+from services.catalogo import catalogo
 
 # id_revista': None, 'nome': 'ALMANAQUE DE HISTORIAS CURTAS TURMA DA MONICA', 'numero_edicao': 16, 'qtd_estoque': 1, 'preco_capa': 11.9, 'url_revista': None
 # {'id_nota_entrega': None, 'id_usuario': None, 'ponto_venda_id': 48507, 'nota_entrega_id': 1049, 'data': '2025-11-08', 'url_documento': None}
@@ -24,136 +31,419 @@ st = importar_configs()
 URL_EXPIRATION_SECONDS = 30 * 24 * 60 * 60
 
 
-def _cadastrar_revistas_db(entrega_json: Dict[str, Any], supabase_admin: Client, id_entrega_criada: str) -> tuple[int, int]:
+async def _inserir_em_lote(supabase_admin: AsyncClient, tabela: str, linhas: List[Dict[str, Any]], descrever, erros: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Processa os dados das revistas do JSON e os insere/atualiza em lote.
-    - Se a revista (nome + edição) existe, SOMA o estoque.
-    - Se não existe, CRIA a revista com o estoque inicial.
-    Retorna (novas_revistas_criadas, revistas_atualizadas).
+    Insere todas as linhas em um único INSERT. Se o lote falhar, refaz linha a linha
+    apenas para isolar quais registros têm problema (registrados em 'erros').
     """
-    lista_revistas_json = entrega_json.get("revistas", [])
-
-    if not lista_revistas_json:
-        return (0, 0)
-
-    revistas_banco = pegar_revistas()
-    revistas_existentes = revistas_banco.data if revistas_banco and revistas_banco.data else []
+    if not linhas:
+        return []
+    try:
+        resposta = await supabase_admin.table(tabela).insert(linhas).execute()
+        return resposta.data or []
+    except Exception as e:
+        print(f"Aviso: Falha no INSERT em lote em '{tabela}' ({len(linhas)} linhas), tentando linha a linha. Erro: {e}")
 
-    lookup_revistas: Dict[tuple[str, str], dict] = {}
-    for rev in revistas_existentes:
+    inseridas = []
+    for linha in linhas:
         try:
-            nome_norm = str(rev.get("nome", "")).strip().lower()
-            edicao_str = str(rev.get("numero_edicao", "0"))
-            if nome_norm:
-                lookup_revistas[(nome_norm, edicao_str)] = rev
+            resposta = await supabase_admin.table(tabela).insert(linha).execute()
+            inseridas.extend(resposta.data or [])
         except Exception as e:
-            print(f"Aviso: Ignorando revista do banco com dados inválidos: {rev.get('id_revista')} - {e}")
+            print(f"ERRO: Falha ao INSERIR em '{tabela}': {descrever(linha)}. Erro: {e}")
+            erros.append({**descrever(linha), "erro": str(e)})
+    return inseridas
+
 
-    inseridas = 0
-    atualizadas = 0
+def _erros_da_extracao(entrega_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Linhas que a extração sinalizou, no formato de 'erros': as que o parser local não leu (foram interpretadas
+    pela IA e merecem conferência) e as que foram descartadas por estarem fora do esquema.
+    """
+    erros: List[Dict[str, Any]] = []
+    for linha in entrega_json.get("linhas_nao_lidas") or []:
+        erros.append({"nome": None, "numero_edicao": None, "linha": linha, "erro": "Linha não lida pelo parser local; interpretada pela IA, confira o cadastro."})
+    for invalida in entrega_json.get("linhas_invalidas") or []:
+        linha = invalida.get("linha") if isinstance(invalida.get("linha"), dict) else {}
+        erros.append({
+            "nome": linha.get("nome"),
+            "numero_edicao": linha.get("numero_edicao"),
+            "linha": invalida.get("linha"),
+            "erro": f"Linha fora do esquema, ignorada: {invalida.get('erro')}",
+        })
+    return erros
+
+
+def _agrupar_itens_entrega(entrega_json: Dict[str, Any], erros: List[Dict[str, Any]]) -> Dict[tuple[str, str], Dict[str, Any]]:
+    """
+    Normaliza e agrupa as linhas da nota por (nome, edição), somando as quantidades. Linhas inválidas vão para 'erros',
+    assim como as sinalizadas pela extração (_erros_da_extracao).
+    """
+    erros.extend(_erros_da_extracao(entrega_json))
 
-    for revista_data in lista_revistas_json:
+    itens: Dict[tuple[str, str], Dict[str, Any]] = {}
+    for revista_data in entrega_json.get("revistas", []) or []:
         try:
             nome = str(revista_data.get("nome", "")).strip()
             if not nome:
                 print("Aviso: Ignorando revista sem nome no JSON.")
+                erros.append({"nome": None, "numero_edicao": revista_data.get("numero_edicao"), "erro": "Revista sem nome"})
                 continue
 
-            nome_normalizado = nome.lower()
-
-
             numero_edicao_json = revista_data.get("numero_edicao")
-            if numero_edicao_json is None:
-                numero_edicao_str = "0"
-                numero_edicao_int = 0
-            else:
-                numero_edicao_str = str(int(numero_edicao_json))
-                numero_edicao_int = int(numero_edicao_json)
+            numero_edicao_int = 0 if numero_edicao_json is None else int(numero_edicao_json)
 
             qtd_nova = int(revista_data.get("qtd_estoque") or 0)
             if qtd_nova < 0:
                 qtd_nova = 0
 
-            preco_capa_str = str(revista_data.get("preco_capa", "0.0")).replace(',', '.')
+            preco_capa_str = str(revista_data.get("preco_capa") or "0.0").replace(',', '.')
             preco_capa = float(preco_capa_str)
 
-            id_revista_processada = None
+            chave_busca = (nome.lower(), str(numero_edicao_int))
+            if chave_busca in itens:
+                itens[chave_busca]["qtd"] += qtd_nova
+            else:
+                itens[chave_busca] = {
+                    "nome": nome,
+                    "numero_edicao": numero_edicao_int,
+                    "qtd": qtd_nova,
+                    "preco_capa": preco_capa,
+                    "url_revista": revista_data.get("url_revista"),
+                }
+
+        except (ValueError, TypeError) as e:
+            print(f"Aviso: Ignorando revista com dados inválidos no JSON: {revista_data.get('nome')}. Erro: {e}")
+            erros.append({"nome": revista_data.get("nome"), "numero_edicao": revista_data.get("numero_edicao"), "erro": f"Dados inválidos: {e}"})
+    return itens
+
+
+async def _gravar_revistas_entregas(supabase_admin: AsyncClient, entregas: List[Dict[str, Any]], gravar_relacoes: bool = True):
+    """
+    Insere/atualiza as revistas de uma ou mais entregas com o mesmo número de chamadas ao banco,
+    qualquer que seja o número de entregas:
+    - Se a revista (nome + edição) existe, SOMA o estoque.
+    - Se não existe, CRIA a revista com o estoque inicial.
+    Um INSERT com as revistas novas, uma RPC (incrementar_estoque_revistas) com os incrementos e um INSERT com as relações.
+    Cada entrega é um dict {"id_entrega", "itens", "erros"}; as contagens "inseridas" e "atualizadas" são preenchidas nele.
+    Revista nova presente em várias entregas é criada uma vez só (com a soma) e conta como criada na primeira delas.
+    Em "ids" fica o id_revista de cada item gravado (e em "criadas", as chaves das revistas criadas por esta entrega);
+    com gravar_relacoes=False as relações ficam por conta de quem chamou.
+    """
+    for entrega in entregas:
+        entrega["inseridas"] = 0
+        entrega["atualizadas"] = 0
+        entrega["ids"] = {}
+        entrega["criadas"] = set()
+    if not any(entrega["itens"] for entrega in entregas):
+        return
+
+    revistas_banco = await pegar_revistas()
+    revistas_existentes = revistas_banco.data if revistas_banco and revistas_banco.data else []
 
-            chave_busca = (nome_normalizado, numero_edicao_str)
-            revista_existente = lookup_revistas.get(chave_busca)
+    lookup_revistas: Dict[tuple[str, str], dict] = {}
+    for rev in revistas_existentes:
+        try:
+            nome_norm = str(rev.get("nome", "")).strip().lower()
+            edicao_str = str(rev.get("numero_edicao", "0"))
+            if nome_norm:
+                lookup_revistas[(nome_norm, edicao_str)] = rev
+        except Exception as e:
+            print(f"Aviso: Ignorando revista do banco com dados inválidos: {rev.get('id_revista')} - {e}")
 
-            if revista_existente:
-                try:
-                    id_revista_existente = revista_existente["id_revista"]
-                    estoque_atual = int(revista_existente.get("qtd_estoque") or 0)
-                    novo_estoque = estoque_atual + qtd_nova
+    # 1. Total de cada revista somando todas as entregas (na ordem em que aparecem)
+    totais: Dict[tuple[str, str], Dict[str, Any]] = {}
+    for entrega in entregas:
+        for chave, item in entrega["itens"].items():
+            if chave in totais:
+                totais[chave]["qtd"] += item["qtd"]
+            else:
+                totais[chave] = dict(item)
+
+    def registrar_erro(chave: tuple[str, str], erro: Dict[str, Any]):
+        for entrega in entregas:
+            if chave in entrega["itens"]:
+                entrega["erros"].append(dict(erro))
+
+    ids_por_chave: Dict[tuple[str, str], int] = {}
+    novas = []
+    for chave, item in totais.items():
+        existente = lookup_revistas.get(chave)
+        if existente:
+            ids_por_chave[chave] = existente["id_revista"]
+        else:
+            novas.append(item)
+
+    # 2. Um único INSERT para todas as revistas novas; os IDs voltam mapeados por (nome, edição)
+    erros_insercao: List[Dict[str, Any]] = []
+    revistas_inseridas = await _inserir_em_lote(
+        supabase_admin,
+        "revistas",
+        [{
+            "nome": item["nome"],
+            "numero_edicao": item["numero_edicao"],
+            "qtd_estoque": item["qtd"],
+            "preco_capa": item["preco_capa"],
+            "url_revista": item["url_revista"],
+        } for item in novas],
+        lambda linha: {"nome": linha["nome"], "numero_edicao": linha["numero_edicao"]},
+        erros_insercao,
+    )
+    for erro in erros_insercao:
+        registrar_erro((str(erro["nome"]).lower(), str(erro["numero_edicao"])), erro)
+    criadas = set()
+    for nova_revista in revistas_inseridas:
+        chave = (str(nova_revista.get("nome", "")).strip().lower(), str(nova_revista.get("numero_edicao", "0")))
+        ids_por_chave[chave] = nova_revista["id_revista"]
+        criadas.add(chave)
+        catalogo.registrar(nova_revista)
+
+    # 3. Uma única RPC soma o estoque das revistas existentes (incremento feito no banco, sem ler-modificar-escrever)
+    incrementos = [
+        {"id_revista": ids_por_chave[chave], "qtd": item["qtd"]}
+        for chave, item in totais.items()
+        if chave in lookup_revistas
+    ]
+    if incrementos:
+        try:
+            resposta = await supabase_admin.rpc("incrementar_estoque_revistas", {"itens": incrementos}).execute()
+            for linha in resposta.data or []:
+                catalogo.atualizar(linha["id_revista"], qtd_estoque=linha["qtd_estoque"])
+        except Exception as e:
+            print(f"ERRO: Falha ao ATUALIZAR estoque em lote ({len(incrementos)} revistas). Erro: {e}")
+            for chave, item in totais.items():
+                if chave in lookup_revistas:
+                    registrar_erro(chave, {"nome": item["nome"], "numero_edicao": item["numero_edicao"], "erro": f"Falha ao atualizar estoque: {e}"})
+                    ids_por_chave.pop(chave, None)
+
+    for entrega in entregas:
+        for chave in entrega["itens"]:
+            if chave not in ids_por_chave:
+                continue
+            entrega["ids"][chave] = ids_por_chave[chave]
+            if chave in criadas:
+                criadas.discard(chave)
+                entrega["criadas"].add(chave)
+                entrega["inseridas"] += 1
+            else:
+                entrega["atualizadas"] += 1
+
+    if not gravar_relacoes:
+        return
+
+    # 4. Um único INSERT com as relações revista <-> documento de entrega
+    erros_relacoes: List[Dict[str, Any]] = []
+    await _inserir_em_lote(
+        supabase_admin,
+        "revistas_documentos_entrega",
+        [{
+            "id_documento_entrega": entrega["id_entrega"],
+            "id_revista": ids_por_chave[chave],
+            "qtd_entregue": item["qtd"],
+        } for entrega in entregas for chave, item in entrega["itens"].items() if chave in ids_por_chave],
+        lambda linha: {"id_documento_entrega": linha["id_documento_entrega"], "id_revista": linha["id_revista"], "qtd_entregue": linha["qtd_entregue"]},
+        erros_relacoes,
+    )
+    for erro in erros_relacoes:
+        id_entrega = erro.pop("id_documento_entrega")
+        for entrega in entregas:
+            if entrega["id_entrega"] == id_entrega:
+                entrega["erros"].append(erro)
+
+
+async def _cadastrar_revistas_db(entrega_json: Dict[str, Any], supabase_admin: AsyncClient, id_entrega_criada: str) -> tuple[int, int, List[Dict[str, Any]]]:
+    """
+    Processa os dados das revistas do JSON e os insere/atualiza em lote (ver _gravar_revistas_entregas).
+    Retorna (novas_revistas_criadas, revistas_atualizadas, erros_por_linha).
+    """
+    erros: List[Dict[str, Any]] = []
+    entrega = {"id_entrega": id_entrega_criada, "itens": _agrupar_itens_entrega(entrega_json, erros), "erros": erros}
+    await _gravar_revistas_entregas(supabase_admin, [entrega])
+    return (entrega["inseridas"], entrega["atualizadas"], erros)
 
-                    supabase_admin.table("revistas").update(
-                        {"qtd_estoque": novo_estoque}
-                    ).eq("id_revista", id_revista_existente).execute()
 
-                    id_revista_processada = id_revista_existente
-                    atualizadas += 1
+class _GravadorEntregaFluxo:
+    """
+    Grava o estoque das revistas enquanto a IA ainda gera a resposta (LLM_STREAMING).
+    - Cada linha recebida entra numa fila; a cada LLM_STREAMING_LOTE linhas um lote é gravado em segundo plano
+      (INSERT das novas + RPC de incremento, como em _gravar_revistas_entregas), um lote por vez, para que
+      a mesma revista em lotes diferentes seja criada no primeiro e incrementada nos seguintes.
+    - O documento de entrega é criado antes do primeiro lote (data do cabeçalho lido na pré-verificação, corrigida
+      em concluir() se a IA ler outra), para que nenhum estoque seja somado sem o documento que o justifica.
+      As relações com o documento são gravadas no fim (concluir), com a quantidade somada de cada revista.
+    - Se a extração falhar no meio, desfazer() apaga as revistas criadas pelos lotes (ou, se não der, zera o estoque
+      que receberam), devolve o estoque somado às existentes (incremento negativo pela mesma RPC) e apaga o documento.
+    - Com liberado=False (extração especulativa), nada é gravado antes de liberar(), isto é, antes de a
+      verificação de duplicata passar; as linhas só se acumulam.
+    """
 
-                    lookup_revistas[chave_busca]["qtd_estoque"] = novo_estoque
+    def __init__(self, supabase_admin: AsyncClient, dados_entrega: Dict[str, Any], liberado: bool = True):
+        self._supabase_admin = supabase_admin
+        self._dados_entrega = dados_entrega
+        self.id_entrega: Optional[int] = None
+        self._liberado = asyncio.Event()
+        if liberado:
+            self._liberado.set()
+        self._pendentes: List[Dict[str, Any]] = []
+        self._tarefa: Optional[asyncio.Task] = None
+        self._aplicadas: Dict[tuple[str, str], Dict[str, Any]] = {}  # chave -> {"id_revista", "qtd", "criada"}
+        self._inseridas = 0
+        self.recebidas = 0
+        self.erros: List[Dict[str, Any]] = []
+        self._falha: Optional[BaseException] = None  # primeira falha de um lote; concluir() a repassa
+
+    def adicionar(self, revista: Dict[str, Any]):
+        """Recebe uma linha da resposta (chamado pelo leitor do fluxo, a cada revista completa)."""
+        self.recebidas += 1
+        self._pendentes.append(revista)
+        if self._tarefa is not None and self._tarefa.done():
+            self._guardar_falha(self._tarefa)
+            self._tarefa = None
+        if len(self._pendentes) >= st.LLM_STREAMING_LOTE and self._tarefa is None and self._falha is None:
+            self._tarefa = asyncio.create_task(self._descarregar())
+
+    def _guardar_falha(self, tarefa: asyncio.Task):
+        """Lê o resultado do lote terminado; a primeira falha fica guardada (as linhas daquele lote não foram gravadas)."""
+        if not tarefa.cancelled() and tarefa.exception() is not None and self._falha is None:
+            self._falha = tarefa.exception()
+
+    def liberar(self):
+        self._liberado.set()
+
+    async def _criar_documento(self):
+        if self.id_entrega is None:
+            resposta = await self._supabase_admin.table("documentos_entrega").insert(self._dados_entrega).execute()
+            self.id_entrega = resposta.data[0]["id_documento_entrega"]
+
+    async def _descarregar(self):
+        await self._liberado.wait()
+        while self._pendentes:
+            await self._criar_documento()
+            lote, self._pendentes = self._pendentes, []
+            entrega = {"id_entrega": None, "itens": _agrupar_itens_entrega({"revistas": lote}, self.erros), "erros": self.erros}
+            await _gravar_revistas_entregas(self._supabase_admin, [entrega], gravar_relacoes=False)
+            self._inseridas += entrega["inseridas"]
+            for chave, id_revista in entrega["ids"].items():
+                aplicada = self._aplicadas.setdefault(chave, {"id_revista": id_revista, "qtd": 0, "criada": chave in entrega["criadas"]})
+                aplicada["qtd"] += entrega["itens"][chave]["qtd"]
+
+    async def _aguardar_lote_em_andamento(self):
+        """Espera o lote em andamento e repassa a primeira falha de lote (quem chamou desfaz a entrega)."""
+        if self._tarefa is not None:
+            tarefa, self._tarefa = self._tarefa, None
+            await asyncio.wait([tarefa])
+            self._guardar_falha(tarefa)
+        if self._falha is not None:
+            raise self._falha
+
+    async def concluir(self, data_entrega: str) -> tuple[int, int, int, List[Dict[str, Any]]]:
+        """
+        Grava o que falta e as relações com o documento, com a data validada da resposta.
+        Retorna (id_entrega, novas_revistas_criadas, revistas_atualizadas, erros_por_linha).
+        """
+        await self._aguardar_lote_em_andamento()
+        await self._descarregar()
+        await self._criar_documento()
+        if data_entrega != self._dados_entrega["data_entrega"]:
+            await (
+                self._supabase_admin.table("documentos_entrega")
+                .update({"data_entrega": data_entrega})
+                .eq("id_documento_entrega", self.id_entrega)
+                .execute()
+            )
+        id_entrega_criada = self.id_entrega
+
+        erros_relacoes: List[Dict[str, Any]] = []
+        await _inserir_em_lote(
+            self._supabase_admin,
+            "revistas_documentos_entrega",
+            [{
+                "id_documento_entrega": id_entrega_criada,
+                "id_revista": aplicada["id_revista"],
+                "qtd_entregue": aplicada["qtd"],
+            } for aplicada in self._aplicadas.values()],
+            lambda linha: {"id_revista": linha["id_revista"], "qtd_entregue": linha["qtd_entregue"]},
+            erros_relacoes,
+        )
+        self.erros.extend(erros_relacoes)
+        return (id_entrega_criada, self._inseridas, len(self._aplicadas) - self._inseridas, self.erros)
+
+    async def desfazer(self):
+        """Desfaz o que os lotes gravaram (a entrega não vai ser cadastrada): revistas criadas, estoque somado e o documento."""
+        self._pendentes = []
+        if not self._liberado.is_set() and self._tarefa is not None:
+            # Nada foi gravado: o lote ainda esperava a verificação de duplicata
+            self._tarefa.cancel()
+            self._tarefa = None
+        try:
+            await self._aguardar_lote_em_andamento()
+        except Exception as e:
+            print(f"[ERRO] Falha em lote gravado durante o fluxo da IA: {e}")
+
+        criadas = [a for a in self._aplicadas.values() if a["criada"]]
+        itens = [{"id_revista": a["id_revista"], "qtd": -a["qtd"]} for a in self._aplicadas.values() if a["qtd"] and not a["criada"]]
+        if criadas:
+            try:
+                await (
+                    self._supabase_admin.table("revistas")
+                    .delete()
+                    .in_("id_revista", [a["id_revista"] for a in criadas])
+                    .execute()
+                )
+                catalogo.invalidar()
+                print(f"[INFO] {len(criadas)} revistas criadas durante a extração em fluxo foram apagadas.")
+            except Exception as e:
+                # Já referenciadas em outro lugar (ex.: uma venda): ficam no catálogo, mas com o estoque desta entrega devolvido
+                print(f"[ERRO] Falha ao apagar as revistas criadas em fluxo; o estoque delas será devolvido. Erro: {e}")
+                itens.extend({"id_revista": a["id_revista"], "qtd": -a["qtd"]} for a in criadas if a["qtd"])
 
-                except Exception as e:
-                    print(f"ERRO: Falha ao ATUALIZAR estoque para '{nome}' (Ed: {numero_edicao_str}). Erro: {e}")
-                    continue
+        try:
+            if itens:
+                resposta = await self._supabase_admin.rpc("incrementar_estoque_revistas", {"itens": itens}).execute()
+                for linha in resposta.data or []:
+                    catalogo.atualizar(linha["id_revista"], qtd_estoque=linha["qtd_estoque"])
+                print(f"[INFO] Estoque de {len(itens)} revistas devolvido após falha na extração em fluxo.")
+        except Exception as e:
+            print(f"[ERRO] Falha ao desfazer o estoque gravado em fluxo ({itens}). Erro: {e}")
+        self._aplicadas = {}
 
-            else:
-                try:
-                    revista_para_inserir = {
-                        "nome": nome,
-                        "numero_edicao": numero_edicao_int,
-                        "qtd_estoque": qtd_nova,
-                        "preco_capa": preco_capa,
-                        "url_revista": revista_data.get("url_revista")
-                    }
-
-                    revista_inserida_resp = supabase_admin.table("revistas").insert(revista_para_inserir).execute()
-
-                    nova_revista = revista_inserida_resp.data[0]
-                    id_revista_processada = nova_revista["id_revista"]
-                    inseridas += 1
-
-                    lookup_revistas[chave_busca] = nova_revista
-
-                except Exception as e:
-                    print(f"ERRO: Falha ao INSERIR nova revista '{nome}' (Ed: {numero_edicao_str}). Erro: {e}")
-                    continue
-
-            if id_revista_processada:
-                try:
-                    supabase_admin.table("revistas_documentos_entrega").insert({
-                        "id_documento_entrega": id_entrega_criada,
-                        "id_revista": id_revista_processada,
-                        "qtd_entregue": qtd_nova,
-                    }).execute()
-                except Exception as e:
-                    print(f"ERRO: Falha ao INSERIR RELAÇÃO para '{nome}' (ID: {id_revista_processada}). Erro: {e}")
+        if self.id_entrega is not None:
+            try:
+                await (
+                    self._supabase_admin.table("documentos_entrega")
+                    .delete()
+                    .eq("id_documento_entrega", self.id_entrega)
+                    .execute()
+                )
+                self.id_entrega = None
+            except Exception as e:
+                print(f"[ERRO] Falha ao apagar o documento de entrega {self.id_entrega} após falha na extração em fluxo. Erro: {e}")
 
-        except (ValueError, TypeError) as e:
-            print(f"Aviso: Ignorando revista com dados inválidos no JSON: {revista_data.get('nome')}. Erro: {e}")
-            continue
 
-    return (inseridas, atualizadas)
+def _chave_job(user: dict, data_iso: str) -> str:
+    return f"entrega:{user['sub']}:{data_iso}"
 
 
-@router.post("/cadastrar-entrega", status_code=status.HTTP_201_CREATED)
-async def cadastrar_chamada(file: UploadFile = File(...), user: dict = Depends(validar_token), supabase_admin: Client = Depends(pegar_usuario_admin)):
-    """
-    Recebe um ARQUIVO PDF, salva-o no storage, interpreta seu conteúdo
-    e insere os dados da entrega e das revistas no banco.
-    """
-    arquivo_bytes = await file.read()
+async def _ler_cabecalho_entrega(arquivo_bytes: bytes) -> Tuple[DocumentoPdf, str, str]:
+    """Lê só as páginas necessárias para achar o cabeçalho. Retorna (documento, data_entrega_iso, pv_id)."""
     if not arquivo_bytes:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O arquivo enviado está vazio.")
 
     try:
-        (data_iso_local, pv_id_local) = extrair_dados_entrada_local(arquivo_bytes)
+        documento = await executar_em_processo(ler_cabecalho_pdf, arquivo_bytes, CAMPOS_ENTRADA)
+        (data_iso_local, pv_id_local) = extrair_dados_entrada_local(documento)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro na pré-verificação do PDF: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao verificar duplicatas: {e}")
+
+    return (documento, data_iso_local, pv_id_local)
 
-        resposta_duplicata = (
+
+async def _verificar_duplicata_entrega(data_iso_local: str, pv_id_local: str, user: dict, supabase_admin: AsyncClient):
+    """Recusa (409) documentos já gravados ou ainda em processamento para a mesma data."""
+    try:
+        resposta_duplicata = await (
             supabase_admin.table("documentos_entrega")
             .select("id_documento_entrega")
             .eq("id_usuario", user["sub"])
@@ -166,16 +456,47 @@ async def cadastrar_chamada(file: UploadFile = File(...), user: dict = Depends(v
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"Documento de entrega duplicado. Já existe um cadastro para o PDV {pv_id_local} na data {data_iso_local}.",
             )
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro na pré-verificação do PDF: {e}")
+        if gerenciador_jobs.ativo_com_chave(_chave_job(user, data_iso_local)):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Documento de entrega duplicado. A entrega do PDV {pv_id_local} na data {data_iso_local} já está sendo processada.",
+            )
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao verificar duplicatas: {e}")
 
 
+async def _pre_verificar_entrega(arquivo_bytes: bytes, user: dict, supabase_admin: AsyncClient) -> Tuple[DocumentoPdf, str]:
+    """
+    Pré-verificação (sempre síncrona, mesmo no envio por job): lê o cabeçalho do PDF e recusa documentos
+    duplicados, já gravados ou ainda em processamento. Retorna (documento, data_entrega_iso).
+    """
+    (documento, data_iso_local, pv_id_local) = await _ler_cabecalho_entrega(arquivo_bytes)
+    await _verificar_duplicata_entrega(data_iso_local, pv_id_local, user, supabase_admin)
+    return (documento, data_iso_local)
+
+
+async def _interpretar_entrega(
+    documento: DocumentoPdf,
+    arquivo_bytes: bytes,
+    job: Optional[Job] = None,
+    gravador: Optional[_GravadorEntregaFluxo] = None,
+    extracao: Optional[Awaitable[Dict[str, Any]]] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Extrai e valida os dados do PDF já pré-verificado. Retorna (entrega_json, data_entrega_iso).
+    Com 'gravador', as revistas lidas em fluxo da IA já vão sendo gravadas durante a extração.
+    'extracao' é a extração já iniciada (especulativa); sem ela, a extração começa aqui.
+    """
     try:
-        entrega_json = await processar_pdf_para_json(arquivo_bytes)
+        registrar_etapa(job, "Extraindo dados do PDF", 0.1)
+        if extracao is None:
+            # Não é duplicata: lê o restante das páginas (ou usa o cache de extração) e interpreta
+            extracao = processar_pdf_para_json(documento, arquivo_bytes, gravador.adicionar if gravador else None)
+        entrega_json = await extracao
+    except LLMIndisponivel as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro ao processar PDF (IA): {str(e)}")
 
@@ -205,47 +526,301 @@ async def cadastrar_chamada(file: UploadFile = File(...), user: dict = Depends(v
 
         data_iso_gemini = datetime.strptime(data_gemini, "%Y-%m-%d").date().isoformat()
 
-
-        dados_entrega = {
-            "id_usuario": user["sub"],
-            "data_entrega": data_iso_gemini,
-        }
-
-        resposta_insert = supabase_admin.table("documentos_entrega").insert(dados_entrega).execute()
-        entrega_criada = resposta_insert.data[0]
-        id_entrega_criada = entrega_criada["id_documento_entrega"]
-
     except KeyError as e:
         detail = f"Chave ausente no JSON (IA): {e}"
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
     except ValueError as e:
         detail = f"Valor inválido no JSON (IA): {e}"
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
-    except HTTPException as e:
-        raise e
     except Exception as e:
-        detail = f"Erro ao inserir documento de entrega no banco: {e}"
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
+        detail = f"Erro ao interpretar os dados da entrega (IA): {e}"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
 
+    return (entrega_json, data_iso_gemini)
 
-    revistas_inseridas, revistas_atualizadas = _cadastrar_revistas_db(entrega_json, supabase_admin, id_entrega_criada)
+
+async def _processar_entrega(
+    documento: DocumentoPdf,
+    arquivo_bytes: bytes,
+    user: dict,
+    supabase_admin: AsyncClient,
+    job: Optional[Job] = None,
+    verificacao: Optional[Awaitable[None]] = None,
+) -> Dict[str, Any]:
+    """
+    Extrai os dados do PDF e grava a entrega e as revistas. Retorna o corpo da resposta.
+    Sem 'verificacao', o PDF já passou pela verificação de duplicata. Com ela (e EXTRACAO_ESPECULATIVA),
+    a extração começa junto com a verificação e é cancelada se o documento for duplicado.
+    """
+    especular = verificacao is not None and st.EXTRACAO_ESPECULATIVA
+    gravador = None
+    if st.LLM_STREAMING:
+        # O documento nasce com a data do cabeçalho lido na pré-verificação (a mesma da checagem de duplicata)
+        (data_iso_local, _) = extrair_dados_entrada_local(documento)
+        gravador = _GravadorEntregaFluxo(supabase_admin, {"id_usuario": user["sub"], "data_entrega": data_iso_local}, liberado=not especular)
+    try:
+        extracao = None
+        if especular:
+            extracao = await extrair_durante_verificacao(
+                verificacao, processar_pdf_para_json(documento, arquivo_bytes, gravador.adicionar if gravador else None)
+            )
+            if gravador is not None:
+                gravador.liberar()
+        elif verificacao is not None:
+            await verificacao
+        (entrega_json, data_iso_gemini) = await _interpretar_entrega(documento, arquivo_bytes, job, gravador, extracao)
+    except BaseException:
+        if gravador is not None:
+            await asyncio.shield(gravador.desfazer())
+        raise
+
+    registrar_etapa(job, "Gravando a entrega", 0.7)
+    if gravador is not None and gravador.recebidas:
+        # Resposta lida em fluxo: o documento e boa parte do estoque já foram gravados enquanto a IA gerava
+        try:
+            (id_entrega_criada, revistas_inseridas, revistas_atualizadas, erros) = await gravador.concluir(data_iso_gemini)
+            # Linhas descartadas durante o fluxo não chegaram ao gravador: entram em 'erros' como no caminho sem fluxo
+            erros.extend(_erros_da_extracao(entrega_json))
+        except Exception as e:
+            await gravador.desfazer()
+            detail = f"Erro ao inserir documento de entrega no banco: {e}"
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
+    else:
+        try:
+            dados_entrega = {
+                "id_usuario": user["sub"],
+                "data_entrega": data_iso_gemini,
+            }
+
+            resposta_insert = await supabase_admin.table("documentos_entrega").insert(dados_entrega).execute()
+            entrega_criada = resposta_insert.data[0]
+            id_entrega_criada = entrega_criada["id_documento_entrega"]
+
+        except Exception as e:
+            detail = f"Erro ao inserir documento de entrega no banco: {e}"
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
+
+        registrar_etapa(job, "Atualizando o estoque das revistas", 0.8)
+        revistas_inseridas, revistas_atualizadas, erros = await _cadastrar_revistas_db(entrega_json, supabase_admin, id_entrega_criada)
 
     return {
         "data": {
             "id_entrega": id_entrega_criada,
             "qtd_novas_revistas_criadas": revistas_inseridas,
             "qtd_revistas_com_estoque_atualizado": revistas_atualizadas,
+            "erros": erros,
         },
         "message": "Entrega criada e estoque de revistas atualizado com sucesso."
     }
 
+
+@router.post("/cadastrar-entrega", status_code=status.HTTP_201_CREATED)
+async def cadastrar_chamada(file: UploadFile = File(...), user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
+    """
+    Recebe um ARQUIVO PDF, salva-o no storage, interpreta seu conteúdo
+    e insere os dados da entrega e das revistas no banco.
+    """
+    arquivo_bytes = await file.read()
+    (documento, data_iso_local, pv_id_local) = await _ler_cabecalho_entrega(arquivo_bytes)
+    verificacao = _verificar_duplicata_entrega(data_iso_local, pv_id_local, user, supabase_admin)
+    return await _processar_entrega(documento, arquivo_bytes, user, supabase_admin, verificacao=verificacao)
+
+
+@router.post("/enfileirar-entrega", status_code=status.HTTP_202_ACCEPTED)
+async def enfileirar_entrega(file: UploadFile = File(...), user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
+    """
+    Igual a /cadastrar-entrega, mas responde logo após a pré-verificação (duplicatas, cabeçalho).
+    A extração e a gravação seguem em segundo plano; acompanhe por GET /jobs/{id_job}.
+    """
+    arquivo_bytes = await file.read()
+    (documento, data_iso_local) = await _pre_verificar_entrega(arquivo_bytes, user, supabase_admin)
+
+    job = gerenciador_jobs.enfileirar(
+        "entrega",
+        user["sub"],
+        lambda job: _processar_entrega(documento, arquivo_bytes, user, supabase_admin, job),
+        chave=_chave_job(user, data_iso_local),
+    )
+    return {
+        "data": {"id_job": job.id_job, "status": job.situacao, "url_status": f"/jobs/{job.id_job}"},
+        "message": "Entrega recebida. O processamento continua em segundo plano.",
+    }
+
+@router.post("/cadastrar-entregas-lote")
+async def cadastrar_entregas_lote(files: List[UploadFile] = File(...), user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
+    """
+    Recebe VÁRIOS PDFs de notas de entrega (ex.: o fechamento do mês) e cadastra todos de uma vez.
+    1. Arquivos com o mesmo conteúdo (SHA-256) ou a mesma entrega no cabeçalho (data) entram uma vez só.
+    2. Os cabeçalhos são lidos em paralelo e as duplicatas já cadastradas saem em uma única consulta.
+    3. A extração (parser local / IA) roda em paralelo, até ENTREGAS_LOTE_MAX_SIMULTANEOS arquivos.
+    4. Os documentos, as revistas e as relações de todas as entregas são gravados juntos (mesmas chamadas ao banco de uma entrega só).
+    Um arquivo recusado não impede os demais: o resultado vem por arquivo, na ordem do envio.
+    """
+    if len(files) > st.ENTREGAS_LOTE_MAX_ARQUIVOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Envie no máximo {st.ENTREGAS_LOTE_MAX_ARQUIVOS} arquivos por lote.",
+        )
+
+    relatorio: List[Dict[str, Any]] = [{"arquivo": f.filename, "status": None, "detalhe": None} for f in files]
+    conteudos = [await f.read() for f in files]
+
+    def recusar(indice: int, situacao: str, detalhe: str):
+        relatorio[indice].update(status=situacao, detalhe=detalhe)
+
+    # 1. Mesmo conteúdo enviado mais de uma vez
+    candidatos: List[int] = []
+    por_hash: Dict[str, int] = {}
+    for indice, conteudo in enumerate(conteudos):
+        if not conteudo:
+            recusar(indice, "erro", "O arquivo enviado está vazio.")
+            continue
+        resumo = hashlib.sha256(conteudo).hexdigest()
+        if resumo in por_hash:
+            recusar(indice, "duplicado", f"Mesmo conteúdo do arquivo '{files[por_hash[resumo]].filename}'.")
+        else:
+            por_hash[resumo] = indice
+            candidatos.append(indice)
+
+    # 2. Cabeçalhos em paralelo (pool de processos) e uma única consulta de duplicatas no banco
+    async def ler_cabecalho(indice: int):
+        # Mesmo tratamento do envio de um arquivo só (400/500); qualquer falha fica restrita ao arquivo
+        try:
+            return await _ler_cabecalho_entrega(conteudos[indice])
+        except HTTPException as e:
+            return e
+        except Exception as e:
+            return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao verificar duplicatas: {e}")
+
+    documentos: Dict[int, DocumentoPdf] = {}
+    por_data: Dict[str, int] = {}
+    for indice, leitura in zip(candidatos, await asyncio.gather(*(ler_cabecalho(i) for i in candidatos))):
+        if isinstance(leitura, HTTPException):
+            recusar(indice, "erro", leitura.detail)
+            continue
+        (documento, data_iso_local, pv_id_local) = leitura
+        if data_iso_local in por_data:
+            recusar(indice, "duplicado", f"Mesma entrega (PDV {pv_id_local}, data {data_iso_local}) do arquivo '{files[por_data[data_iso_local]].filename}'.")
+        elif gerenciador_jobs.ativo_com_chave(_chave_job(user, data_iso_local)):
+            recusar(indice, "duplicado", f"A entrega do PDV {pv_id_local} na data {data_iso_local} já está sendo processada.")
+        else:
+            por_data[data_iso_local] = indice
+            documentos[indice] = documento
+
+    if por_data:
+        try:
+            resposta_duplicata = await (
+                supabase_admin.table("documentos_entrega")
+                .select("data_entrega")
+                .eq("id_usuario", user["sub"])
+                .in_("data_entrega", list(por_data))
+                .execute()
+            )
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao verificar duplicatas: {e}")
+        for linha in resposta_duplicata.data or []:
+            indice = por_data.pop(linha["data_entrega"], None)
+            if indice is not None:
+                documentos.pop(indice)
+                recusar(indice, "duplicado", f"Já existe um cadastro para a data {linha['data_entrega']}.")
+
+    # 3. Extração em paralelo, com limite
+    vagas = asyncio.Semaphore(st.ENTREGAS_LOTE_MAX_SIMULTANEOS)
+
+    async def interpretar(indice: int):
+        async with vagas:
+            try:
+                return await _interpretar_entrega(documentos[indice], conteudos[indice])
+            except HTTPException as e:
+                return e
+
+    indices = list(documentos)
+    validas: List[Tuple[int, Dict[str, Any], str]] = []
+    datas_validas: Dict[str, int] = {}
+    for indice, interpretada in zip(indices, await asyncio.gather(*(interpretar(i) for i in indices))):
+        if isinstance(interpretada, HTTPException):
+            recusar(indice, "erro", interpretada.detail)
+            continue
+        (entrega_json, data_iso) = interpretada
+        if data_iso in datas_validas:
+            recusar(indice, "duplicado", f"Mesma data de entrega ({data_iso}) do arquivo '{files[datas_validas[data_iso]].filename}'.")
+            continue
+        datas_validas[data_iso] = indice
+        validas.append((indice, entrega_json, data_iso))
+
+    # 4. Gravação conjunta: um INSERT dos documentos e, para as revistas, as mesmas chamadas de uma entrega só
+    if validas:
+        try:
+            resposta_insert = await supabase_admin.table("documentos_entrega").insert(
+                [{"id_usuario": user["sub"], "data_entrega": data_iso} for (_, _, data_iso) in validas]
+            ).execute()
+            # As linhas voltam na ordem do INSERT: o id de cada entrega sai da posição, não do formato da data devolvida
+            ids_documentos = [linha["id_documento_entrega"] for linha in resposta_insert.data or []]
+            if len(ids_documentos) != len(validas):
+                raise ValueError(f"o banco devolveu {len(ids_documentos)} documento(s) para {len(validas)} inserido(s)")
+        except Exception as e:
+            print(f"ERRO: Falha ao inserir os documentos de entrega do lote. Erro: {e}")
+            for (indice, _, _) in validas:
+                recusar(indice, "erro", f"Erro ao inserir documento de entrega no banco: {e}")
+            (validas, ids_documentos) = ([], [])
+
+        entregas = []
+        for (indice, entrega_json, _), id_entrega in zip(validas, ids_documentos):
+            erros: List[Dict[str, Any]] = []
+            entregas.append({
+                "indice": indice,
+                "id_entrega": id_entrega,
+                "itens": _agrupar_itens_entrega(entrega_json, erros),
+                "erros": erros,
+            })
+        try:
+            await _gravar_revistas_entregas(supabase_admin, entregas)
+        except Exception as e:
+            # Mesma compensação de _GravadorEntregaFluxo.desfazer: os documentos já inseridos não podem ficar
+            # sem revistas (bloqueariam o reenvio como duplicata)
+            detalhe = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"[ERRO] Falha ao gravar as revistas do lote; apagando {len(entregas)} documento(s) de entrega. Erro: {detalhe}")
+            ids_criados = [entrega["id_entrega"] for entrega in entregas]
+            try:
+                await (
+                    supabase_admin.table("documentos_entrega")
+                    .delete()
+                    .in_("id_documento_entrega", ids_criados)
+                    .execute()
+                )
+            except Exception as erro_exclusao:
+                print(f"[ERRO] Falha ao apagar os documentos de entrega {ids_criados} do lote. Erro: {erro_exclusao}")
+            for entrega in entregas:
+                recusar(entrega["indice"], "erro", f"Erro ao atualizar o estoque das revistas: {detalhe}")
+            entregas = []
+
+        for entrega in entregas:
+            relatorio[entrega["indice"]].update(
+                status="cadastrada",
+                id_entrega=entrega["id_entrega"],
+                qtd_novas_revistas_criadas=entrega["inseridas"],
+                qtd_revistas_com_estoque_atualizado=entrega["atualizadas"],
+                erros=entrega["erros"],
+            )
+
+    cadastradas = sum(1 for item in relatorio if item["status"] == "cadastrada")
+    return {
+        "data": {
+            "arquivos": relatorio,
+            "qtd_entregas_cadastradas": cadastradas,
+            "qtd_arquivos_recusados": len(files) - cadastradas,
+        },
+        "message": f"Lote processado: {cadastradas} de {len(files)} entregas cadastradas.",
+    }
+
+
 @router.get("/listar-entradas-usuario")
-async def listar_entradas_por_usuario(user: dict = Depends(validar_token), supabase_admin: Client = Depends(pegar_usuario_admin)):
+async def listar_entradas_por_usuario(user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Lista todas as entradas associadas ao usuário autenticado.
     """
     try:
-        resposta = (
+        resposta = await (
             supabase_admin.table("documentos_entrega")
             .select("*")
             .eq("id_usuario", user["sub"])
@@ -262,13 +837,13 @@ async def listar_entradas_por_usuario(user: dict = Depends(validar_token), supab
         )
 
 @router.get("/{id_entrega}")
-async def get_entrega_por_id(id_entrega: int = Path(..., title="ID do Documento de Entrega", ge=1), user: dict = Depends(validar_token), supabase_admin: Client = Depends(pegar_usuario_admin)):
+async def get_entrega_por_id(id_entrega: int = Path(..., title="ID do Documento de Entrega", ge=1), user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Retorna os dados de um documento de entrega pelo ID,
     incluindo as revistas associadas (join).
     """
     try:
-        resposta = (
+        resposta = await (
             supabase_admin.table("documentos_entrega")
             .select("*, revistas_documentos_entrega(*, revistas(nome, numero_edicao, url_revista, codigo_barras))")
             .eq("id_documento_entrega", id_entrega)
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Path
+
+from services.auth import validar_token
+from services.jobs import gerenciador_jobs
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"]
+)
+
+@router.get("/{id_job}")
+async def consultar_job(id_job: str = Path(..., title="ID do job retornado no envio do PDF"), user: dict = Depends(validar_token)):
+    """
+    Situação de um envio feito por /entregas/enfileirar-entrega ou /devolucoes/enfileirar-devolucao:
+    status (na_fila, processando, concluido, erro), etapa atual, progresso (0 a 1) e, ao terminar,
+    o mesmo corpo que a rota síncrona retornaria (resultado) ou o erro com o status HTTP correspondente.
+    """
+    job = gerenciador_jobs.obter(id_job, user["sub"])
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {id_job} não encontrado (já expirou ou não pertence a este usuário).",
+        )
+
+    return {
+        "data": job.como_dict(),
+        "message": f"Job {job.situacao}: {job.etapa}.",
+    }
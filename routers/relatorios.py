@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from supabase import Client
+from supabase import AsyncClient
 from datetime import date, timedelta
 
 from services.auth import validar_token, pegar_usuario_admin
@@ -10,17 +10,15 @@ router = APIRouter(
 )
 
 @router.get("/vendas/dashboard-geral")
-def pegar_dashboard_geral(user = Depends(validar_token)):
+async def pegar_dashboard_geral(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Endpoint consolidado para os relatórios da tela principal.
     Estrutura: {hoje:{...}, semana:[...], ticket_medio:valor, mais_vendidos:{...}}
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-
-        vendas_hoje_data = supabase_admin.table("vw_vendas_hoje").select("*").execute().data
-        vendas_semana_data = supabase_admin.table("mv_performance_semanal").select("*").execute().data
-        ranking_data = supabase_admin.table("vw_vendas_recentes").select("*").execute().data
+        vendas_hoje_data = (await supabase_admin.table("vw_vendas_hoje").select("*").execute()).data
+        vendas_semana_data = (await supabase_admin.table("mv_performance_semanal").select("*").execute()).data
+        ranking_data = (await supabase_admin.table("vw_vendas_recentes").select("*").execute()).data
 
         total_faturado_hoje = 0
         total_vendas_hoje = 0
@@ -78,14 +76,12 @@ def pegar_dashboard_geral(user = Depends(validar_token)):
 
 
 @router.get("/vendas/hoje")
-def pegar_hoje(user = Depends(validar_token)):
+async def pegar_hoje(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Relatório de vendas de hoje (vw_vendas_hoje)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-
-        vendas_hoje_data = supabase_admin.table("vw_vendas_hoje").select("*").execute().data
+        vendas_hoje_data = (await supabase_admin.table("vw_vendas_hoje").select("*").execute()).data
 
         faturamento_do_dia = 0
         if vendas_hoje_data:
@@ -108,14 +104,12 @@ def pegar_hoje(user = Depends(validar_token)):
         )
 
 @router.get("/kpi/faturamento-hoje")
-def pegar_faturamento_hoje(user = Depends(validar_token)):
+async def pegar_faturamento_hoje(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     KPI: Faturamento do dia atual (vw_kpi_faturamento_hoje)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_kpi_faturamento_hoje").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_kpi_faturamento_hoje").select("*").execute()).data
         
         faturamento = 0
         if resultado and len(resultado) > 0:
@@ -135,14 +129,12 @@ def pegar_faturamento_hoje(user = Depends(validar_token)):
 
 
 @router.get("/kpi/unidades-hoje")
-def pegar_unidades_hoje(user = Depends(validar_token)):
+async def pegar_unidades_hoje(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     KPI: Unidades vendidas no dia atual (vw_kpi_unidades_hoje)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_kpi_unidades_hoje").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_kpi_unidades_hoje").select("*").execute()).data
         
         unidades = 0
         if resultado and len(resultado) > 0:
@@ -162,14 +154,12 @@ def pegar_unidades_hoje(user = Depends(validar_token)):
 
 
 @router.get("/kpi/devolucoes-pendentes")
-def pegar_devolucoes_pendentes(user = Depends(validar_token)):
+async def pegar_devolucoes_pendentes(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     KPI: Quantidade de devoluções pendentes (vw_kpi_devolucoes_pendentes)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_kpi_devolucoes_pendentes").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_kpi_devolucoes_pendentes").select("*").execute()).data
         
         devolucoes = 0
         if resultado and len(resultado) > 0:
@@ -189,14 +179,12 @@ def pegar_devolucoes_pendentes(user = Depends(validar_token)):
 
 
 @router.get("/kpi/proxima-devolucao")
-def pegar_proxima_devolucao(user = Depends(validar_token)):
+async def pegar_proxima_devolucao(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     KPI: Próxima data limite de devolução (vw_kpi_proxima_devolucao)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_kpi_proxima_devolucao").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_kpi_proxima_devolucao").select("*").execute()).data
         
         proxima_data = None
         if resultado and len(resultado) > 0:
@@ -216,14 +204,12 @@ def pegar_proxima_devolucao(user = Depends(validar_token)):
 
 
 @router.get("/kpi/faturamento-30d")
-def pegar_faturamento_30d(user = Depends(validar_token)):
+async def pegar_faturamento_30d(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     KPI: Faturamento dos últimos 30 dias (vw_kpi_faturamento_30d)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_kpi_faturamento_30d").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_kpi_faturamento_30d").select("*").execute()).data
         
         faturamento = 0
         if resultado and len(resultado) > 0:
@@ -243,14 +229,12 @@ def pegar_faturamento_30d(user = Depends(validar_token)):
 
 
 @router.get("/kpi/ticket-medio-30d")
-def pegar_ticket_medio_30d(user = Depends(validar_token)):
+async def pegar_ticket_medio_30d(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     KPI: Ticket médio dos últimos 30 dias (vw_kpi_ticket_medio_30d)
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_kpi_ticket_medio_30d").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_kpi_ticket_medio_30d").select("*").execute()).data
         
         ticket_medio = 0
         if resultado and len(resultado) > 0:
@@ -272,15 +256,13 @@ def pegar_ticket_medio_30d(user = Depends(validar_token)):
 # ==================== ENDPOINTS PARA GRÁFICOS ====================
 
 @router.get("/grafico/top5-revistas-hoje")
-def pegar_top5_revistas_hoje(user = Depends(validar_token)):
+async def pegar_top5_revistas_hoje(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Gráfico: Top 5 revistas mais vendidas hoje (vw_chart_top5_vendidas_hoje)
     Recomendado: Gráfico de Barras Horizontais
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_chart_top5_vendidas_hoje").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_chart_top5_vendidas_hoje").select("*").execute()).data
         
         return {
             "data": resultado if resultado else [],
@@ -293,15 +275,13 @@ def pegar_top5_revistas_hoje(user = Depends(validar_token)):
         )
 
 @router.get("/grafico/top5-revistas-7d")
-def pegar_top5_revistas_hoje(user = Depends(validar_token)):
+async def pegar_top5_revistas_hoje(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Gráfico: Top 5 revistas mais vendidas nos últimos 7 dias (vw_chart_top5_vendidas_7d)
     Recomendado: Gráfico de Barras Horizontais
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_chart_top5_vendidas_7d").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_chart_top5_vendidas_7d").select("*").execute()).data
         
         return {
             "data": resultado if resultado else [],
@@ -314,15 +294,13 @@ def pegar_top5_revistas_hoje(user = Depends(validar_token)):
         )
 
 @router.get("/grafico/vendas-por-pagamento-30d")
-def pegar_vendas_por_pagamento_30d(user = Depends(validar_token)):
+async def pegar_vendas_por_pagamento_30d(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Gráfico: Vendas por método de pagamento (últimos 30 dias) (vw_chart_vendas_por_pagamento_30d)
     Recomendado: Gráfico de Pizza/Rosca
     """
     try:
-        supabase_admin = pegar_usuario_admin()
-        
-        resultado = supabase_admin.table("vw_chart_vendas_por_pagamento_30d").select("*").execute().data
+        resultado = (await supabase_admin.table("vw_chart_vendas_por_pagamento_30d").select("*").execute()).data
         
         return {
             "data": resultado if resultado else [],
@@ -341,11 +319,10 @@ def pegar_vendas_por_pagamento_30d(user = Depends(validar_token)):
 
 
 #@router.get("/vendas/semana")
-def pegar_relatorio_semana(user = Depends(validar_token)):
+async def pegar_relatorio_semana(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """ Relatório semanal de vendas (mv_performance_semanal). """
     try:
-        supabase_admin = pegar_usuario_admin()
-        vendas_semana = supabase_admin.table("mv_performance_semanal").select("*").execute()
+        vendas_semana = await supabase_admin.table("mv_performance_semanal").select("*").execute()
         return {
             "data": vendas_semana.data,
             "message": "Relatório semanal de vendas gerado com sucesso."
@@ -364,7 +341,7 @@ async def listar_alertas_devolucoes(
         True, description="Se True, inclui itens já vencidos."
     ),
     user: dict = Depends(validar_token),
-    supabase_admin: Client = Depends(pegar_usuario_admin),
+    supabase_admin: AsyncClient = Depends(pegar_usuario_admin),
 ):
     """
     Lista devoluções 'abertas' do usuário que vencem em N dias ou já venceram.
@@ -389,7 +366,7 @@ async def listar_alertas_devolucoes(
             q = q.gte("data_limite", today_str).lte("data_limite", limit_str)
 
         q = q.order("data_limite", desc=False)
-        resp = q.execute()
+        resp = await q.execute()
         rows = resp.data or []
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao consultar Supabase: {e!s}")
@@ -416,11 +393,10 @@ async def listar_alertas_devolucoes(
     return saida
 
 #@router.get("/vendas/recentes")
-def pegar_relatorio_dia(user = Depends(validar_token)):
+async def pegar_relatorio_dia(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """ Relatório de vendas recentes (vw_vendas_recentes). """
     try:
-        supabase_admin = pegar_usuario_admin()
-        recentes = supabase_admin.table("vw_vendas_recentes").select("*").execute()
+        recentes = await supabase_admin.table("vw_vendas_recentes").select("*").execute()
         return {
             "data": recentes.data,
             "message": "Relatório de vendas recentes gerado com sucesso."
@@ -1,12 +1,12 @@
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Depends
-from supabase import Client, create_client
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Depends, Query
+from supabase import AsyncClient
 
 from models.revista_model import RevistaResposta, CadastrarCodigoRevista
 
 from settings.settings import importar_configs
-from services.auth import validar_token
-
-from rapidfuzz import fuzz
+from services.auth import validar_token, pegar_usuario_admin
+from services.catalogo import catalogo, SnapshotCatalogo
+from services.busca_revistas import buscar_revistas_por_nome, autocompletar_revistas
 
 router = APIRouter(
     prefix="/revistas",
@@ -14,111 +14,148 @@ router = APIRouter(
 )
 
 st = importar_configs()
-supabase: Client = create_client(st.SUPABASE_URL, st.SUPABASE_API_KEY)
 
-def pegar_revistas():
+async def pegar_revistas() -> SnapshotCatalogo:
+    """Retorna o catálogo de revistas a partir do cache em memória (recarregado do banco quando o TTL vence)."""
     try:
-        dados = supabase.table("revistas").select("id_revista, nome, apelido_revista, numero_edicao, codigo_barras, qtd_estoque, preco_capa, preco_liquido, url_revista").execute()
-        return dados
+        return await catalogo.snapshot()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao acessar o banco de dados: {str(e)}")
 
 @router.get("/tudo")
-def pegar_tudo(user = Depends(validar_token)):
+async def pegar_tudo(user = Depends(validar_token)):
     return {
-        "data": pegar_revistas().data,
+        "data": (await pegar_revistas()).data,
         "message": "Revistas listadas com sucesso."
     }
 
 @router.get("/buscar/nome")
-def obter_revistas_por_nome_ou_apelido(q: str, user: dict = Depends(validar_token)):
+async def obter_revistas_por_nome_ou_apelido(
+    q: str,
+    limite: int = Query(20, ge=1, le=100, description="Quantidade máxima de revistas por página"),
+    pagina: int = Query(1, ge=1),
+    corte: float = Query(70, ge=0, le=100, description="Score mínimo (0-100) para considerar a revista"),
+    user: dict = Depends(validar_token)
+):
     """
     Endpoint para obter a(s) revista(s) buscada(s) pelo seu nome ou apelido, utilizando fuzzy search para definir a proximidade do parâmetro de busca com o nome no banco de dados.
+    Os resultados vêm ordenados do maior para o menor score e paginados.
     """
 
-    dados = pegar_revistas()
-
-    if not dados.data:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Nenhuma revista encontrada no banco de dados.")
-
-    revistas = []
-    for item in dados.data:
-        scores = [
-            fuzz.token_sort_ratio(str(q).lower().strip(), str(item["nome"]).lower().strip()),
-            fuzz.token_sort_ratio(str(q).lower().strip(), str(item.get("apelido_revista") or "").lower().strip())
-        ]
-        max_score = max(scores)
-
-        if max_score >= 70:
-            revista = RevistaResposta(
-                id_revista=item["id_revista"],
-                nome=item["nome"],
-                apelido_revista=item.get("apelido_revista", ""),
-                numero_edicao=item["numero_edicao"],
-                codigo_barras=item["codigo_barras"],
-                qtd_estoque=item["qtd_estoque"],
-                preco_capa=item["preco_capa"],
-                preco_liquido=item["preco_liquido"],
-                url_revista=item["url_revista"],
-                score=max_score
-            )
-            revistas.append(revista)
+    try:
+        encontradas, total = await buscar_revistas_por_nome(q, corte=corte, limite=limite, pagina=pagina)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao acessar o banco de dados: {str(e)}")
 
-    if not revistas:
+    if total == 0:
         raise HTTPException(status_code=404, detail="Nenhuma revista encontrada com o nome fornecido.")
 
+    revistas = [
+        RevistaResposta(
+            id_revista=item["id_revista"],
+            nome=item["nome"],
+            apelido_revista=item.get("apelido_revista", ""),
+            numero_edicao=item["numero_edicao"],
+            codigo_barras=item["codigo_barras"],
+            qtd_estoque=item["qtd_estoque"],
+            preco_capa=item["preco_capa"],
+            preco_liquido=item["preco_liquido"],
+            url_revista=item["url_revista"],
+            score=item["score"]
+        )
+        for item in encontradas
+    ]
+
     return {
         "data": revistas,
+        "total": total,
         "message": "Revistas encontradas com sucesso."
     }
 
+@router.get("/autocompletar")
+async def autocompletar(
+    q: str,
+    limite: int = Query(10, ge=1, le=50),
+    user: dict = Depends(validar_token)
+):
+    """
+    Endpoint de sugestões para a caixa de busca do PDV (a cada letra digitada).
+    Usa um índice de prefixos sobre nome e apelido, sem percorrer a tabela inteira.
+    """
+
+    try:
+        encontradas = await autocompletar_revistas(q, limite=limite)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao acessar o banco de dados: {str(e)}")
+
+    revistas = [
+        RevistaResposta(
+            id_revista=item["id_revista"],
+            nome=item["nome"],
+            apelido_revista=item.get("apelido_revista", ""),
+            numero_edicao=item["numero_edicao"],
+            codigo_barras=item["codigo_barras"],
+            qtd_estoque=item["qtd_estoque"],
+            preco_capa=item["preco_capa"],
+            preco_liquido=item["preco_liquido"],
+            url_revista=item["url_revista"]
+        )
+        for item in encontradas
+    ]
+
+    return {
+        "data": revistas,
+        "message": "Sugestões listadas com sucesso."
+    }
+
 @router.get("/buscar/codigo-barras")
-def obter_revista_por_codigo_barras(q: str, user: dict = Depends(validar_token)):
+async def obter_revista_por_codigo_barras(q: str, user: dict = Depends(validar_token)):
     """
     Endpoint para obter a revista buscada pelo seu código de barras.
     """
 
-    dados = pegar_revistas()
-
-    if not dados.data:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Nenhuma revista encontrada no banco de dados.")
-
-    for item in dados.data:
-        if str(item["codigo_barras"]).strip() == str(q).strip():
-            revista = RevistaResposta(
-                id_revista=item["id_revista"],
-                nome=item["nome"],
-                apelido_revista=item.get("apelido_revista", ""),
-                numero_edicao=item["numero_edicao"],
-                codigo_barras=item["codigo_barras"],
-                qtd_estoque=item["qtd_estoque"],
-                preco_capa=item["preco_capa"],
-                preco_liquido=item["preco_liquido"],
-                url_revista=item["url_revista"]
-            )
-            return {
-                "data": revista,
-                "message": "Revista encontrada com sucesso."
-            }
+    try:
+        item = await catalogo.buscar_por_codigo_barras(q)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao acessar o banco de dados: {str(e)}")
+
+    if item:
+        revista = RevistaResposta(
+            id_revista=item["id_revista"],
+            nome=item["nome"],
+            apelido_revista=item.get("apelido_revista", ""),
+            numero_edicao=item["numero_edicao"],
+            codigo_barras=item["codigo_barras"],
+            qtd_estoque=item["qtd_estoque"],
+            preco_capa=item["preco_capa"],
+            preco_liquido=item["preco_liquido"],
+            url_revista=item["url_revista"]
+        )
+        return {
+            "data": revista,
+            "message": "Revista encontrada com sucesso."
+        }
 
     raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Nenhuma revista encontrada com o código de barras fornecido.")
 
 @router.post("/cadastrar-foto")
-async def upload_image(codigo: str, imagem: UploadFile = File(...), user: dict = Depends(validar_token)):
+async def upload_image(codigo: str, imagem: UploadFile = File(...), user: dict = Depends(validar_token), supabase: AsyncClient = Depends(pegar_usuario_admin)):
     extensao = imagem.filename.split('.')[-1] if '.' in imagem.filename else 'jpg'
     caminho = f"img_{codigo}.{extensao}"
     file_bytes = await imagem.read()
 
     try:
-        supabase.storage.from_(st.BUCKET_REVISTAS).upload(
+        await supabase.storage.from_(st.BUCKET_REVISTAS).upload(
             path=caminho,
             file=file_bytes,
             file_options={"content-type": imagem.content_type or "image/jpeg"})
-        url = supabase.storage.from_(st.BUCKET_REVISTAS).get_public_url(caminho)
+        url = await supabase.storage.from_(st.BUCKET_REVISTAS).get_public_url(caminho)
 
-        response = supabase.table("revistas").update({
+        response = await supabase.table("revistas").update({
             'url_revista': url
         }).eq('id_revista', codigo).execute()
+        for revista_atualizada in response.data:
+            catalogo.registrar(revista_atualizada)
 
         return {
             "data": {
@@ -132,12 +169,12 @@ async def upload_image(codigo: str, imagem: UploadFile = File(...), user: dict =
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao salvar o arquivo: {e}")
 
 @router.post("/cadastrar-codigo")
-def cadastrar_codigo_barras(revista: CadastrarCodigoRevista, user: dict = Depends(validar_token)):
+async def cadastrar_codigo_barras(revista: CadastrarCodigoRevista, user: dict = Depends(validar_token), supabase: AsyncClient = Depends(pegar_usuario_admin)):
     try:
         if (len(revista.codigo_barras) != 13 or not revista.codigo_barras.isdigit()):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"O código de barras fornecido não tem 13 dígitos ou não é composto apenas por números: {revista.codigo_barras}")
 
-        dados = pegar_revistas()
+        dados = await pegar_revistas()
 
         if not dados.data:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Nenhuma revista encontrada no banco de dados.")
@@ -146,9 +183,11 @@ def cadastrar_codigo_barras(revista: CadastrarCodigoRevista, user: dict = Depend
         for item in dados.data:
             if (item["nome"] == revista.nome and item["numero_edicao"] == revista.numero_edicao):
                 if (not item["codigo_barras"] or len(item["codigo_barras"]) != 13):
-                    response = supabase.table("revistas").update({
+                    response = await supabase.table("revistas").update({
                         'codigo_barras': revista.codigo_barras
                     }).eq('id_revista', item["id_revista"]).execute()
+                    for revista_atualizada in response.data:
+                        catalogo.registrar(revista_atualizada)
 
                     break
                 else:
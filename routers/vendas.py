@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import JSONResponse
-from supabase import Client, create_client
+from supabase import AsyncClient
 
-from models.venda_model import VendaFormularioCodBarras, VendaFormularioId
+from models.venda_model import VendaFormularioCodBarras, VendaFormularioId, CarrinhoFormulario
 
 from settings.settings import importar_configs
 from services.auth import validar_token, pegar_usuario_admin
+from services.catalogo import catalogo
 
 
 # Configurações iniciais
@@ -15,66 +16,73 @@ router = APIRouter(
 )
 
 st = importar_configs()
-supabase: Client = create_client(st.SUPABASE_URL, st.SUPABASE_API_KEY)
 
-def _atualizar_contagem_devolucao(supabase_admin: Client, id_revista_vendida: str, qtd_vendida: int, id_usuario: str):
+async def _registrar_venda(supabase_admin: AsyncClient, dados_venda: dict) -> dict:
     """
-    Atualiza a contagem de devolução na tabela 'revistas_chamadasdevolucao'
-    decrementando 'qtd_a_devolver' com base na venda realizada.
+    Registra a venda com uma única chamada à função 'registrar_venda' (RPC), que na mesma transação:
+    decrementa o estoque só se houver quantidade suficiente, insere a venda e
+    abate a contagem de devolução ('qtd_a_devolver') das chamadas pendentes (FIFO).
+    Retorna o JSON da função: {"status": "ok" | "revista_inexistente" | "estoque_insuficiente" | "quantidade_invalida", ...}.
     """
     try:
-        chamadas_pendentes = supabase_admin.table("revistas_chamadasdevolucao") \
-                    .select("id_chamada_devolucao, qtd_a_devolver") \
-                    .eq("id_revista", id_revista_vendida) \
-                    .gt("qtd_a_devolver", 0) \
-                    .order("data_recebimento", desc=False) \
-                    .execute()
-
-        qtd_restante_para_decrementar = qtd_vendida
-
-        for chamada in chamadas_pendentes.data:
-            if qtd_restante_para_decrementar <= 0:
-                break
-
-            # --- CORREÇÃO NO NOME DA CHAVE ---
-            id_chamada_devolucao = chamada["id_chamada_devolucao"]
-            qtd_a_devolver_atual = chamada["qtd_a_devolver"]
+        resposta = await supabase_admin.rpc("registrar_venda", {"venda": dados_venda}).execute()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao cadastrar a venda no banco: {str(e)}"
+        )
 
-            if qtd_a_devolver_atual <= qtd_restante_para_decrementar:
-                # Decrementa toda a quantidade desta chamada
+    resultado = resposta.data
+    if resultado.get("status") == "ok":
+        catalogo.atualizar(resultado["id_revista"], qtd_estoque=resultado["novo_estoque"])
+    elif resultado.get("status") == "estoque_insuficiente":
+        catalogo.atualizar(resultado["id_revista"], qtd_estoque=resultado["estoque_atual"])
+    return resultado
+
+def _dados_venda(venda: VendaFormularioId | VendaFormularioCodBarras, id_usuario: str) -> dict:
+    """Monta o JSON de uma venda no formato esperado pelas funções 'registrar_venda'/'registrar_carrinho'."""
+    if isinstance(venda, VendaFormularioId):
+        identificacao = {"id_revista": venda.id_revista}
+    else:
+        identificacao = {"codigo_barras": venda.codigo_barras}
+
+    return {
+        **identificacao,
+        "id_usuario": id_usuario,
+        "metodo_pagamento": venda.metodo_pagamento,
+        "qtd_vendida": venda.qtd_vendida,
+        "desconto_aplicado": venda.desconto_aplicado,
+        "valor_total": venda.valor_total,
+        "data_venda": venda.data_venda.isoformat()
+    }
 
-                # --- CORREÇÃO NO UPDATE (CHAVE COMPOSTA) ---
-                # Precisamos filtrar por 'id_chamada_devolucao' E 'id_revista'
-                supabase_admin.table("revistas_chamadasdevolucao") \
-                    .update({"qtd_a_devolver": 0}) \
-                    .eq("id_chamada_devolucao", id_chamada_devolucao) \
-                    .eq("id_revista", id_revista_vendida) \
-                    .execute()
-                qtd_restante_para_decrementar -= qtd_a_devolver_atual
-            else:
-                # Decrementa apenas o necessário e sai do loop
-                nova_qtd_a_devolver = qtd_a_devolver_atual - qtd_restante_para_decrementar
+def _resposta_venda(resultado: dict, qtd_vendida: int, detail_inexistente: str) -> JSONResponse:
+    """Converte o resultado da RPC no payload padrão (ou no erro correspondente)."""
+    if resultado.get("status") == "quantidade_invalida":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Quantidade vendida inválida: {qtd_vendida}. Informe um valor maior que zero.")
 
-                # --- CORREÇÃO NO UPDATE (CHAVE COMPOSTA) ---
-                supabase_admin.table("revistas_chamadasdevolucao") \
-                    .update({"qtd_a_devolver": nova_qtd_a_devolver}) \
-                    .eq("id_chamada_devolucao", id_chamada_devolucao) \
-                    .eq("id_revista", id_revista_vendida) \
-                    .execute()
-                qtd_restante_para_decrementar = 0
+    if resultado.get("status") == "revista_inexistente":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail_inexistente)
 
-    except Exception as e:
+    if resultado.get("status") == "estoque_insuficiente":
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao atualizar a contagem de devolução: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Estoque insuficiente para '{resultado.get('nome')}'. Estoque atual: {resultado.get('estoque_atual')}, Pedido: {qtd_vendida}"
         )
 
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "data": {"novo_estoque": resultado["novo_estoque"]},
+            "message": "Venda cadastrada, estoque e contagem de devolução atualizados!"
+        }
+    )
+
 @router.get("/tudo")
-def pegar_vendas(user = Depends(validar_token)):
+async def pegar_vendas(user = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """ Lista todas as vendas (GET básico) """
     try:
-        supabase_admin = pegar_usuario_admin()
-        dados = supabase_admin.table("vendas").select("id_venda, id_usuario, id_produto, metodo_pagamento, qtd_vendida, desconto_aplicado, valor_total, data_venda").execute()
+        dados = await supabase_admin.table("vendas").select("id_venda, id_usuario, id_produto, metodo_pagamento, qtd_vendida, desconto_aplicado, valor_total, data_venda").execute()
         return {
             "data": dados.data,
             "message": "Vendas listadas com sucesso."
@@ -84,186 +92,70 @@ def pegar_vendas(user = Depends(validar_token)):
 
 
 @router.post("/cadastrar-venda-por-codigo")
-def cadastrar_venda_codigo(venda: VendaFormularioCodBarras, user: dict = Depends(validar_token)):
+async def cadastrar_venda_codigo(venda: VendaFormularioCodBarras, user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Endpoint para persistir uma venda (por CÓDIGO DE BARRAS).
     Esta operação ATUALIZA (decrementa) o estoque E
-    ATUALIZA (decrementa) a contagem de devolução ('qtd_a_devolver').
+    ATUALIZA (decrementa) a contagem de devolução ('qtd_a_devolver'),
+    tudo em uma única ida ao banco.
     """
 
-    supabase_admin = pegar_usuario_admin()
-
-    # --- LÓGICA DE BUSCA DA REVISTA (CORRIGIDA) ---
-    try:
-        # 1. Busca a revista diretamente usando o cliente admin
-        resposta_revista = supabase_admin.table("revistas") \
-            .select("id_revista, nome, qtd_estoque") \
-            .like("codigo_barras", f"{venda.codigo_barras}%") \
-            .limit(1) \
-            .execute()
-
-        if not resposta_revista.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Revista com esse código de barras não existe no banco de dados."
-            )
-
-        revista_encontrada = resposta_revista.data[0]
-        id_revista = revista_encontrada["id_revista"]
-
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar revista: {str(e)}")
-    # --- FIM DA LÓGICA DE BUSCA ---
-
-
-    estoque_atual = revista_encontrada.get("qtd_estoque", 0)
-    qtd_vendida_nesta_transacao = venda.qtd_vendida
-
-    if estoque_atual < qtd_vendida_nesta_transacao:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Estoque insuficiente para '{revista_encontrada.get('nome')}'. Estoque atual: {estoque_atual}, Pedido: {qtd_vendida_nesta_transacao}"
-        )
-
-    novo_estoque = estoque_atual - qtd_vendida_nesta_transacao
-
-    try:
-        supabase_admin.table("revistas").update(
-            {"qtd_estoque": novo_estoque}
-        ).eq("id_revista", id_revista).execute()
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao atualizar o estoque da revista: {str(e)}"
-        )
-
-    # --- REGISTRO DA VENDA (TABELA 'vendas') ---
-    dados_venda = {
-        "id_usuario": user["sub"],
-        "metodo_pagamento": venda.metodo_pagamento,
-        "id_produto": id_revista,
-        "qtd_vendida": venda.qtd_vendida,
-        "desconto_aplicado": venda.desconto_aplicado,
-        "valor_total": venda.valor_total,
-        "data_venda": venda.data_venda.isoformat()
-    }
-
-    resposta_insert = supabase_admin.table("vendas").insert(dados_venda).execute()
-
-    if not resposta_insert.data:
-        supabase_admin.table("revistas").update(
-            {"qtd_estoque": estoque_atual}
-        ).eq("id_revista", id_revista).execute()
-
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Erro ao cadastrar a venda no banco (estoque revertido)."
-        )
+    dados_venda = _dados_venda(venda, user["sub"])
 
-    _atualizar_contagem_devolucao(
-        supabase_admin=supabase_admin,
-        id_revista_vendida=id_revista,
-        qtd_vendida=venda.qtd_vendida,
-        id_usuario=user["sub"]
-    )
-
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content={
-            "data": {"novo_estoque": novo_estoque},
-            "message": "Venda cadastrada, estoque e contagem de devolução atualizados!"
-        }
-    )
+    resultado = await _registrar_venda(supabase_admin, dados_venda)
+    return _resposta_venda(resultado, venda.qtd_vendida, "Revista com esse código de barras não existe no banco de dados.")
 
 
 @router.post("/cadastrar-venda-por-id")
-def cadastrar_venda_id(venda: VendaFormularioId, user: dict = Depends(validar_token)):
+async def cadastrar_venda_id(venda: VendaFormularioId, user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
     """
     Endpoint para persistir uma venda (por ID DA REVISTA).
     Esta operação ATUALIZA (decrementa) o estoque E
-    ATUALIZA (decrementa) a contagem de devolução ('qtd_a_devolver').
+    ATUALIZA (decrementa) a contagem de devolução ('qtd_a_devolver'),
+    tudo em uma única ida ao banco.
     """
 
-    supabase_admin = pegar_usuario_admin()
-    revista_encontrada = None
-
-    try:
-        resposta_revista = supabase_admin.table("revistas").select(
-            "id_revista, nome, qtd_estoque"
-        ).eq('id_revista', venda.id_revista).single().execute()
-
-        if not resposta_revista.data:
-            raise Exception("Revista não encontrada")
-
-        revista_encontrada = resposta_revista.data
-        id_revista = revista_encontrada["id_revista"]
+    dados_venda = _dados_venda(venda, user["sub"])
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Revista com o id {venda.id_revista} não existe no banco de dados."
-        )
+    resultado = await _registrar_venda(supabase_admin, dados_venda)
+    return _resposta_venda(resultado, venda.qtd_vendida, f"Revista com o id {venda.id_revista} não existe no banco de dados.")
 
-    estoque_atual = revista_encontrada.get("qtd_estoque", 0)
-    qtd_vendida_nesta_transacao = venda.qtd_vendida
 
-    if estoque_atual < qtd_vendida_nesta_transacao:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Estoque insuficiente para '{revista_encontrada.get('nome')}'. Estoque atual: {estoque_atual}, Pedido: {qtd_vendida_nesta_transacao}"
-        )
+@router.post("/cadastrar-carrinho")
+async def cadastrar_carrinho(carrinho: CarrinhoFormulario, user: dict = Depends(validar_token), supabase_admin: AsyncClient = Depends(pegar_usuario_admin)):
+    """
+    Endpoint para persistir várias vendas de uma vez (carrinho do PDV), por ID ou CÓDIGO DE BARRAS.
+    Uma única chamada à função 'registrar_carrinho' (RPC) valida o estoque de todos os itens,
+    grava as vendas e os decrementos em lote e atualiza a contagem de devolução.
+    Itens sem estoque ou inexistentes não impedem os demais: o resultado vem por item, na ordem do carrinho.
+    """
 
-    novo_estoque = estoque_atual - qtd_vendida_nesta_transacao
+    itens = [_dados_venda(venda, user["sub"]) for venda in carrinho.itens]
 
     try:
-        supabase_admin.table("revistas").update(
-            {"qtd_estoque": novo_estoque}
-        ).eq("id_revista", id_revista).execute()
+        resposta = await supabase_admin.rpc("registrar_carrinho", {"itens": itens}).execute()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao atualizar o estoque da revista: {str(e)}"
+            detail=f"Erro ao cadastrar o carrinho no banco (nenhuma venda foi gravada): {str(e)}"
         )
 
-    dados_venda = {
-        "id_usuario": user["sub"],
-        "metodo_pagamento": venda.metodo_pagamento,
-        "id_produto": id_revista,
-        "qtd_vendida": venda.qtd_vendida,
-        "desconto_aplicado": venda.desconto_aplicado,
-        "valor_total": venda.valor_total,
-        "data_venda": venda.data_venda.isoformat()
-    }
-
-    resposta_insert = supabase_admin.table("vendas").insert(dados_venda).execute()
-
-    if not resposta_insert.data:
-        supabase_admin.table("revistas").update(
-            {"qtd_estoque": estoque_atual}
-        ).eq("id_revista", id_revista).execute()
-
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Erro ao cadastrar a venda no banco (estoque revertido)."
-        )
-
-
-    _atualizar_contagem_devolucao(
-        supabase_admin=supabase_admin,
-        id_revista_vendida=id_revista,
-        qtd_vendida=venda.qtd_vendida,
-        id_usuario=user["sub"]
-    )
+    resultados = resposta.data or []
+    for resultado in resultados:
+        if resultado.get("status") == "ok":
+            catalogo.atualizar(resultado["id_revista"], qtd_estoque=resultado["novo_estoque"])
+        elif resultado.get("status") == "estoque_insuficiente":
+            catalogo.atualizar(resultado["id_revista"], qtd_estoque=resultado["estoque_atual"])
 
+    qtd_cadastradas = sum(1 for resultado in resultados if resultado.get("status") == "ok")
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={
-            "data": {"novo_estoque": novo_estoque},
-            "message": "Venda cadastrada, estoque e contagem de devolução atualizados!"
+            "data": {
+                "itens": resultados,
+                "qtd_vendas_cadastradas": qtd_cadastradas,
+                "qtd_itens_recusados": len(resultados) - qtd_cadastradas
+            },
+            "message": f"Carrinho processado: {qtd_cadastradas} de {len(resultados)} vendas cadastradas."
         }
     )
-
-
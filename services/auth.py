@@ -1,7 +1,11 @@
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from settings.settings import importar_configs
-from supabase import Client, create_client
+from supabase import AsyncClient, AsyncClientOptions
+from postgrest import AsyncPostgrestClient
+from storage3 import AsyncStorageClient
+from typing import List, Optional
+import httpx
 import jwt
 
 security = HTTPBearer()
@@ -39,6 +43,72 @@ def pegar_usuario(user: dict = Depends(validar_token)):
         )
     return user
 
-def pegar_usuario_admin() -> Client:
-    """Retorna um cliente Supabase com permissões de administrador."""
-    return create_client(st.SUPABASE_URL, st.SUPABASE_API_KEY)
+_cliente_admin: Optional[AsyncClient] = None
+_pools_admin: List[httpx.AsyncClient] = []
+
+def _criar_pool() -> httpx.AsyncClient:
+    """Pool httpx (HTTP/2, keep-alive) de um sub-cliente do Supabase."""
+    pool = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        timeout=st.SUPABASE_TIMEOUT_SEGUNDOS,
+        limits=httpx.Limits(
+            max_connections=st.SUPABASE_MAX_CONEXOES,
+            max_keepalive_connections=st.SUPABASE_MAX_CONEXOES_KEEPALIVE,
+            keepalive_expiry=st.SUPABASE_KEEPALIVE_SEGUNDOS,
+        ),
+    )
+    _pools_admin.append(pool)
+    return pool
+
+def _criar_cliente_admin() -> AsyncClient:
+    """
+    Cria o cliente Supabase assíncrono de administrador com um pool httpx (keep-alive) para o PostgREST e outro para o Storage.
+    O pool não vai em AsyncClientOptions.httpx_client porque o mesmo httpx.AsyncClient seria dado a PostgREST, Storage e Auth,
+    e cada um sobrescreve o base_url dele. Os dois sub-clientes são criados pelos construtores públicos (postgrest/storage3)
+    e ocupam os atributos que o AsyncClient preencheria sob demanda. Isso depende da versão fixada no requirements.txt
+    (supabase==2.18.1): se uma atualização mudar esses atributos, a criação falha aqui em vez de seguir sem pool.
+    """
+    cliente = AsyncClient(
+        st.SUPABASE_URL,
+        st.SUPABASE_API_KEY,
+        options=AsyncClientOptions(postgrest_client_timeout=st.SUPABASE_TIMEOUT_SEGUNDOS),
+    )
+    for atributo in ("_postgrest", "_storage"):
+        if not hasattr(cliente, atributo) or getattr(cliente, atributo) is not None:
+            raise RuntimeError(f"Versão do supabase-py incompatível: AsyncClient.{atributo} mudou. Revise services/auth.py.")
+
+    cliente._postgrest = AsyncPostgrestClient(
+        cliente.rest_url,
+        schema=cliente.options.schema,
+        headers=cliente.options.headers,
+        http_client=_criar_pool(),
+    )
+    cliente._storage = AsyncStorageClient(cliente.storage_url, cliente.options.headers, http_client=_criar_pool())
+    return cliente
+
+def iniciar_cliente_admin() -> AsyncClient:
+    """Cria o cliente compartilhado (chamado no lifespan da aplicação)."""
+    global _cliente_admin
+    if _cliente_admin is None:
+        _cliente_admin = _criar_cliente_admin()
+    return _cliente_admin
+
+async def encerrar_cliente_admin():
+    """
+    Fecha as conexões do cliente compartilhado: os pools do PostgREST e do Storage, o cliente HTTP do Auth e o
+    Realtime (sem efeito se nunca conectou). O cliente de Functions só é criado quando acessado, o que a API não faz.
+    """
+    global _cliente_admin
+    if _cliente_admin is None:
+        return
+    cliente, _cliente_admin = _cliente_admin, None
+    for pool in _pools_admin:
+        await pool.aclose()
+    _pools_admin.clear()
+    await cliente.auth.close()
+    await cliente.realtime.close()
+
+def pegar_usuario_admin() -> AsyncClient:
+    """Retorna o cliente Supabase assíncrono (compartilhado) com permissões de administrador."""
+    return _cliente_admin or iniciar_cliente_admin()
@@ -0,0 +1,152 @@
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from services.catalogo import catalogo, CatalogoRevistas
+
+
+def normalizar_texto(texto: Any) -> str:
+    """Minúsculas, sem espaços nas pontas e com os tokens ordenados (equivalente ao pré-processamento do token_sort_ratio)."""
+    return " ".join(sorted(str(texto or "").lower().split()))
+
+
+class IndiceBusca:
+    """
+    Índice de busca fuzzy sobre nome e apelido das revistas.
+    Os textos são normalizados uma única vez na construção; cada consulta é pontuada
+    contra o catálogo inteiro em lote com rapidfuzz.process.cdist.
+    """
+
+    def __init__(self, revistas: List[Dict[str, Any]], versao_nomes: int):
+        self.versao_nomes = versao_nomes
+        self.ids: List[int] = [r["id_revista"] for r in revistas]
+        # Nomes seguidos de apelidos: uma única chamada ao cdist pontua os dois campos
+        self.textos: List[str] = [normalizar_texto(r.get("nome")) for r in revistas] + [normalizar_texto(r.get("apelido_revista")) for r in revistas]
+
+    def buscar(self, consulta: str, corte: float = 70, limite: int = 20, deslocamento: int = 0) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        Retorna ([(id_revista, score), ...], total_de_resultados) ordenado por score decrescente.
+        Como os textos já estão com tokens ordenados, fuzz.ratio equivale ao token_sort_ratio.
+        Scores em float64 e sem arredondar, iguais aos do token_sort_ratio de antes (float32 e round criavam empates).
+        """
+        if not self.ids:
+            return ([], 0)
+
+        q = normalizar_texto(consulta)
+        scores = process.cdist([q], self.textos, scorer=fuzz.ratio, dtype=np.float64)[0]
+        scores = scores.reshape(2, len(self.ids)).max(axis=0)
+
+        candidatos = np.flatnonzero(scores >= corte)
+        total = int(candidatos.size)
+        if total == 0:
+            return ([], 0)
+
+        ordem = candidatos[np.argsort(-scores[candidatos], kind="stable")]
+        pagina = ordem[deslocamento:deslocamento + limite]
+        return ([(self.ids[i], float(scores[i])) for i in pagina], total)
+
+
+class IndicePrefixo:
+    """
+    Índice de prefixos para autocompletar: listas ordenadas (bisect) com o texto completo
+    normalizado e com cada token de nome/apelido, apontando para o id da revista.
+    """
+
+    def __init__(self, revistas: List[Dict[str, Any]], versao_nomes: int):
+        self.versao_nomes = versao_nomes
+        self.nomes: Dict[int, str] = {}
+        completos: List[Tuple[str, int]] = []
+        tokens: List[Tuple[str, int]] = []
+        for r in revistas:
+            id_revista = r["id_revista"]
+            self.nomes[id_revista] = str(r.get("nome") or "").lower().strip()
+            for campo in (r.get("nome"), r.get("apelido_revista")):
+                texto = " ".join(str(campo or "").lower().split())
+                if not texto:
+                    continue
+                completos.append((texto, id_revista))
+                tokens.extend((token, id_revista) for token in set(texto.split()))
+        completos.sort()
+        tokens.sort()
+        self.completos = [t for t, _ in completos]
+        self.completos_ids = [i for _, i in completos]
+        self.tokens = [t for t, _ in tokens]
+        self.tokens_ids = [i for _, i in tokens]
+
+    @staticmethod
+    def _faixa(chaves: List[str], prefixo: str) -> Tuple[int, int]:
+        return (bisect_left(chaves, prefixo), bisect_left(chaves, prefixo + "\uffff"))
+
+    def sugerir(self, consulta: str, limite: int = 10) -> List[int]:
+        """
+        Retorna ids de revistas cujo nome/apelido começa com a consulta (primeiro) ou
+        em que todos os termos digitados são prefixos de alguma palavra (depois).
+        Dentro de cada grupo, nomes mais curtos vêm antes.
+        """
+        q = " ".join(consulta.lower().split())
+        if not q:
+            return []
+
+        inicio, fim = self._faixa(self.completos, q)
+        por_inicio = set(self.completos_ids[inicio:fim])
+
+        por_token: Optional[set] = None
+        for termo in q.split():
+            inicio, fim = self._faixa(self.tokens, termo)
+            ids = set(self.tokens_ids[inicio:fim])
+            por_token = ids if por_token is None else por_token & ids
+            if not por_token:
+                break
+        por_token = (por_token or set()) - por_inicio
+
+        def chave(id_revista):
+            nome = self.nomes.get(id_revista, "")
+            return (len(nome), nome, id_revista)
+
+        ranqueados = sorted(por_inicio, key=chave) + sorted(por_token, key=chave)
+        return ranqueados[:limite]
+
+
+_indices: Dict[type, Any] = {}
+
+
+async def _obter_indice(tipo, cat: CatalogoRevistas):
+    versao_nomes = await cat.obter_versao_nomes()
+    indice = _indices.get(tipo)
+    if indice is None or indice.versao_nomes != versao_nomes:
+        snapshot = await cat.snapshot()
+        indice = tipo(snapshot.data, versao_nomes)
+        _indices[tipo] = indice
+    return indice
+
+
+async def obter_indice(cat: CatalogoRevistas = catalogo) -> IndiceBusca:
+    """Retorna o índice de busca, reconstruindo-o apenas quando nomes/apelidos do catálogo mudam."""
+    return await _obter_indice(IndiceBusca, cat)
+
+
+async def obter_indice_prefixo(cat: CatalogoRevistas = catalogo) -> IndicePrefixo:
+    """Retorna o índice de prefixos, reconstruindo-o apenas quando nomes/apelidos do catálogo mudam."""
+    return await _obter_indice(IndicePrefixo, cat)
+
+
+async def buscar_revistas_por_nome(consulta: str, corte: float = 70, limite: int = 20, pagina: int = 1) -> Tuple[List[Dict[str, Any]], int]:
+    """Busca fuzzy paginada; devolve as linhas atuais do catálogo (com estoque fresco) e o score."""
+    indice = await obter_indice()
+    resultados, total = indice.buscar(consulta, corte=corte, limite=limite, deslocamento=(pagina - 1) * limite)
+
+    revistas = []
+    for id_revista, score in resultados:
+        revista = await catalogo.obter(id_revista)
+        if revista:
+            revistas.append({**revista, "score": score})
+    return (revistas, total)
+
+
+async def autocompletar_revistas(consulta: str, limite: int = 10) -> List[Dict[str, Any]]:
+    """Sugestões por prefixo para a caixa de busca do PDV, com as linhas atuais do catálogo."""
+    indice = await obter_indice_prefixo()
+    revistas = [await catalogo.obter(i) for i in indice.sugerir(consulta, limite=limite)]
+    return [revista for revista in revistas if revista]
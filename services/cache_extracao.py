@@ -0,0 +1,97 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from settings.settings import importar_configs
+
+st = importar_configs()
+
+
+def versao_extracao(*partes: Any) -> str:
+    """Resumo curto do que define o resultado da extração (prompt, modelo, versão do parser local)."""
+    return hashlib.sha256("\x1f".join(str(p) for p in partes).encode("utf-8")).hexdigest()[:16]
+
+
+def chave_cache(file_bytes: bytes, versao: str) -> str:
+    """Chave endereçada pelo conteúdo: SHA-256 do PDF + versão da extração."""
+    return f"{hashlib.sha256(file_bytes).hexdigest()}:{versao}"
+
+
+class CacheExtracao:
+    """
+    Cache persistente (SQLite) do JSON devolvido por processar_pdf_para_json, com descarte LRU.
+    - Reenvios do mesmo PDF pulam a leitura completa do arquivo e a IA.
+    - Mudar o prompt, o modelo ou o parser local muda a versão e, com ela, a chave: entradas antigas só envelhecem.
+    O SQLite é acessado fora do event loop (run_in_threadpool), com um lock por conexão.
+    max_itens <= 0 desliga o cache.
+    """
+
+    def __init__(self, arquivo: str, max_itens: int):
+        self._arquivo = arquivo
+        self._max_itens = max_itens
+        self._lock = threading.Lock()
+        self._conexao: Optional[sqlite3.Connection] = None
+
+    @property
+    def ativo(self) -> bool:
+        return self._max_itens > 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            self._conexao = sqlite3.connect(self._arquivo, check_same_thread=False)
+            self._conexao.execute(
+                "create table if not exists extracoes (chave text primary key, dados text not null, usado_em real not null)"
+            )
+            self._conexao.execute("create index if not exists extracoes_usado_em on extracoes (usado_em)")
+            self._conexao.commit()
+        return self._conexao
+
+    def _obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conexao = self._conectar()
+            linha = conexao.execute("select dados from extracoes where chave = ?", (chave,)).fetchone()
+            if linha is None:
+                return None
+            conexao.execute("update extracoes set usado_em = ? where chave = ?", (time.time(), chave))
+            conexao.commit()
+        return json.loads(linha[0])
+
+    def _guardar(self, chave: str, dados: Dict[str, Any]):
+        with self._lock:
+            conexao = self._conectar()
+            conexao.execute(
+                "insert or replace into extracoes (chave, dados, usado_em) values (?, ?, ?)",
+                (chave, json.dumps(dados, ensure_ascii=False), time.time()),
+            )
+            # Descarta as menos usadas recentemente além do limite
+            conexao.execute(
+                "delete from extracoes where chave not in (select chave from extracoes order by usado_em desc limit ?)",
+                (self._max_itens,),
+            )
+            conexao.commit()
+
+    async def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Retorna o JSON em cache (ou None). Falhas do cache nunca derrubam o upload."""
+        if not self.ativo:
+            return None
+        try:
+            return await run_in_threadpool(self._obter, chave)
+        except Exception as e:
+            print(f"[ERRO] Falha ao ler o cache de extração: {e}")
+            return None
+
+    async def guardar(self, chave: str, dados: Dict[str, Any]):
+        if not self.ativo:
+            return
+        try:
+            await run_in_threadpool(self._guardar, chave, dados)
+        except Exception as e:
+            print(f"[ERRO] Falha ao gravar o cache de extração: {e}")
+
+
+cache_extracao = CacheExtracao(st.CACHE_EXTRACAO_ARQUIVO, st.CACHE_EXTRACAO_MAX_ITENS)
@@ -0,0 +1,165 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from settings.settings import importar_configs
+from services.auth import pegar_usuario_admin
+
+st = importar_configs()
+
+COLUNAS_REVISTA = "id_revista, nome, apelido_revista, numero_edicao, codigo_barras, qtd_estoque, preco_capa, preco_liquido, url_revista"
+_NAO_DIGITOS = re.compile(r"\D")
+# Recargas seguidas descartadas por escritas concorrentes antes de desistir de esperar o catálogo ficar parado
+_MAX_RECARGAS = 3
+
+
+def normalizar_codigo_barras(codigo: Any) -> Optional[str]:
+    """Remove espaços e qualquer caractere não numérico do código de barras (EAN-13 + add-on)."""
+    if codigo is None:
+        return None
+    digitos = _NAO_DIGITOS.sub("", str(codigo))
+    return digitos or None
+
+
+@dataclass(frozen=True)
+class SnapshotCatalogo:
+    """Fotografia imutável do catálogo de revistas em uma determinada versão."""
+    data: List[Dict[str, Any]]
+    versao: int
+
+
+class CatalogoRevistas:
+    """
+    Cache em memória da tabela 'revistas' com TTL e invalidação write-through.
+    - Leituras devolvem um SnapshotCatalogo versionado, sem ir ao banco enquanto o TTL for válido.
+    - Escritas feitas pela API devem chamar registrar/atualizar/invalidar para manter o cache coerente.
+    As linhas nunca são alteradas no lugar: cada escrita troca o dict da revista, então snapshots antigos continuam consistentes.
+    Todo o acesso acontece no event loop; só a recarga do banco é aguardada (e serializada por um asyncio.Lock).
+    Uma recarga que cruza uma escrita write-through (geração de escritas mudou durante a leitura do banco)
+    é descartada e refeita, para não instalar uma fotografia anterior à escrita.
+    """
+
+    def __init__(self, carregador: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl_segundos: float):
+        self._carregador = carregador
+        self._ttl = ttl_segundos
+        self._lock_recarga = asyncio.Lock()
+        self._revistas: Dict[int, Dict[str, Any]] = {}
+        self._por_codigo_barras: Dict[str, int] = {}
+        self._versao = 0
+        self._versao_nomes = 0
+        self._carregado_em: Optional[float] = None
+        self._snapshot: Optional[SnapshotCatalogo] = None
+        self._geracao_escritas = 0
+
+    @property
+    def versao(self) -> int:
+        return self._versao
+
+    async def obter_versao_nomes(self) -> int:
+        """Versão que só muda quando nomes/apelidos mudam (índices de busca textual dependem só dela)."""
+        await self._garantir_carregado()
+        return self._versao_nomes
+
+    def _expirado(self) -> bool:
+        return self._carregado_em is None or (time.monotonic() - self._carregado_em) > self._ttl
+
+    def _indexar_codigo(self, antiga: Optional[Dict[str, Any]], nova: Dict[str, Any]):
+        codigo_antigo = normalizar_codigo_barras(antiga.get("codigo_barras")) if antiga else None
+        codigo_novo = normalizar_codigo_barras(nova.get("codigo_barras"))
+        if codigo_antigo and codigo_antigo != codigo_novo and self._por_codigo_barras.get(codigo_antigo) == nova["id_revista"]:
+            del self._por_codigo_barras[codigo_antigo]
+        if codigo_novo:
+            self._por_codigo_barras[codigo_novo] = nova["id_revista"]
+
+    def _registrar_versao(self, antiga: Optional[Dict[str, Any]], nova: Dict[str, Any]):
+        self._versao += 1
+        if antiga is None or antiga.get("nome") != nova.get("nome") or antiga.get("apelido_revista") != nova.get("apelido_revista"):
+            self._versao_nomes += 1
+
+    async def _recarregar(self):
+        for tentativa in range(1, _MAX_RECARGAS + 1):
+            geracao = self._geracao_escritas
+            linhas = await self._carregador() or []
+            if geracao == self._geracao_escritas:
+                break
+            print(f"[INFO] Catálogo alterado durante a recarga ({tentativa}/{_MAX_RECARGAS}); leitura descartada.")
+        self._revistas = {linha["id_revista"]: linha for linha in linhas}
+        self._por_codigo_barras = {}
+        for linha in linhas:
+            self._indexar_codigo(None, linha)
+        # Se as escritas não pararam, a leitura pode estar defasada: serve agora, mas a próxima leitura recarrega
+        self._carregado_em = time.monotonic() if geracao == self._geracao_escritas else None
+        self._versao += 1
+        self._versao_nomes += 1
+        self._snapshot = None
+
+    async def _garantir_carregado(self):
+        if self._expirado():
+            async with self._lock_recarga:
+                # Outra requisição pode ter recarregado enquanto esperávamos o lock
+                if self._expirado():
+                    await self._recarregar()
+
+    async def snapshot(self) -> SnapshotCatalogo:
+        """Retorna o catálogo atual, recarregando do banco se o TTL venceu ou se foi invalidado."""
+        await self._garantir_carregado()
+        if self._snapshot is None or self._snapshot.versao != self._versao:
+            self._snapshot = SnapshotCatalogo(data=list(self._revistas.values()), versao=self._versao)
+        return self._snapshot
+
+    async def obter(self, id_revista: int) -> Optional[Dict[str, Any]]:
+        """Retorna a revista pelo ID a partir do cache (ou None)."""
+        await self._garantir_carregado()
+        return self._revistas.get(id_revista)
+
+    async def buscar_por_codigo_barras(self, codigo: str) -> Optional[Dict[str, Any]]:
+        """Busca O(1) no índice de códigos de barras, sem ida ao banco."""
+        chave = normalizar_codigo_barras(codigo)
+        if not chave:
+            return None
+        await self._garantir_carregado()
+        id_revista = self._por_codigo_barras.get(chave)
+        return self._revistas.get(id_revista) if id_revista is not None else None
+
+    def registrar(self, revista: Dict[str, Any]):
+        """Insere ou substitui uma revista no cache (write-through após insert/update no banco)."""
+        self._geracao_escritas += 1
+        if not revista or revista.get("id_revista") is None or self._carregado_em is None:
+            return
+        atual = self._revistas.get(revista["id_revista"])
+        if atual is None and "nome" not in revista:
+            # Linha parcial de uma revista que não conhecemos: melhor recarregar tudo
+            self._carregado_em = None
+            return
+        nova = {**(atual or {}), **revista}
+        self._revistas[revista["id_revista"]] = nova
+        self._indexar_codigo(atual, nova)
+        self._registrar_versao(atual, nova)
+
+    def atualizar(self, id_revista: int, **campos):
+        """Atualiza campos de uma revista já presente no cache."""
+        self._geracao_escritas += 1
+        atual = self._revistas.get(id_revista)
+        if atual is None:
+            return
+        nova = {**atual, **campos}
+        self._revistas[id_revista] = nova
+        self._indexar_codigo(atual, nova)
+        self._registrar_versao(atual, nova)
+
+    def invalidar(self):
+        """Força a próxima leitura a buscar o catálogo completo no banco."""
+        self._geracao_escritas += 1
+        self._carregado_em = None
+        self._snapshot = None
+
+
+async def _carregar_revistas_banco() -> List[Dict[str, Any]]:
+    supabase_admin = pegar_usuario_admin()
+    resposta = await supabase_admin.table("revistas").select(COLUNAS_REVISTA).execute()
+    return resposta.data
+
+
+catalogo = CatalogoRevistas(_carregar_revistas_banco, st.CATALOGO_TTL_SEGUNDOS)
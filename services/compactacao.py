@@ -0,0 +1,177 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List
+
+from settings.settings import importar_configs
+
+st = importar_configs()
+
+# Compactação do texto (pdfplumber, layout=True) antes de enviá-lo à IA.
+# O layout preenche as colunas com longas sequências de espaços e repete cabeçalho/rodapé em toda página;
+# nada disso ajuda o modelo, mas tudo vira token de entrada (latência e custo).
+# Fica: o cabeçalho do documento (página 1), os títulos da tabela (uma vez) e as linhas de produtos
+# (com o nome quebrado em mais de uma linha já juntado).
+
+# Mudanças que alteram o texto enviado à IA devem incrementar a versão (invalida o cache de extração)
+VERSAO_COMPACTACAO = 2
+
+_RE_ESPACOS_COLUNA = re.compile(r"[ \t]{2,}")
+_RE_ESPACOS = re.compile(r"[ \t]+")
+_RE_NUMERICO = re.compile(r"^[\d.,]+$")
+_RE_MOEDA = re.compile(r"^\d{1,3}(?:\.\d{3})*,\d{2}$|^\d+,\d{2}$")
+_RE_TOTAL = re.compile(r"^\s*(?:sub\s*-?\s*)?total", re.IGNORECASE)
+_RE_PAGINACAO = re.compile(r"^\s*p[áa]g(?:ina|\.)?\s*\d+(?:\s*(?:/|de)\s*\d+)?\s*$", re.IGNORECASE)
+# Títulos das colunas das notas de entrega e das chamadas de encalhe
+_RE_TITULOS_TABELA = [
+    re.compile(p, re.IGNORECASE)
+    for p in (r"\bprodut", r"\bedi", r"\bquant", r"capa\b", r"l[íi]q", r"\brep\b", r"\bc[óo]d", r"\bencalhe")
+]
+_MIN_TITULOS_TABELA = 3
+
+
+@dataclass
+class TextoCompactado:
+    texto: str
+    tokens_antes: int
+    tokens_depois: int
+    # Cabeçalho do documento + títulos da tabela e as linhas de produtos de cada página (já compactados);
+    # vazios quando o documento não tem títulos de tabela reconhecíveis
+    cabecalho: str = ""
+    linhas_por_pagina: List[List[str]] = field(default_factory=list)
+
+    @property
+    def reducao(self) -> float:
+        """Fração de tokens economizada (0 a 1)."""
+        return 1 - self.tokens_depois / self.tokens_antes if self.tokens_antes else 0.0
+
+    def partes(self, paginas_por_parte: int) -> List[str]:
+        """
+        Divide o texto em partes de até 'paginas_por_parte' páginas da tabela, cada uma com o cabeçalho,
+        para extração em paralelo. Sem estrutura reconhecida (ou com uma parte só), retorna [texto].
+        """
+        paginas = [linhas for linhas in self.linhas_por_pagina if linhas]
+        if not self.cabecalho or paginas_por_parte <= 0 or len(paginas) <= paginas_por_parte:
+            return [self.texto]
+        return [
+            "\n".join([self.cabecalho, *(l for linhas in paginas[i:i + paginas_por_parte] for l in linhas)])
+            for i in range(0, len(paginas), paginas_por_parte)
+        ]
+
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimativa local (~4 caracteres por token), sem chamar a API.
+    O número real de tokens de cada chamada é registrado pelo backend (services.llm).
+    """
+    return math.ceil(len(texto) / 4)
+
+
+def colapsar_espacos(texto: str) -> str:
+    """Troca o preenchimento entre colunas por ' | ' e remove espaços sobrando e linhas vazias."""
+    linhas = []
+    for linha in texto.splitlines():
+        linha = _RE_ESPACOS.sub(" ", _RE_ESPACOS_COLUNA.sub(" | ", linha.strip()))
+        if linha:
+            linhas.append(linha)
+    return "\n".join(linhas)
+
+
+def _normalizar(linha: str) -> str:
+    return _RE_ESPACOS.sub(" ", linha.strip()).lower()
+
+
+def _eh_titulo_tabela(linha: str) -> bool:
+    return sum(1 for p in _RE_TITULOS_TABELA if p.search(linha)) >= _MIN_TITULOS_TABELA
+
+
+def _tem_preco(linha: str) -> bool:
+    return any(_RE_MOEDA.match(t) for t in linha.split())
+
+
+def _eh_linha_produto(linha: str) -> bool:
+    """Linha com valores: algum preço ou termina em número (e não é total)."""
+    if _RE_TOTAL.match(linha):
+        return False
+    tokens = linha.split()
+    return bool(tokens) and (_RE_NUMERICO.match(tokens[-1]) is not None or _tem_preco(linha))
+
+
+def _juntar_continuacao(produto: str, linha: str) -> str:
+    """'Veja | 10 | 2 | 13,90' + 'Edição Especial' -> 'Veja Edição Especial | 10 | 2 | 13,90' (o nome é a primeira coluna)."""
+    nome, separador, valores = produto.partition(" | ")
+    continuacao = colapsar_espacos(linha).replace(" | ", " ")
+    return f"{nome} {continuacao}{separador}{valores}"
+
+
+def compactar_paginas(paginas: List[str]) -> TextoCompactado:
+    """
+    Mantém o cabeçalho da primeira página (até os títulos da tabela), os títulos da tabela uma única vez
+    e, dali em diante, só as linhas de produtos. Uma linha só com texto logo depois de um produto é o nome
+    quebrado e vai para a coluna do nome desse produto. Saem cabeçalhos/rodapés repetidos, paginação,
+    linhas de categoria antes do primeiro produto da página e totais. Sem títulos de tabela no documento,
+    só os espaços são colapsados (não dá para saber o que é produto).
+    """
+    bruto = "\n".join(paginas).strip()
+    antes = estimar_tokens(bruto)
+
+    linhas_por_pagina = [[l for l in p.splitlines() if l.strip()] for p in paginas]
+    if not any(_eh_titulo_tabela(l) for linhas in linhas_por_pagina for l in linhas):
+        texto = colapsar_espacos(bruto)
+        return TextoCompactado(texto, antes, estimar_tokens(texto))
+
+    # Linhas sem preço que aparecem em mais de uma página são cabeçalho/rodapé (ex.: "Ponto : 48507")
+    ocorrencias = Counter(l for linhas in linhas_por_pagina for l in {_normalizar(x) for x in linhas})
+    repetidas = {l for l, n in ocorrencias.items() if n > 1}
+
+    cabecalho: List[str] = []
+    produtos: List[List[str]] = [[] for _ in linhas_por_pagina]
+    titulos_vistos = set()
+    cabecalho_documento = set()
+    na_tabela = False
+    for numero_pagina, linhas in enumerate(linhas_por_pagina):
+        for linha in linhas:
+            normalizada = _normalizar(linha)
+            if _eh_titulo_tabela(linha):
+                na_tabela = True
+                if normalizada not in titulos_vistos:
+                    titulos_vistos.add(normalizada)
+                    cabecalho.append(linha)
+            elif _RE_PAGINACAO.match(linha):
+                continue
+            elif na_tabela or numero_pagina > 0:
+                # Dentro da tabela (ou em página seguinte cuja tabela não repete os títulos): só produtos
+                repetida = normalizada in cabecalho_documento or (normalizada in repetidas and not _tem_preco(linha))
+                if repetida or _RE_TOTAL.match(linha):
+                    continue
+                if _eh_linha_produto(linha):
+                    produtos[numero_pagina].append(colapsar_espacos(linha))
+                elif produtos[numero_pagina]:
+                    # Só texto depois de um produto: continuação do nome
+                    produtos[numero_pagina][-1] = _juntar_continuacao(produtos[numero_pagina][-1], linha)
+            else:
+                # Cabeçalho do documento (página 1, antes da tabela); entra uma única vez
+                cabecalho_documento.add(normalizada)
+                cabecalho.append(linha)
+
+    texto_cabecalho = colapsar_espacos("\n".join(cabecalho))
+    texto = "\n".join([texto_cabecalho, *(l for linhas in produtos for l in linhas)])
+    return TextoCompactado(texto, antes, estimar_tokens(texto), texto_cabecalho, produtos)
+
+
+def texto_para_ia(paginas: List[str]) -> TextoCompactado:
+    """
+    Texto do documento a ser enviado à IA: compactado (PROMPT_COMPACTAR), com o registro dos tokens antes e depois.
+    Sem compactação, o texto vai inteiro (e em uma única parte).
+    """
+    if not st.PROMPT_COMPACTAR:
+        bruto = "\n".join(paginas).strip()
+        tokens = estimar_tokens(bruto)
+        return TextoCompactado(bruto, tokens, tokens)
+    compactado = compactar_paginas(paginas)
+    print(
+        f"[INFO] Texto compactado para a IA: ~{compactado.tokens_antes} -> ~{compactado.tokens_depois} tokens "
+        f"({compactado.reducao:.0%} a menos)."
+    )
+    return compactado
@@ -1,39 +1,64 @@
 import re
+from dataclasses import dataclass
 from io import BytesIO
-from typing import Optional, Tuple
-from pypdf import PdfReader
+from typing import List, Optional, Sequence, Tuple
+import pdfplumber
 from datetime import datetime
 
-def _extrair_texto_pdf_pypdf(file_bytes: bytes) -> Optional[str]:
+# Padrões do cabeçalho, compilados uma única vez
+# "Ponto : 48507" ou "Ponto4 :8507": "Ponto", um dígito opcional (Ponto4), lixo, e depois os números.
+# Só espaços da mesma linha, no máximo um entre dígitos e até 8 dígitos: com layout=True a coluna
+# numérica seguinte (ou a linha de baixo) não pode ser colada ao PDV
+_RE_PDV = re.compile(r"Ponto[ \t]*(\d)?[ \t]*[:\-]?[ \t]*(\d(?:[ \t]?\d){0,7})", re.IGNORECASE)
+# "Data :" em uma linha que não contenha "chamada" (\bData evita "Candidata")
+_RE_DATA_ENTREGA = re.compile(r"^(?!.*chamada).*?\bData\s*[:\-]?\s*(\d{2}/\d{2}/\d{4})", re.IGNORECASE | re.MULTILINE)
+_RE_DATA_CHAMADA = re.compile(r"Data da chamada\s*[:\-]?\s*(\d{2}/\d{2}/\d{4})", re.IGNORECASE)
+_RE_ESPACOS = re.compile(r"\s")
+
+# Campos do cabeçalho usados na pré-verificação de cada tipo de documento
+CAMPOS_ENTRADA = ("data", "ponto_venda")
+CAMPOS_DEVOLUCAO = ("data_chamada",)
+
+@dataclass
+class DocumentoPdf:
     """
-    Extrai texto de todas as páginas de um PDF (PyPDF) para a pré-verificação.
+    Resultado da leitura do PDF (pdfplumber, layout=True), compartilhado por todas as etapas:
+    a pré-verificação usa os campos do cabeçalho e o prompt da IA (ou um parser local) usa o texto das páginas.
+    Campos do cabeçalho que não forem encontrados ficam como None.
+    Na leitura só do cabeçalho (ler_cabecalho_pdf), 'paginas' tem apenas as primeiras páginas até 'completar_documento'.
     """
-    try:
-        reader = PdfReader(BytesIO(file_bytes))
-        texto = []
-        for page in reader.pages:
-            t = page.extract_text() or ""
-            texto.append(t)
-        return "\n".join(texto).strip()
-    except Exception as e:
-        print(f"[ERRO] Falha ao ler PDF com PyPDF: {e}")
-        return None
+    paginas: List[str]
+    total_paginas: int = 0
+    data: Optional[str] = None            # "Data :" da nota de entrega (ISO)
+    ponto_venda: Optional[str] = None     # "Ponto :" (PDV)
+    data_chamada: Optional[str] = None    # "Data da chamada" da devolução (ISO)
+
+    @property
+    def texto(self) -> str:
+        return "\n".join(self.paginas).strip()
 
-def _formatar_data_iso(data_str: str) -> str:
-    """Converte DD/MM/YYYY para YYYY-MM-DD."""
+    @property
+    def completo(self) -> bool:
+        return len(self.paginas) >= self.total_paginas
+
+def _formatar_data_iso(data_str: str) -> Optional[str]:
+    """
+    Converte DD/MM/YYYY para YYYY-MM-DD. Data impossível (ex.: 31/02/2025) vira None com um aviso:
+    os extratores do cabeçalho nunca levantam erro, já que completar_documento roda todos eles
+    e um campo malformado que a rota nem usa não pode derrubar o documento.
+    """
     try:
         return datetime.strptime(data_str, "%d/%m/%Y").date().isoformat()
     except ValueError:
-        raise ValueError(f"Formato de data inválido: '{data_str}'. Esperado DD/MM/YYYY.")
+        print(f"[ERRO] Formato de data inválido no cabeçalho: '{data_str}'. Esperado DD/MM/YYYY; campo ignorado.")
+        return None
 
 def _extrair_pdv(texto: str) -> Optional[str]:
     """Extrai o ID do ponto de venda (PDV) do texto."""
-    # Tenta a lógica de "Ponto : 48507" ou "Ponto4 :8507"
-    # Procura por "Ponto", um dígito opcional (Ponto4), lixo, e depois os números
-    match = re.search(r"Ponto\s*(\d)?\s*[:\-]?\s*(\d[\s\d]*)", texto, re.IGNORECASE)
+    match = _RE_PDV.search(texto)
     if match:
         prefixo = match.group(1) or ""
-        sufixo = re.sub(r"\s", "", match.group(2) or "")
+        sufixo = _RE_ESPACOS.sub("", match.group(2) or "")
         pdv = f"{prefixo}{sufixo}"
 
         # Garante que é um número razoável (ex: 48507)
@@ -41,52 +66,88 @@ def _extrair_pdv(texto: str) -> Optional[str]:
             return pdv
     return None
 
-def extrair_dados_devolucao_local(file_bytes: bytes) -> str:
+def _extrair_data_entrega(texto: str) -> Optional[str]:
+    """Extrai a data da nota de entrega ("Data :"), ignorando a "Data da chamada" da devolução."""
+    match = _RE_DATA_ENTREGA.search(texto)
+    return _formatar_data_iso(match.group(1)) if match else None
+
+def _extrair_data_chamada(texto: str) -> Optional[str]:
+    """Extrai a "Data da chamada" de uma devolução."""
+    match = _RE_DATA_CHAMADA.search(texto)
+    return _formatar_data_iso(match.group(1)) if match else None
+
+_EXTRATORES_CABECALHO = {
+    "data": _extrair_data_entrega,
+    "ponto_venda": _extrair_pdv,
+    "data_chamada": _extrair_data_chamada,
+}
+
+def _abrir_pdf(file_bytes: bytes):
+    try:
+        return pdfplumber.open(BytesIO(file_bytes))
+    except Exception as e:
+        print(f"[ERRO] Falha ao ler PDF com pdfplumber: {e}")
+        raise ValueError("Não foi possível extrair texto do PDF.")
+
+def _ler_paginas(documento: DocumentoPdf, pdf, campos: Sequence[str], ate_o_fim: bool) -> DocumentoPdf:
+    """Lê as páginas ainda não lidas, procurando os campos do cabeçalho que faltam em cada página nova."""
+    # Campos que não eram exigidos na primeira leitura ainda podem estar nas páginas já lidas
+    for campo in campos:
+        if getattr(documento, campo) is None and documento.paginas:
+            setattr(documento, campo, _EXTRATORES_CABECALHO[campo]("\n".join(documento.paginas)))
+
+    for page in pdf.pages[len(documento.paginas):]:
+        faltando = [campo for campo in campos if getattr(documento, campo) is None]
+        if not faltando and not ate_o_fim:
+            break
+        # layout=True preserva espaços entre colunas
+        texto_pagina = page.extract_text(layout=True) or ""
+        documento.paginas.append(texto_pagina)
+        for campo in faltando:
+            setattr(documento, campo, _EXTRATORES_CABECALHO[campo](texto_pagina))
+    return documento
+
+def ler_cabecalho_pdf(file_bytes: bytes, campos: Sequence[str]) -> DocumentoPdf:
     """
-    Extrai localmente data_limite_iso de uma Devolução.
+    Pré-verificação rápida: lê só as primeiras páginas, parando assim que todos os 'campos' do cabeçalho
+    forem encontrados (normalmente na página 1). Roda no pool de processos (services.processamento_pdf).
+    """
+    with _abrir_pdf(file_bytes) as pdf:
+        documento = DocumentoPdf(paginas=[], total_paginas=len(pdf.pages))
+        return _ler_paginas(documento, pdf, campos, ate_o_fim=False)
+
+def completar_documento(file_bytes: bytes, documento: DocumentoPdf) -> DocumentoPdf:
+    """Lê as páginas que faltam de um documento obtido por ler_cabecalho_pdf (sem reler as já lidas)."""
+    if documento.completo:
+        return documento
+    with _abrir_pdf(file_bytes) as pdf:
+        return _ler_paginas(documento, pdf, tuple(_EXTRATORES_CABECALHO), ate_o_fim=True)
+
+def extrair_dados_devolucao_local(documento: DocumentoPdf) -> str:
+    """
+    Retorna data_limite_iso de uma Devolução a partir do documento já lido.
     Levanta ValueError se os campos não forem encontrados.
     """
-    texto = _extrair_texto_pdf_pypdf(file_bytes)
-    if not texto:
-        raise ValueError("Não foi possível extrair texto do PDF (PyPDF).")
+    if not documento.texto:
+        raise ValueError("Não foi possível extrair texto do PDF.")
 
-    # Extrair Data Limite (Específico: "Data da chamada")
-    match_data = re.search(r"Data da chamada\s*[:\-]?\s*(\d{2}/\d{2}/\d{4})", texto, re.IGNORECASE)
-    if not match_data:
+    if not documento.data_chamada:
         raise ValueError("Não foi possível localizar a 'Data da chamada' no PDF.")
 
-    data_iso = _formatar_data_iso(match_data.group(1))
-    return data_iso
+    return documento.data_chamada
 
-def extrair_dados_entrada_local(file_bytes: bytes) -> Tuple[str, str]:
+def extrair_dados_entrada_local(documento: DocumentoPdf) -> Tuple[str, str]:
     """
-    Extrai localmente (data_entrega_iso, ponto_venda_id) de uma Entrada.
+    Retorna (data_entrega_iso, ponto_venda_id) de uma Entrada a partir do documento já lido.
     Levanta ValueError se os campos não forem encontrados.
     """
-    texto = _extrair_texto_pdf_pypdf(file_bytes)
-    if not texto:
-        raise ValueError("Não foi possível extrair texto do PDF (PyPDF).")
-
-    # 1. Extrair Data de Entrega (Genérico: "Data :")
-    # (Tenta evitar "Data da chamada" que é da devolução)
-    match_data = None
-    # Procura por "Data :" em linhas que não contenham "chamada"
-    for line in texto.split('\n'):
-        if "chamada" not in line.lower():
-            # \bData = "boundary" Data, evita "Candidata"
-            match = re.search(r"\bData\s*[:\-]?\s*(\d{2}/\d{2}/\d{4})", line, re.IGNORECASE)
-            if match:
-                match_data = match
-                break
-
-    if not match_data:
-        raise ValueError("Não foi possível localizar a 'Data' de entrega no PDF.")
+    if not documento.texto:
+        raise ValueError("Não foi possível extrair texto do PDF.")
 
-    data_iso = _formatar_data_iso(match_data.group(1))
+    if not documento.data:
+        raise ValueError("Não foi possível localizar a 'Data' de entrega no PDF.")
 
-    # 2. Extrair Ponto de Venda
-    pdv = _extrair_pdv(texto)
-    if not pdv:
+    if not documento.ponto_venda:
          raise ValueError("Não foi possível localizar o 'Ponto de Venda' no PDF.")
 
-    return (data_iso, pdv)
\ No newline at end of file
+    return (documento.data, documento.ponto_venda)
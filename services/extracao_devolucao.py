@@ -2,54 +2,28 @@ import json
 import re
 from typing import Optional
 # from pypdf import PdfReader
-import pdfplumber
-import google.generativeai as genai
 from settings.settings import importar_configs
-from io import BytesIO
-from fastapi.concurrency import run_in_threadpool
+from services.extracao import DocumentoPdf, completar_documento
+from services.parser_local import interpretar_chamada_devolucao, VERSAO_PARSER
+from services.processamento_pdf import executar_em_processo
+from services.cache_extracao import cache_extracao, chave_cache, versao_extracao
+from models.extracao_model import RespostaDevolucaoIA, ADAPTADOR_CHAMADA_DEVOLUCAO, ADAPTADOR_REVISTA_DEVOLUCAO, validar_resposta
+from services.llm import cliente_llm
+from services.compactacao import colapsar_espacos, texto_para_ia, VERSAO_COMPACTACAO
+from services.extracao_partes import extrair_em_partes
 
 st = importar_configs()
 
 PROMPT_INSTRUCOES = """
 Você é um extrator de dados. Dado um texto bruto (OCR) de uma “Chamada de Encalhe”,
-retorne APENAS um JSON válido (sem comentários, sem texto extra) com duas chaves:
-"chamadasdevolucao" e "revistas". Não invente dados; se faltar, use null.
-
-Esquema de saída:
-
-{
-  "chamadasdevolucao": {
-    "id_chamada_devolucao": null,
-    "id_usuario": null,
-    "ponto_venda_id": "string|null",
-    "data_limite": "YYYY-MM-DD|null",
-    "url_documento": "string|null",
-    "status": "string|null"
-  },
-  "revistas": [
-    {
-      "id_revista": null,
-      "nome": "string",
-      "apelido_revista": null,
-      "numero_edicao": int|null,
-      "codigo_barras": "string|null",
-      "data_entrega": "YYYY-MM-DD|null",
-      "qtd_estoque": 0,
-      "preco_capa": 0,
-      "preco_liquido": 0,
-      "url_revista": null
-    }
-  ]
-}
+retorne o JSON no esquema da resposta, com duas chaves: "chamadasdevolucao" e "revistas".
+Não invente dados; se faltar, omita o campo.
 
 REGRAS:
 - Cabeçalho → chamadasdevolucao:
   - ponto_venda_id: identificador do PDV. Preferência: texto após “Ponto :”.
     Se ausente, use o nome do estabelecimento (ex.: “Andea Bloise”).
   - data_limite: valor após “Data da chamada :” (DD/MM/AAAA) → ISO YYYY-MM-DD.
-  - url_documento: null
-  - status: "pendente"
-  - id_chamada_devolucao, id_usuario: null
 - Tabela → revistas (uma entrada por produto):
   - nome: título do produto (ignore linhas de categoria/autores/variante)
   - numero_edicao: coluna “Edição”; caso não tenha edição, null
@@ -58,7 +32,6 @@ REGRAS:
   - qtd_estoque: valor da coluna “Rep”
   - preco_capa: coluna “Pço.Capa” (converter 13,90 → 13.90)
   - preco_liquido: coluna “Pço.Liq.” (converter vírgula → ponto)
-  - url_revista: null
 - Ignore campos que não existem no banco (Encalhe, Venda, Vlr.Venda, categoria/autores/variantes).
 - Datas: DD/MM/AAAA → YYYY-MM-DD
 - Números: usar ponto como decimal, sem separador de milhar
@@ -89,75 +62,77 @@ REGRAS:
 #         print(f"[ERRO] Falha ao ler PDF: {e}")
 #         return None
 
-def extrair_texto_pdf_bytes(file_bytes: bytes) -> Optional[str]:
-    """Extrai texto de todas as páginas de um PDF a partir de um arquivo binário."""
-    texto = []
-    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            # layout=True preserva espaços entre colunas
-            texto_page = page.extract_text(layout=True) or ""
-            texto.append(texto_page)
-    return "\n".join(texto).strip()
-
-def chamar_gemini_sync(texto_bruto: str) -> str:
-    """Versão síncrona da chamada à API Gemini."""
-    genai.configure(api_key=st.API_KEY)
-    model = genai.GenerativeModel(
-        st.MODEL_NAME,
-        generation_config={"response_mime_type": "application/json"},
-    )
-    content = f"{PROMPT_INSTRUCOES}\n\nTEXTO BRUTO A PROCESSAR:\n---\n{texto_bruto}\n---"
-    resp = model.generate_content(content)
-    return (resp.text or "").strip()
-
 async def chamar_gemini(texto_bruto: str) -> str:
-    """Wrapper assíncrono que roda a versão síncrona em uma thread separada."""
-    return await run_in_threadpool(chamar_gemini_sync, texto_bruto)
+    """Envia o texto ao Gemini pelo cliente compartilhado (services.llm: concorrência, prazo, novas tentativas e circuito)."""
+    content = f"{PROMPT_INSTRUCOES}\n\nTEXTO BRUTO A PROCESSAR:\n---\n{texto_bruto}\n---"
+    return await cliente_llm.gerar(content, RespostaDevolucaoIA)
 
-def normalizar_tipos(dados: dict) -> dict:
-    """Converte strings 'null' -> None, números em string -> int/float."""
-    def conv(v):
-        if isinstance(v, str):
-            v_strip = v.strip().lower()
-            if v_strip in {"null", "none", ""}:
-                return None
-            # tenta int
-            if v.isdigit():
-                return int(v)
-            # tenta float com ponto
-            try:
-                return float(v)
-            except ValueError:
-                return v
-        elif isinstance(v, list):
-            return [conv(x) for x in v]
-        elif isinstance(v, dict):
-            return {k: conv(x) for k, x in v.items()}
-        return v
-    return conv(dados)
+def validar_dados(dados: dict) -> dict:
+    """
+    Valida e converte os tipos (str -> int/float, "48507" -> PDV); descarta campos fora do esquema.
+    Só o cabeçalho inválido derruba a extração: revistas inválidas vão para "linhas_invalidas".
+    """
+    try:
+        return validar_resposta(dados, "chamadasdevolucao", ADAPTADOR_CHAMADA_DEVOLUCAO, ADAPTADOR_REVISTA_DEVOLUCAO)
+    except ValueError as e:
+        raise ValueError(f"Dados extraídos fora do esquema esperado: {e}")
 
 def parse_json_resposta(s: str) -> dict:
     s = re.sub(r"^(?:json)?\s*|\s*$", "", s, flags=re.IGNORECASE | re.DOTALL).strip()
     try:
-        data = json.loads(s)
-    except json.JSONDecodeError as e:
+        return validar_resposta(json.loads(s), "chamadasdevolucao", ADAPTADOR_CHAMADA_DEVOLUCAO, ADAPTADOR_REVISTA_DEVOLUCAO)
+    except ValueError as e:
         trecho = s[:1000]
-        raise ValueError(f"Resposta não é JSON válido.\nErro: {e}\nTrecho inicial:\n{trecho}\n")
-    if not isinstance(data, dict) or "chamadasdevolucao" not in data or "revistas" not in data:
-        raise ValueError("JSON não contém as chaves necessárias: 'chamadasdevolucao' e 'revistas'.")
-    
-    return normalizar_tipos(data)
-    
+        raise ValueError(f"Resposta da IA fora do esquema esperado ('chamadasdevolucao' e 'revistas'): {e}\nTrecho inicial:\n{trecho}\n")
+
 # Função de extração
-async def processar_pdf_para_json(file_bytes: bytes) -> dict:
+async def _extrair_json(documento: DocumentoPdf) -> dict:
     """
-    Função principal: recebe PDF binário, processa e retorna JSON estruturado.
+    Recebe o PDF já lido por completo e retorna JSON estruturado.
+    O parser local resolve as linhas da tabela (com os reparos de Rep/preço); o Gemini recebe só as linhas
+    que ele não resolveu, ou o documento inteiro se o cabeçalho/tabela não forem encontrados.
     """
-    texto = extrair_texto_pdf_bytes(file_bytes)
+    texto = documento.texto
     if not texto:
         raise ValueError("[ERRO] Sem texto para processar.")
 
-    resposta = await chamar_gemini(texto)
-    dados = parse_json_resposta(resposta)
-    print(dados)
-    return dados
\ No newline at end of file
+    resultado_local = interpretar_chamada_devolucao(documento)
+    if resultado_local.confianca == 0:
+        print(f"[INFO] Parser local não reconheceu a chamada, usando a IA. Avisos: {resultado_local.avisos[:5]}")
+        dados = await extrair_em_partes(texto_para_ia(documento.paginas), chamar_gemini, parse_json_resposta, "chamadasdevolucao")
+        print(dados)
+        return dados
+
+    dados = resultado_local.dados
+    if resultado_local.pendentes:
+        print(f"[INFO] Chamada interpretada localmente (confiança {resultado_local.confianca}); {len(resultado_local.pendentes)} linha(s) enviadas à IA.")
+        texto_pendente = "\n".join([resultado_local.contexto, *resultado_local.pendentes])
+        if st.PROMPT_COMPACTAR:
+            texto_pendente = colapsar_espacos(texto_pendente)
+        dados_ia = parse_json_resposta(await chamar_gemini(texto_pendente))
+        dados["revistas"].extend(dados_ia.get("revistas") or [])
+        dados["linhas_invalidas"] = dados_ia.get("linhas_invalidas") or []
+    else:
+        print("[INFO] Chamada interpretada localmente, sem IA.")
+    return validar_dados(dados)
+
+# Tudo que muda o JSON extraído; mudar qualquer parte invalida o cache
+VERSAO_EXTRACAO = versao_extracao(
+    "devolucao", PROMPT_INSTRUCOES, st.MODEL_NAME, VERSAO_PARSER, VERSAO_COMPACTACAO, st.PROMPT_COMPACTAR, st.LLM_PAGINAS_POR_PARTE
+)
+
+async def processar_pdf_para_json(documento: DocumentoPdf, file_bytes: bytes) -> dict:
+    """
+    Função principal: recebe o PDF (já com o cabeçalho lido na pré-verificação) e retorna JSON estruturado.
+    O mesmo PDF enviado de novo vem do cache de extração, sem ler o restante das páginas nem chamar a IA.
+    """
+    chave = chave_cache(file_bytes, VERSAO_EXTRACAO)
+    dados = await cache_extracao.obter(chave)
+    if dados is not None:
+        print("[INFO] Extração encontrada no cache.")
+        return dados
+
+    documento = await executar_em_processo(completar_documento, file_bytes, documento)
+    dados = await _extrair_json(documento)
+    await cache_extracao.guardar(chave, dados)
+    return dados
@@ -1,41 +1,24 @@
 import json
 import re
-from typing import Optional
-import pdfplumber
-import google.generativeai as genai
+from typing import Callable, Optional
 from settings.settings import importar_configs
-from io import BytesIO
-from fastapi.concurrency import run_in_threadpool
+from services.extracao import DocumentoPdf, completar_documento
+from services.parser_local import interpretar_nota_entrega, VERSAO_PARSER
+from services.processamento_pdf import executar_em_processo
+from services.cache_extracao import cache_extracao, chave_cache, versao_extracao
+from pydantic import ValidationError
+from models.extracao_model import RespostaEntradaIA, ADAPTADOR_NOTA_ENTREGA, ADAPTADOR_REVISTA_ENTREGA, validar_resposta
+from services.llm import cliente_llm
+from services.compactacao import colapsar_espacos, texto_para_ia, VERSAO_COMPACTACAO
+from services.extracao_partes import extrair_em_partes
+from services.json_incremental import LeitorJsonIncremental
 
 st = importar_configs()
 
 PROMPT_INSTRUCOES = """
 Você é um extrator de dados. Dado um texto bruto (OCR) de uma “Chamada de Encalhe”,
-retorne APENAS um JSON válido (sem comentários, sem texto extra) com duas chaves:
-"notasentrega" e "revistas". Não invente dados; se faltar, use null.
-
-Esquema de saída:
-
-{
-  "notasentrega": {
-    "id_nota_entrega": null,
-    "id_usuario": null,
-    "ponto_venda_id": "string|null",
-    "nota_entrega_id": "string|null",
-    "data": "YYYY-MM-DD|null",
-    "url_documento": "string|null"
-  },
-  "revistas": [
-    {
-      "id_revista": null,
-      "nome": "string",
-      "numero_edicao": int|null,
-      "qtd_estoque": 0,
-      "preco_capa": 0,
-      "url_revista": null
-    }
-  ]
-}
+retorne o JSON no esquema da resposta, com duas chaves: "notasentrega" e "revistas".
+Não invente dados; se faltar, omita o campo.
 
 REGRAS:
 - Cabeçalho → notasentrega:
@@ -44,14 +27,11 @@ REGRAS:
     Se ausente, use o nome do estabelecimento (ex.: “Andea Bloise”).
     OBS: o identificador da nota de entrega não é igual ao do ponto de venda.
   - data: valor após “Data :” (DD/MM/AAAA) → ISO YYYY-MM-DD.
-  - url_documento: null
-  - id_nota_entrega, id_usuario: null
 - Tabela → revistas (uma entrada por produto):
   - nome: título do produto (ignore linhas de categoria/autores/variante)
   - numero_edicao: coluna “Edição”
   - qtd_estoque: valor da coluna "Quant.”
   - preco_capa: coluna “Pço.Capa” (converter 13,90 → 13.90)
-  - url_revista: null
 - Ignore campos que não existem no banco (Encalhe, Venda, Vlr.Venda, categoria/autores/variantes).
 - Datas: DD/MM/AAAA → YYYY-MM-DD
 - Números: usar ponto como decimal, sem separador de milhar
@@ -65,75 +45,113 @@ REGRAS:
 - Retorne SOMENTE o JSON.
 """
 
-def extrair_texto_pdf_bytes(file_bytes: bytes) -> Optional[str]:
-    """Extrai texto de todas as páginas de um PDF a partir de um arquivo binário."""
-    texto = []
-    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            # layout=True preserva espaços entre colunas
-            texto_page = page.extract_text(layout=True) or ""
-            texto.append(texto_page)
-    return "\n".join(texto).strip()
-
-def chamar_gemini_sync(texto_bruto: str) -> str:
-    """Versão síncrona da chamada à API Gemini."""
-    genai.configure(api_key=st.API_KEY)
-    model = genai.GenerativeModel(
-        st.MODEL_NAME,
-        generation_config={"response_mime_type": "application/json"},
-    )
-    content = f"{PROMPT_INSTRUCOES}\n\nTEXTO BRUTO A PROCESSAR:\n---\n{texto_bruto}\n---"
-    resp = model.generate_content(content)
-    return (resp.text or "").strip()
+def _montar_conteudo(texto_bruto: str) -> str:
+    return f"{PROMPT_INSTRUCOES}\n\nTEXTO BRUTO A PROCESSAR:\n---\n{texto_bruto}\n---"
 
 async def chamar_gemini(texto_bruto: str) -> str:
-    """Wrapper assíncrono que roda a versão síncrona em uma thread separada."""
-    return await run_in_threadpool(chamar_gemini_sync, texto_bruto)
+    """Envia o texto ao Gemini pelo cliente compartilhado (services.llm: concorrência, prazo, novas tentativas e circuito)."""
+    return await cliente_llm.gerar(_montar_conteudo(texto_bruto), RespostaEntradaIA)
 
-def normalizar_tipos(dados: dict) -> dict:
-    """Converte strings 'null' -> None, números em string -> int/float."""
-    def conv(v):
-        if isinstance(v, str):
-            v_strip = v.strip().lower()
-            if v_strip in {"null", "none", ""}:
-                return None
-            # tenta int
-            if v.isdigit():
-                return int(v)
-            # tenta float com ponto
-            try:
-                return float(v)
-            except ValueError:
-                return v
-        elif isinstance(v, list):
-            return [conv(x) for x in v]
-        elif isinstance(v, dict):
-            return {k: conv(x) for k, x in v.items()}
-        return v
-    return conv(dados)
+def chamar_gemini_fluxo(texto_bruto: str):
+    """Como chamar_gemini, mas a resposta chega aos pedaços (async iterator de str)."""
+    return cliente_llm.gerar_fluxo(_montar_conteudo(texto_bruto), RespostaEntradaIA)
+
+def validar_dados(dados: dict) -> dict:
+    """
+    Valida e converte os tipos (str -> int/float, "48507" -> PDV); descarta campos fora do esquema.
+    Só o cabeçalho inválido derruba a extração: revistas inválidas vão para "linhas_invalidas".
+    """
+    try:
+        return validar_resposta(dados, "notasentrega", ADAPTADOR_NOTA_ENTREGA, ADAPTADOR_REVISTA_ENTREGA)
+    except ValueError as e:
+        raise ValueError(f"Dados extraídos fora do esquema esperado: {e}")
 
 def parse_json_resposta(s: str) -> dict:
     s = re.sub(r"^(?:json)?\s*|\s*$", "", s, flags=re.IGNORECASE | re.DOTALL).strip()
     try:
-        data = json.loads(s)
-    except json.JSONDecodeError as e:
+        return validar_resposta(json.loads(s), "notasentrega", ADAPTADOR_NOTA_ENTREGA, ADAPTADOR_REVISTA_ENTREGA)
+    except ValueError as e:
         trecho = s[:1000]
-        raise ValueError(f"Resposta não é JSON válido.\nErro: {e}\nTrecho inicial:\n{trecho}\n")
-    if not isinstance(data, dict) or "notasentrega" not in data or "revistas" not in data:
-        raise ValueError("JSON não contém as chaves necessárias: 'notasentrega' e 'revistas': ", data)
-    
-    return normalizar_tipos(data)
-    
+        raise ValueError(f"Resposta da IA fora do esquema esperado ('notasentrega' e 'revistas'): {e}\nTrecho inicial:\n{trecho}\n")
+
+async def _extrair_em_fluxo(texto: str, ao_receber_revista: Callable[[dict], None]) -> dict:
+    """
+    Uma chamada só, com a resposta lida aos pedaços: cada revista é validada e entregue a 'ao_receber_revista'
+    assim que fecha no JSON, enquanto o modelo ainda gera as seguintes. Uma revista inválida não é entregue
+    e, no fim, aparece em "linhas_invalidas"; só o cabeçalho inválido derruba a extração
+    (e quem recebeu as linhas desfaz o que fez).
+    """
+    leitor = LeitorJsonIncremental("revistas")
+    async for pedaco in chamar_gemini_fluxo(texto):
+        for revista in leitor.alimentar(pedaco):
+            try:
+                ao_receber_revista(ADAPTADOR_REVISTA_ENTREGA.validate_python(revista).model_dump())
+            except ValidationError:
+                pass
+    return parse_json_resposta(leitor.texto)
+
 # Função de extração
-async def processar_pdf_para_json(file_bytes: bytes) -> dict:
+async def _extrair_json(documento: DocumentoPdf, ao_receber_revista: Optional[Callable[[dict], None]] = None) -> dict:
     """
-    Função principal: recebe PDF binário, processa e retorna JSON estruturado.
+    Recebe o PDF já lido por completo e retorna JSON estruturado.
+    Tenta primeiro o parser local (colunas fixas da nota); o Gemini recebe o documento inteiro se a confiança
+    ficar abaixo de PARSER_CONFIANCA_MINIMA, ou só as linhas que o parser não leu (com o cabeçalho como contexto).
+    Essas linhas ficam em "linhas_nao_lidas", e as que a IA devolveu fora do esquema em "linhas_invalidas",
+    para a rota avisar o usuário em 'erros'.
+    Com LLM_STREAMING e 'ao_receber_revista', a resposta da IA é lida em fluxo (ver _extrair_em_fluxo).
     """
-    texto = extrair_texto_pdf_bytes(file_bytes)
+    texto = documento.texto
     if not texto:
         raise ValueError("[ERRO] Sem texto para processar.")
 
-    resposta = await chamar_gemini(texto)
-    dados = parse_json_resposta(resposta)
+    resultado_local = interpretar_nota_entrega(documento)
+    if resultado_local.confianca >= st.PARSER_CONFIANCA_MINIMA:
+        dados = resultado_local.dados
+        if resultado_local.pendentes:
+            print(f"[INFO] Nota de entrega interpretada localmente (confiança {resultado_local.confianca}); {len(resultado_local.pendentes)} linha(s) enviadas à IA.")
+            texto_pendente = "\n".join([resultado_local.contexto, *resultado_local.pendentes])
+            if st.PROMPT_COMPACTAR:
+                texto_pendente = colapsar_espacos(texto_pendente)
+            dados_ia = parse_json_resposta(await chamar_gemini(texto_pendente))
+            dados["revistas"].extend(dados_ia.get("revistas") or [])
+            dados["linhas_invalidas"] = dados_ia.get("linhas_invalidas") or []
+        else:
+            print(f"[INFO] Nota de entrega interpretada localmente (confiança {resultado_local.confianca}).")
+        dados = validar_dados(dados)
+        dados["linhas_nao_lidas"] = resultado_local.pendentes
+        return dados
+    print(f"[INFO] Parser local com confiança {resultado_local.confianca}, usando a IA. Avisos: {resultado_local.avisos[:5]}")
+
+    compactado = texto_para_ia(documento.paginas)
+    if st.LLM_STREAMING and ao_receber_revista is not None:
+        dados = await _extrair_em_fluxo(compactado.texto, ao_receber_revista)
+    else:
+        dados = await extrair_em_partes(compactado, chamar_gemini, parse_json_resposta, "notasentrega")
     print(dados)
-    return dados
\ No newline at end of file
+    return dados
+
+# Tudo que muda o JSON extraído; mudar qualquer parte invalida o cache
+VERSAO_EXTRACAO = versao_extracao(
+    "entrada", PROMPT_INSTRUCOES, st.MODEL_NAME, VERSAO_PARSER, st.PARSER_CONFIANCA_MINIMA,
+    VERSAO_COMPACTACAO, st.PROMPT_COMPACTAR, st.LLM_PAGINAS_POR_PARTE, st.LLM_STREAMING,
+)
+
+async def processar_pdf_para_json(
+    documento: DocumentoPdf, file_bytes: bytes, ao_receber_revista: Optional[Callable[[dict], None]] = None
+) -> dict:
+    """
+    Função principal: recebe o PDF (já com o cabeçalho lido na pré-verificação) e retorna JSON estruturado.
+    O mesmo PDF enviado de novo vem do cache de extração, sem ler o restante das páginas nem chamar a IA.
+    'ao_receber_revista' só é chamado quando a resposta da IA é lida em fluxo; nos outros caminhos
+    (cache, parser local) as revistas vêm apenas no retorno.
+    """
+    chave = chave_cache(file_bytes, VERSAO_EXTRACAO)
+    dados = await cache_extracao.obter(chave)
+    if dados is not None:
+        print("[INFO] Extração encontrada no cache.")
+        return dados
+
+    documento = await executar_em_processo(completar_documento, file_bytes, documento)
+    dados = await _extrair_json(documento, ao_receber_revista)
+    await cache_extracao.guardar(chave, dados)
+    return dados
@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+T = TypeVar("T")
+
+
+async def extrair_durante_verificacao(verificacao: Awaitable[None], extracao: Awaitable[T]) -> "asyncio.Future[T]":
+    """
+    Extração especulativa: começa a extração (leitura das páginas, IA) junto com a verificação de duplicata,
+    em vez de esperar por ela. Se a verificação falhar (duplicata, erro no banco), a extração é cancelada
+    e o erro da verificação é repassado; se passar, retorna a extração ainda em andamento para quem chamou aguardar.
+
+    Custo: cancelar só abandona o await. O que já está rodando fora do event loop vai até o fim:
+    a leitura das páginas no pool de processos e a chamada à IA na thread do ClienteLLM (com streaming,
+    a thread para no próximo pedaço). Então um duplicado recusado ainda pode ocupar uma vaga de
+    LLM_MAX_CONCORRENCIA e ser cobrado pela IA; com EXTRACAO_ESPECULATIVA=False isso não acontece.
+    """
+    tarefa = asyncio.ensure_future(extracao)
+    try:
+        await verificacao
+    except BaseException:
+        tarefa.cancel()
+        # Se a extração já tinha terminado com erro, ele não interessa mais (vale o da verificação)
+        tarefa.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise
+    return tarefa
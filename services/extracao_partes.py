@@ -0,0 +1,87 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from settings.settings import importar_configs
+from services.compactacao import TextoCompactado
+
+st = importar_configs()
+
+
+def _juntar_cabecalho(destino: Dict[str, Any], origem: Dict[str, Any]):
+    """Campos do cabeçalho: vale o primeiro valor não nulo (as partes seguintes podem não ter visto o cabeçalho inteiro)."""
+    for campo, valor in (origem or {}).items():
+        if destino.get(campo) is None:
+            destino[campo] = valor
+
+
+def _normalizar(texto: str) -> str:
+    return " ".join(str(texto or "").split()).lower()
+
+
+def juntar_partes(
+    resultados: List[Dict[str, Any]],
+    chave_cabecalho: str,
+    cabecalho: str = "",
+    textos_partes: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Junta os JSONs das partes na ordem do documento. As partes só se sobrepõem no cabeçalho do documento,
+    que vai repetido em todas: uma revista lida dele (nome presente em 'cabecalho' e ausente das linhas
+    de produtos da parte, 'textos_partes') entra uma vez só. Revistas iguais vindas das linhas de produtos
+    de partes diferentes são páginas diferentes e ficam todas; repetições dentro da mesma parte também.
+    """
+    cabecalho_normalizado = _normalizar(cabecalho)
+    cabecalho_documento: Dict[str, Any] = {}
+    revistas: List[Dict[str, Any]] = []
+    linhas_invalidas: List[Dict[str, Any]] = []
+    vistas: Dict[str, int] = {}
+    for parte, dados in enumerate(resultados):
+        _juntar_cabecalho(cabecalho_documento, dados.get(chave_cabecalho))
+        linhas_invalidas.extend(dados.get("linhas_invalidas") or [])
+        texto_parte = _normalizar(textos_partes[parte]) if textos_partes else None
+        for revista in dados.get("revistas") or []:
+            nome = _normalizar(revista.get("nome"))
+            if texto_parte is not None and nome and nome in cabecalho_normalizado and nome not in texto_parte:
+                chave = json.dumps(revista, sort_keys=True, ensure_ascii=False)
+                if vistas.setdefault(chave, parte) != parte:
+                    continue
+            revistas.append(revista)
+    return {chave_cabecalho: cabecalho_documento, "revistas": revistas, "linhas_invalidas": linhas_invalidas}
+
+
+async def extrair_em_partes(
+    compactado: TextoCompactado,
+    chamar_gemini: Callable[[str], Awaitable[str]],
+    parse_json_resposta: Callable[[str], Dict[str, Any]],
+    chave_cabecalho: str,
+) -> Dict[str, Any]:
+    """
+    Documentos longos: o cabeçalho vai em todas as partes e as páginas da tabela são divididas
+    em grupos de LLM_PAGINAS_POR_PARTE, extraídos em paralelo (até LLM_PARTES_SIMULTANEAS por documento,
+    além do limite global do cliente de IA). A latência passa a ser a da maior parte, não a do documento.
+    Com uma parte só, é a chamada única de sempre.
+    """
+    partes = compactado.partes(st.LLM_PAGINAS_POR_PARTE)
+    if len(partes) == 1:
+        return parse_json_resposta(await chamar_gemini(partes[0]))
+
+    print(f"[INFO] Documento dividido em {len(partes)} partes para a IA.")
+    vagas = asyncio.Semaphore(max(1, st.LLM_PARTES_SIMULTANEAS))
+
+    async def extrair(texto: str) -> Dict[str, Any]:
+        async with vagas:
+            return parse_json_resposta(await chamar_gemini(texto))
+
+    tarefas = [asyncio.ensure_future(extrair(p)) for p in partes]
+    try:
+        resultados = await asyncio.gather(*tarefas)
+    except BaseException:
+        # Falha em uma parte derruba o documento inteiro: não adianta esperar (nem pagar) as demais
+        for tarefa in tarefas:
+            tarefa.cancel()
+        raise
+    # Cada parte é o cabeçalho seguido das suas linhas de produtos (TextoCompactado.partes)
+    textos_partes = [parte[len(compactado.cabecalho):] for parte in partes]
+    return juntar_partes(resultados, chave_cabecalho, compactado.cabecalho, textos_partes)
+
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import HTTPException, status
+
+from settings.settings import importar_configs
+
+st = importar_configs()
+
+# Situação de um job
+NA_FILA = "na_fila"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+
+@dataclass
+class Job:
+    """Processamento de um PDF enviado, acompanhado por GET /jobs/{id_job}."""
+    id_job: str
+    tipo: str
+    id_usuario: str
+    chave: Optional[str] = None            # Identifica o documento (ex.: entrega + data) enquanto o job estiver ativo
+    situacao: str = NA_FILA
+    etapa: str = "Aguardando processamento"
+    progresso: float = 0.0                 # 0 a 1
+    resultado: Optional[Dict[str, Any]] = None
+    erro: Optional[Dict[str, Any]] = None  # {"status_code", "detail"}, no mesmo formato das rotas síncronas
+    criado_em: float = field(default_factory=time.time)
+    atualizado_em: float = field(default_factory=time.time)
+
+    @property
+    def ativo(self) -> bool:
+        return self.situacao in (NA_FILA, PROCESSANDO)
+
+    def avancar(self, etapa: str, progresso: float):
+        """Registra a etapa atual (chamado pelo próprio processamento)."""
+        self.etapa = etapa
+        self.progresso = progresso
+        self.atualizado_em = time.time()
+
+    def finalizar(self, situacao: str, erro: Optional[Dict[str, Any]] = None):
+        """Encerra o job (CONCLUIDO ou ERRO); atualizado_em marca o fim, de onde conta JOBS_RETENCAO_SEGUNDOS."""
+        self.situacao = situacao
+        self.erro = erro
+        self.atualizado_em = time.time()
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "id_job": self.id_job,
+            "tipo": self.tipo,
+            "status": self.situacao,
+            "etapa": self.etapa,
+            "progresso": round(self.progresso, 2),
+            "resultado": self.resultado,
+            "erro": self.erro,
+            "criado_em": self.criado_em,
+            "atualizado_em": self.atualizado_em,
+        }
+
+
+def registrar_etapa(job: Optional[Job], etapa: str, progresso: float):
+    """Atualiza a etapa quando o processamento roda como job (nas rotas síncronas, job é None)."""
+    if job is not None:
+        job.avancar(etapa, progresso)
+
+
+Processamento = Callable[[Job], Awaitable[Dict[str, Any]]]
+
+
+class GerenciadorJobs:
+    """
+    Fila local dos uploads processados em segundo plano.
+    - Os jobs ficam em memória, no processo que recebeu o upload (com vários workers do uvicorn,
+      a consulta precisa cair no mesmo processo).
+    - No máximo JOBS_MAX_SIMULTANEOS processamentos rodam ao mesmo tempo; os demais esperam na fila.
+    - Jobs terminados são descartados JOBS_RETENCAO_SEGUNDOS depois.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._tarefas: Set[asyncio.Task] = set()
+        self._vagas: Optional[asyncio.Semaphore] = None
+
+    def _limpar_antigos(self):
+        limite = time.time() - st.JOBS_RETENCAO_SEGUNDOS
+        for id_job in [j.id_job for j in self._jobs.values() if not j.ativo and j.atualizado_em < limite]:
+            del self._jobs[id_job]
+
+    def obter(self, id_job: str, id_usuario: str) -> Optional[Job]:
+        """Retorna o job se ele existir e pertencer ao usuário."""
+        self._limpar_antigos()
+        job = self._jobs.get(id_job)
+        return job if job is not None and job.id_usuario == id_usuario else None
+
+    def ativo_com_chave(self, chave: str) -> bool:
+        """Há um job na fila ou em andamento para o mesmo documento? (a pré-verificação no banco ainda não o vê)"""
+        return any(j.ativo and j.chave == chave for j in self._jobs.values())
+
+    def enfileirar(self, tipo: str, id_usuario: str, processamento: Processamento, chave: Optional[str] = None) -> Job:
+        """Cria o job e agenda o processamento; retorna na hora."""
+        self._limpar_antigos()
+        if self._vagas is None:
+            self._vagas = asyncio.Semaphore(st.JOBS_MAX_SIMULTANEOS)
+
+        job = Job(id_job=uuid.uuid4().hex, tipo=tipo, id_usuario=id_usuario, chave=chave)
+        self._jobs[job.id_job] = job
+        tarefa = asyncio.create_task(self._executar(job, processamento))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+        return job
+
+    async def _executar(self, job: Job, processamento: Processamento):
+        # Todo ramo termina em job.finalizar, inclusive o cancelamento ainda na fila
+        try:
+            async with self._vagas:
+                job.situacao = PROCESSANDO
+                job.avancar("Iniciando", 0.0)
+                job.resultado = await processamento(job)
+            job.avancar("Concluído", 1.0)
+            job.finalizar(CONCLUIDO)
+        except HTTPException as e:
+            job.finalizar(ERRO, {"status_code": e.status_code, "detail": e.detail})
+        except asyncio.CancelledError:
+            job.finalizar(ERRO, {"status_code": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": "Processamento interrompido (servidor encerrado)."})
+            raise
+        except Exception as e:
+            print(f"[ERRO] Job {job.id_job} ({job.tipo}) falhou: {e}")
+            job.finalizar(ERRO, {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": f"Erro inesperado no processamento: {e}"})
+
+    async def encerrar(self):
+        """Cancela os jobs pendentes (chamado no lifespan da aplicação)."""
+        for tarefa in list(self._tarefas):
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+
+
+gerenciador_jobs = GerenciadorJobs()
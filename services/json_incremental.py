@@ -0,0 +1,64 @@
+import json
+from typing import Any, Dict, List, Optional
+
+
+class LeitorJsonIncremental:
+    """
+    Lê o JSON da IA aos pedaços e devolve cada objeto da lista 'chave_lista' (no primeiro nível)
+    assim que ele fecha, sem esperar o resto da resposta. Só acompanha profundidade, strings e escapes;
+    o documento inteiro continua disponível em 'texto' para a validação final.
+    """
+
+    def __init__(self, chave_lista: str = "revistas"):
+        self._chave_lista = chave_lista
+        self._buffer = ""
+        self._pos = 0
+        self._profundidade = 0
+        self._em_string = False
+        self._escape = False
+        self._inicio_string = 0
+        self._ultima_chave: Optional[str] = None   # última string lida no primeiro nível (nome do campo)
+        self._na_lista = False
+        self._inicio_item = 0
+
+    @property
+    def texto(self) -> str:
+        return self._buffer
+
+    def alimentar(self, pedaco: str) -> List[Dict[str, Any]]:
+        """Acrescenta o pedaço e retorna os objetos da lista que ficaram completos com ele."""
+        self._buffer += pedaco
+        buffer = self._buffer
+        completos: List[Dict[str, Any]] = []
+
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._em_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._em_string = False
+                    if self._profundidade == 1:
+                        self._ultima_chave = buffer[self._inicio_string + 1:i]
+                continue
+
+            if c == '"':
+                self._em_string = True
+                self._inicio_string = i
+            elif c in "{[":
+                self._profundidade += 1
+                if c == "[" and self._profundidade == 2 and self._ultima_chave == self._chave_lista:
+                    self._na_lista = True
+                elif c == "{" and self._na_lista and self._profundidade == 3:
+                    self._inicio_item = i
+            elif c in "}]":
+                if c == "}" and self._na_lista and self._profundidade == 3:
+                    completos.append(json.loads(buffer[self._inicio_item:i + 1]))
+                elif c == "]" and self._na_lista and self._profundidade == 2:
+                    self._na_lista = False
+                self._profundidade -= 1
+
+        self._pos = len(buffer)
+        return completos
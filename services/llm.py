@@ -0,0 +1,342 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Protocol, Tuple, Type
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from pydantic import BaseModel
+
+from settings.settings import importar_configs
+
+st = importar_configs()
+
+
+class ErroLLM(Exception):
+    """Falha ao obter resposta do modelo (depois das novas tentativas)."""
+
+
+class LLMIndisponivel(ErroLLM):
+    """Circuito aberto: o modelo falhou seguidamente e as chamadas estão sendo recusadas por um tempo."""
+
+
+class BackendLLM(Protocol):
+    """
+    Quem de fato gera o texto. O cliente só cuida de concorrência, prazo, novas tentativas e circuito,
+    então testes e desenvolvimento local podem trocar o backend (LLM_BACKEND=fixo, ou ClienteLLM.backend = ...).
+    """
+    erros_transitorios: Tuple[Type[BaseException], ...]
+
+    def gerar(self, conteudo: str, timeout: float, esquema: Optional[Type[BaseModel]] = None) -> str:
+        ...
+
+    def gerar_fluxo(self, conteudo: str, timeout: float, esquema: Optional[Type[BaseModel]] = None) -> Iterator[str]:
+        """Mesmo que gerar, mas devolve o texto aos pedaços, conforme o modelo gera."""
+        ...
+
+
+def _converter_esquema(no: Dict[str, Any], definicoes: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in no:
+        return _converter_esquema(definicoes[no["$ref"].rsplit("/", 1)[-1]], definicoes)
+    if "anyOf" in no:
+        # Optional[X] vira X com nullable
+        opcoes = [o for o in no["anyOf"] if o.get("type") != "null"]
+        esquema = _converter_esquema(opcoes[0], definicoes)
+        if len(opcoes) < len(no["anyOf"]):
+            esquema["nullable"] = True
+        return esquema
+
+    esquema: Dict[str, Any] = {"type": no["type"]}
+    if no["type"] == "object":
+        esquema["properties"] = {campo: _converter_esquema(valor, definicoes) for campo, valor in no["properties"].items()}
+        if no.get("required"):
+            esquema["required"] = list(no["required"])
+    elif no["type"] == "array":
+        esquema["items"] = _converter_esquema(no["items"], definicoes)
+    return esquema
+
+
+@lru_cache
+def esquema_gemini(modelo: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Converte o JSON Schema do modelo Pydantic para o subconjunto aceito em response_schema
+    ($ref resolvidos, Optional -> nullable, sem default/title). Campos com default não são obrigatórios,
+    então o modelo pode omiti-los em vez de repetir null em toda linha.
+    """
+    json_schema = modelo.model_json_schema()
+    return _converter_esquema(json_schema, json_schema.get("$defs", {}))
+
+
+class BackendGemini:
+    """Backend Gemini com configuração e modelo criados uma única vez (resposta em JSON)."""
+
+    erros_transitorios = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.TooManyRequests,
+        ConnectionError,
+    )
+
+    def __init__(self, api_key: str, model_name: str):
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(
+            model_name,
+            generation_config={"response_mime_type": "application/json"},
+        )
+
+    @staticmethod
+    def _configuracao(esquema: Optional[Type[BaseModel]]) -> Optional[Dict[str, Any]]:
+        if esquema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": esquema_gemini(esquema)}
+
+    @staticmethod
+    def _registrar_uso(resp):
+        uso = getattr(resp, "usage_metadata", None)
+        if uso is not None:
+            print(f"[INFO] IA: {uso.prompt_token_count} tokens de entrada, {uso.candidates_token_count} de saída.")
+
+    def gerar(self, conteudo: str, timeout: float, esquema: Optional[Type[BaseModel]] = None) -> str:
+        resp = self._model.generate_content(
+            conteudo, generation_config=self._configuracao(esquema), request_options={"timeout": timeout}
+        )
+        self._registrar_uso(resp)
+        return (resp.text or "").strip()
+
+    def gerar_fluxo(self, conteudo: str, timeout: float, esquema: Optional[Type[BaseModel]] = None) -> Iterator[str]:
+        resp = self._model.generate_content(
+            conteudo, generation_config=self._configuracao(esquema), request_options={"timeout": timeout}, stream=True
+        )
+        for pedaco in resp:
+            if pedaco.text:
+                yield pedaco.text
+        self._registrar_uso(resp)
+
+
+class BackendFixo:
+    """
+    Backend local para desenvolvimento e testes (LLM_BACKEND=fixo): não chama o Gemini.
+    Responde sempre o JSON de '<LLM_FIXTURES_DIR>/<NomeDoEsquema>.json' (ex.: RespostaEntradaIA.json),
+    qualquer que seja o conteúdo enviado; no fluxo, o mesmo texto sai em pedaços.
+    """
+
+    erros_transitorios: Tuple[Type[BaseException], ...] = ()
+    TAMANHO_PEDACO = 64
+
+    def __init__(self, diretorio: str):
+        self._diretorio = diretorio
+        self._respostas: Dict[str, str] = {}
+
+    def _resposta(self, esquema: Optional[Type[BaseModel]]) -> str:
+        nome = esquema.__name__ if esquema is not None else "texto"
+        if nome not in self._respostas:
+            caminho = os.path.join(self._diretorio, f"{nome}.json")
+            with open(caminho, encoding="utf-8") as arquivo:
+                self._respostas[nome] = arquivo.read().strip()
+        print(f"[INFO] IA (backend fixo): resposta de {nome}.json.")
+        return self._respostas[nome]
+
+    def gerar(self, conteudo: str, timeout: float, esquema: Optional[Type[BaseModel]] = None) -> str:
+        return self._resposta(esquema)
+
+    def gerar_fluxo(self, conteudo: str, timeout: float, esquema: Optional[Type[BaseModel]] = None) -> Iterator[str]:
+        resposta = self._resposta(esquema)
+        for inicio in range(0, len(resposta), self.TAMANHO_PEDACO):
+            yield resposta[inicio:inicio + self.TAMANHO_PEDACO]
+
+
+def criar_backend() -> BackendLLM:
+    """Backend escolhido em LLM_BACKEND: "gemini" (padrão) ou "fixo"."""
+    if st.LLM_BACKEND == "gemini":
+        return BackendGemini(st.API_KEY, st.MODEL_NAME)
+    if st.LLM_BACKEND == "fixo":
+        return BackendFixo(st.LLM_FIXTURES_DIR)
+    raise ValueError(f"LLM_BACKEND inválido: '{st.LLM_BACKEND}' (use 'gemini' ou 'fixo').")
+
+
+class ClienteLLM:
+    """
+    Cliente de longa duração para o modelo de linguagem.
+    - Executor próprio (não disputa o threadpool padrão do FastAPI com as rotas síncronas).
+    - No máximo LLM_MAX_CONCORRENCIA chamadas simultâneas; as demais esperam no event loop.
+    - Prazo de LLM_TIMEOUT_SEGUNDOS por tentativa e até LLM_TENTATIVAS tentativas com espera exponencial em erros transitórios.
+    - Circuito: após LLM_FALHAS_PARA_ABRIR falhas seguidas, recusa chamadas por LLM_CIRCUITO_SEGUNDOS;
+      depois disso uma única chamada de teste passa (meio-aberto): sucesso fecha o circuito, falha reabre.
+    """
+
+    def __init__(self, backend: Optional[BackendLLM] = None):
+        self._backend = backend
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._vagas: Optional[asyncio.Semaphore] = None
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+
+    @property
+    def backend(self) -> BackendLLM:
+        if self._backend is None:
+            self._backend = criar_backend()
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: BackendLLM):
+        self._backend = backend
+
+    def iniciar(self):
+        """Cria o executor dedicado (chamado no lifespan da aplicação)."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=st.LLM_MAX_CONCORRENCIA, thread_name_prefix="llm")
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _verificar_circuito(self) -> bool:
+        """
+        Retorna True se esta chamada é a de teste do circuito meio-aberto. Enquanto ela não termina,
+        as demais continuam recusadas, para não irem todas de uma vez a um backend que pode seguir fora.
+        """
+        if self._falhas_seguidas < st.LLM_FALHAS_PARA_ABRIR:
+            return False
+        if time.monotonic() < self._aberto_ate or self._testando:
+            raise LLMIndisponivel("Serviço de IA temporariamente indisponível. Tente novamente em instantes.")
+        self._testando = True
+        print("[INFO] Circuito da IA meio-aberto: enviando uma chamada de teste.")
+        return True
+
+    def _registrar_resultado(self, sucesso: bool):
+        if sucesso:
+            self._falhas_seguidas = 0
+            return
+        self._falhas_seguidas += 1
+        if self._falhas_seguidas >= st.LLM_FALHAS_PARA_ABRIR:
+            # Aberto (ou reaberto, se a chamada de teste após o intervalo também falhou)
+            self._aberto_ate = time.monotonic() + st.LLM_CIRCUITO_SEGUNDOS
+            print(f"[ERRO] Circuito da IA aberto por {st.LLM_CIRCUITO_SEGUNDOS:g}s após {self._falhas_seguidas} falhas seguidas.")
+
+    async def _tentar(self, conteudo: str, esquema: Optional[Type[BaseModel]]) -> str:
+        self.iniciar()
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._executor, self.backend.gerar, conteudo, st.LLM_TIMEOUT_SEGUNDOS, esquema),
+            timeout=st.LLM_TIMEOUT_SEGUNDOS,
+        )
+
+    @staticmethod
+    async def _esperar_nova_tentativa(tentativa: int):
+        espera = st.LLM_BACKOFF_SEGUNDOS * (2 ** (tentativa - 1))
+        await asyncio.sleep(espera + random.uniform(0, espera / 2))
+
+    @asynccontextmanager
+    async def _ocupar_vaga(self) -> AsyncIterator[None]:
+        teste = self._verificar_circuito()
+        if self._vagas is None:
+            self._vagas = asyncio.Semaphore(st.LLM_MAX_CONCORRENCIA)
+        try:
+            async with self._vagas:
+                yield
+        finally:
+            # O resultado da chamada de teste já fechou ou reabriu o circuito (_registrar_resultado);
+            # se ela terminou sem resultado (erro definitivo, cancelamento), a próxima chamada testa de novo
+            if teste:
+                self._testando = False
+
+    async def gerar(self, conteudo: str, esquema: Optional[Type[BaseModel]] = None) -> str:
+        """Envia o conteúdo ao modelo e retorna o texto da resposta (JSON no formato de 'esquema', se informado)."""
+        async with self._ocupar_vaga():
+            ultimo_erro: Optional[BaseException] = None
+            for tentativa in range(st.LLM_TENTATIVAS):
+                if tentativa:
+                    await self._esperar_nova_tentativa(tentativa)
+                try:
+                    resposta = await self._tentar(conteudo, esquema)
+                    self._registrar_resultado(True)
+                    return resposta
+                except (asyncio.TimeoutError, *self.backend.erros_transitorios) as e:
+                    ultimo_erro = e
+                    print(f"[ERRO] Falha transitória na IA (tentativa {tentativa + 1}/{st.LLM_TENTATIVAS}): {e!r}")
+                except Exception as e:
+                    # Erro definitivo (ex.: requisição inválida): não adianta repetir nem conta para o circuito
+                    raise ErroLLM(f"Falha ao chamar a IA: {e}") from e
+
+            self._registrar_resultado(False)
+            raise ErroLLM(f"A IA não respondeu após {st.LLM_TENTATIVAS} tentativas: {ultimo_erro!r}")
+
+    async def _tentar_fluxo(self, conteudo: str, esquema: Optional[Type[BaseModel]]) -> AsyncIterator[str]:
+        """
+        O iterador do SDK é bloqueante: roda numa thread do executor e entrega os pedaços ao event loop por uma fila.
+        O prazo de LLM_TIMEOUT_SEGUNDOS vale para a espera de cada pedaço.
+        """
+        self.iniciar()
+        loop = asyncio.get_running_loop()
+        fila: asyncio.Queue = asyncio.Queue()
+        fim = object()
+        interrompido = threading.Event()
+
+        def produzir():
+            try:
+                for texto in self.backend.gerar_fluxo(conteudo, st.LLM_TIMEOUT_SEGUNDOS, esquema):
+                    if interrompido.is_set():
+                        return
+                    loop.call_soon_threadsafe(fila.put_nowait, texto)
+                loop.call_soon_threadsafe(fila.put_nowait, fim)
+            except Exception as e:
+                if not interrompido.is_set():
+                    loop.call_soon_threadsafe(fila.put_nowait, e)
+
+        loop.run_in_executor(self._executor, produzir)
+        try:
+            while True:
+                item = await asyncio.wait_for(fila.get(), timeout=st.LLM_TIMEOUT_SEGUNDOS)
+                if item is fim:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Quem consome desistiu (erro ou cancelamento): a thread para no próximo pedaço
+            interrompido.set()
+
+    async def gerar_fluxo(self, conteudo: str, esquema: Optional[Type[BaseModel]] = None) -> AsyncIterator[str]:
+        """
+        Como gerar, mas entrega o texto aos pedaços enquanto o modelo ainda está gerando.
+        Novas tentativas só antes do primeiro pedaço: depois dele quem consome já agiu sobre o texto parcial,
+        então uma falha no meio vira ErroLLM para ele desfazer o que fez.
+        """
+        async with self._ocupar_vaga():
+            ultimo_erro: Optional[BaseException] = None
+            for tentativa in range(st.LLM_TENTATIVAS):
+                if tentativa:
+                    await self._esperar_nova_tentativa(tentativa)
+                recebeu = False
+                try:
+                    async with aclosing(self._tentar_fluxo(conteudo, esquema)) as fluxo:
+                        async for texto in fluxo:
+                            recebeu = True
+                            yield texto
+                    self._registrar_resultado(True)
+                    return
+                except (asyncio.TimeoutError, *self.backend.erros_transitorios) as e:
+                    if recebeu:
+                        self._registrar_resultado(False)
+                        raise ErroLLM(f"A resposta da IA foi interrompida: {e!r}") from e
+                    ultimo_erro = e
+                    print(f"[ERRO] Falha transitória na IA (tentativa {tentativa + 1}/{st.LLM_TENTATIVAS}): {e!r}")
+                except ErroLLM:
+                    raise
+                except Exception as e:
+                    raise ErroLLM(f"Falha ao chamar a IA: {e}") from e
+
+            self._registrar_resultado(False)
+            raise ErroLLM(f"A IA não respondeu após {st.LLM_TENTATIVAS} tentativas: {ultimo_erro!r}")
+
+
+cliente_llm = ClienteLLM()
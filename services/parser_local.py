@@ -0,0 +1,417 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.extracao import DocumentoPdf
+
+# Interpretação local (sem IA) das tabelas dos PDFs.
+# O texto vem do pdfplumber com layout=True, que preserva a posição horizontal de cada palavra:
+# o deslocamento (em caracteres) de cada token no texto faz o papel da geometria das palavras.
+# Cada coluna é localizada pela linha de cabeçalho da tabela e os tokens de cada linha são
+# atribuídos à coluna mais próxima. Linhas que não fecham com o esperado derrubam a confiança,
+# e quem chama decide se usa o resultado ou recorre ao Gemini.
+
+_RE_TOKEN = re.compile(r"\S+")
+_RE_NUMERICO = re.compile(r"^[\d.,]+$")
+_RE_INTEIRO = re.compile(r"^\d{1,6}$")
+_RE_MOEDA = re.compile(r"^\d{1,3}(?:\.\d{3})*,\d{2}$|^\d+,\d{2}$")
+_RE_TOTAL = re.compile(r"^\s*(?:sub\s*-?\s*)?total", re.IGNORECASE)
+_RE_NOTA_ID = re.compile(r"\bN\s*[º°o]\.?\s*[:\-]?\s*(\d+)", re.IGNORECASE)
+_RE_DATA = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+_RE_CODIGO_BARRAS = re.compile(r"\b\d{13}(?:\d{2}|\d{5})?\b")
+
+# Mudanças no parser que alteram o resultado devem incrementar a versão (invalida o cache de extração)
+VERSAO_PARSER = 2
+
+# Distância máxima (em caracteres) entre um token e o título da coluna
+_TOLERANCIA_COLUNA = 4
+# Pço.Capa / Pço.Liq. das chamadas de encalhe (margem de 30%)
+_PROPORCAO_CAPA_LIQUIDO = 1.428
+_TOLERANCIA_PROPORCAO = 0.03
+
+
+@dataclass
+class ResultadoParser:
+    """
+    JSON no mesmo formato devolvido pelo Gemini e a confiança (0 a 1) da interpretação local.
+    'pendentes' guarda o texto das linhas que o parser não resolveu e 'contexto' o cabeçalho do documento
+    e os títulos da tabela, para que só essas linhas sejam enviadas à IA.
+    """
+    dados: Dict[str, Any]
+    confianca: float
+    avisos: List[str] = field(default_factory=list)
+    pendentes: List[str] = field(default_factory=list)
+    contexto: str = ""
+
+
+@dataclass
+class _Coluna:
+    nome: str
+    inicio: int
+    fim: int
+
+    def distancia(self, inicio: int, fim: int) -> int:
+        if fim < self.inicio:
+            return self.inicio - fim
+        if inicio > self.fim:
+            return inicio - self.fim
+        return 0
+
+
+def _tokens(linha: str) -> List[Tuple[str, int, int]]:
+    return [(m.group(), m.start(), m.end()) for m in _RE_TOKEN.finditer(linha)]
+
+
+def converter_moeda(valor: str) -> Optional[float]:
+    """'1.213,90' -> 1213.9; None se não for um valor monetário com duas casas."""
+    if not valor or not _RE_MOEDA.match(valor):
+        return None
+    return float(valor.replace(".", "").replace(",", "."))
+
+
+def converter_inteiro(valor: str) -> Optional[int]:
+    return int(valor) if valor and _RE_INTEIRO.match(valor) else None
+
+
+def _localizar_cabecalho(linhas: List[str], padroes: Dict[str, re.Pattern]) -> Optional[Tuple[int, List[_Coluna]]]:
+    """
+    Procura a linha de títulos da tabela: a que tem um token para cada um dos 'padroes'.
+    Retorna (índice da linha, colunas); cada token da linha vira uma coluna, e as que casam com
+    algum padrão recebem o nome dele.
+    """
+    for indice, linha in enumerate(linhas):
+        tokens = _tokens(linha)
+        colunas = []
+        encontrados = set()
+        for texto, inicio, fim in tokens:
+            nome = next((n for n, p in padroes.items() if n not in encontrados and p.search(texto)), None)
+            if nome:
+                encontrados.add(nome)
+            colunas.append(_Coluna(nome or texto.lower(), inicio, fim))
+        if len(encontrados) == len(padroes):
+            return (indice, colunas)
+    return None
+
+
+def _separar_linha(linha: str, colunas: List[_Coluna], inicio_numeros: int) -> Tuple[str, Dict[str, List[str]], bool]:
+    """
+    Divide a linha em (texto da descrição, {coluna: [tokens]}, todos_os_tokens_couberam).
+    Valores são os tokens numéricos no fim da linha, a partir da primeira coluna numérica; o resto é descrição
+    (assim nomes longos que invadem as colunas continuam sendo descrição).
+    Cada valor vai para a coluna de centro mais próximo (números costumam ser alinhados à direita e "vazar" para a esquerda).
+    """
+    tokens = _tokens(linha)
+    corte = len(tokens)
+    while corte > 0 and tokens[corte - 1][2] > inicio_numeros and _RE_NUMERICO.match(tokens[corte - 1][0]):
+        corte -= 1
+
+    valores: Dict[str, List[str]] = {}
+    couberam = True
+    for texto, inicio, fim in tokens[corte:]:
+        centro = (inicio + fim) / 2
+        coluna = min(colunas, key=lambda c: abs((c.inicio + c.fim) / 2 - centro))
+        if coluna.distancia(inicio, fim) > _TOLERANCIA_COLUNA:
+            couberam = False
+        valores.setdefault(coluna.nome, []).append(texto)
+    return (" ".join(t for t, _, _ in tokens[:corte]), valores, couberam)
+
+
+# Nota de entrega: colunas "Edição", "Quant." e "Pço.Capa"
+_COLUNAS_ENTRADA = {
+    "numero_edicao": re.compile(r"^edi", re.IGNORECASE),
+    "qtd_estoque": re.compile(r"^quant", re.IGNORECASE),
+    "preco_capa": re.compile(r"capa", re.IGNORECASE),
+}
+
+
+def _contexto_para_ia(documento: DocumentoPdf, titulos: Optional[str]) -> str:
+    """Cabeçalho do documento (até a linha de títulos) e os títulos da tabela, enviados à IA junto com as linhas pendentes."""
+    primeira = documento.paginas[0].split("\n") if documento.paginas else []
+    contexto = "\n".join(l.strip() for l in primeira[:primeira.index(titulos)] if l.strip()) if titulos in primeira else ""
+    return f"{contexto}\n{titulos.strip()}" if titulos else contexto
+
+
+def _linhas_tabela_entrada(linhas: List[str], avisos: List[str]) -> Tuple[List[Dict[str, Any]], List[str], int, Optional[str]]:
+    """
+    Interpreta as linhas de produtos de uma página.
+    Retorna (revistas, textos_pendentes, linhas_candidatas, linha_de_titulos).
+    """
+    cabecalho = _localizar_cabecalho(linhas, _COLUNAS_ENTRADA)
+    if cabecalho is None:
+        # Página sem títulos de tabela: qualquer linha com preço é um produto que não sabemos ler
+        pendentes = [l.strip() for l in linhas if not _RE_TOTAL.match(l) and any(_RE_MOEDA.match(t) for t, _, _ in _tokens(l))]
+        if pendentes:
+            avisos.append(f"{len(pendentes)} linha(s) com valores em página sem cabeçalho de tabela.")
+        return ([], pendentes, len(pendentes), None)
+
+    indice, colunas = cabecalho
+    numericas = [c for c in colunas if c.nome in _COLUNAS_ENTRADA]
+    inicio_numeros = min(c.inicio for c in numericas) - _TOLERANCIA_COLUNA
+    # Só as colunas a partir da primeira numérica disputam os valores
+    colunas_valores = [c for c in colunas if c.fim > inicio_numeros]
+
+    revistas: List[Dict[str, Any]] = []
+    pendentes: List[str] = []
+    candidatas = 0
+    descricao_pendente = ""
+    for linha in linhas[indice + 1:]:
+        if not linha.strip():
+            continue
+        if _RE_TOTAL.match(linha):
+            break
+
+        descricao, valores, couberam = _separar_linha(linha, colunas_valores, inicio_numeros)
+        if not valores:
+            # Linha só com texto: nome quebrado ou categoria/autores/variante (decidido pela próxima linha)
+            descricao_pendente = descricao
+            continue
+
+        candidatas += 1
+        nome = descricao or descricao_pendente
+        texto_linha = "\n".join(t for t in (descricao_pendente, linha.strip()) if t)
+        descricao_pendente = ""
+        edicao = valores.get("numero_edicao", [])
+        qtd = valores.get("qtd_estoque", [])
+        preco = valores.get("preco_capa", [])
+        numero_edicao = converter_inteiro(edicao[0]) if len(edicao) == 1 else None
+        qtd_estoque = converter_inteiro(qtd[0]) if len(qtd) == 1 else None
+        preco_capa = converter_moeda(preco[0]) if len(preco) == 1 else None
+
+        if not (nome and couberam and numero_edicao is not None and qtd_estoque is not None and preco_capa is not None):
+            avisos.append(f"Linha não interpretada: '{linha.strip()}'")
+            pendentes.append(texto_linha)
+            continue
+
+        revistas.append({
+            "id_revista": None,
+            "nome": nome,
+            "numero_edicao": numero_edicao,
+            "qtd_estoque": qtd_estoque,
+            "preco_capa": preco_capa,
+            "url_revista": None,
+        })
+    return (revistas, pendentes, candidatas, linhas[indice])
+
+
+def interpretar_nota_entrega(documento: DocumentoPdf) -> ResultadoParser:
+    """
+    Monta, sem IA, o JSON {"notasentrega": ..., "revistas": [...]} de uma nota de entrega.
+    Linhas que não fecham ficam em 'pendentes' para a IA.
+    Confiança = linhas de produto interpretadas / linhas com valores; 0 se faltar algum campo do cabeçalho.
+    """
+    avisos: List[str] = []
+    revistas: List[Dict[str, Any]] = []
+    pendentes: List[str] = []
+    candidatas = 0
+    titulos: Optional[str] = None
+    for pagina in documento.paginas:
+        (da_pagina, pendentes_pagina, c, titulos_pagina) = _linhas_tabela_entrada(pagina.split("\n"), avisos)
+        revistas.extend(da_pagina)
+        pendentes.extend(pendentes_pagina)
+        candidatas += c
+        titulos = titulos or titulos_pagina
+
+    match_nota = _RE_NOTA_ID.search(documento.texto)
+    nota_entrega_id = match_nota.group(1) if match_nota else None
+
+    dados = {
+        "notasentrega": {
+            "id_nota_entrega": None,
+            "id_usuario": None,
+            "ponto_venda_id": documento.ponto_venda,
+            "nota_entrega_id": nota_entrega_id,
+            "data": documento.data,
+            "url_documento": None,
+        },
+        "revistas": revistas,
+    }
+
+    contexto = _contexto_para_ia(documento, titulos)
+
+    faltando = [campo for campo, valor in (("nota_entrega_id", nota_entrega_id), ("data", documento.data), ("ponto_venda_id", documento.ponto_venda)) if not valor]
+    if faltando:
+        avisos.append(f"Campos do cabeçalho não encontrados: {', '.join(faltando)}")
+        return ResultadoParser(dados, 0.0, avisos, pendentes, contexto)
+    if not revistas:
+        avisos.append("Nenhuma linha de produto encontrada.")
+        return ResultadoParser(dados, 0.0, avisos, pendentes, contexto)
+
+    return ResultadoParser(dados, round(len(revistas) / candidatas, 3), avisos, pendentes, contexto)
+
+
+# Chamada de encalhe: colunas "Edição", "Rep", "Pço.Capa" e "Pço.Liq." (data de entrega e código de barras são achados pelo formato)
+_COLUNAS_DEVOLUCAO = {
+    "numero_edicao": re.compile(r"^edi", re.IGNORECASE),
+    "qtd_estoque": re.compile(r"^rep", re.IGNORECASE),
+    "preco_capa": re.compile(r"capa", re.IGNORECASE),
+    "preco_liquido": re.compile(r"l[íi]q", re.IGNORECASE),
+}
+
+
+def _proporcao_valida(preco_capa: float, preco_liquido: float) -> bool:
+    if preco_capa == 0 and preco_liquido == 0:
+        return True
+    return preco_liquido > 0 and abs(preco_capa / preco_liquido - _PROPORCAO_CAPA_LIQUIDO) <= _TOLERANCIA_PROPORCAO
+
+
+def reparar_rep_preco(token: str, preco_liquido: float) -> Optional[Tuple[Optional[int], float]]:
+    """
+    Rep vazio: o valor de reposição pode ter vindo colado no preço de capa (169,90 = 1 rep + 69,90).
+    Se a proporção capa/líquido (~1.428) já fecha, mantém o preço e o Rep fica None;
+    senão tenta separar 1 ou 2 dígitos iniciais como Rep. Retorna (rep, preco_capa) ou None.
+    """
+    preco_capa = converter_moeda(token)
+    if preco_capa is not None and _proporcao_valida(preco_capa, preco_liquido):
+        return (None, preco_capa)
+    for digitos in (1, 2):
+        rep, resto = token[:digitos], token[digitos:]
+        preco_capa = converter_moeda(resto)
+        if rep.isdigit() and int(rep) > 0 and preco_capa is not None and _proporcao_valida(preco_capa, preco_liquido):
+            return (int(rep), preco_capa)
+    return None
+
+
+def _apagar(linha: str, padrao: re.Pattern) -> Tuple[str, Optional[str]]:
+    """Remove da linha (trocando por espaços, para não deslocar as colunas) a primeira ocorrência do padrão."""
+    match = padrao.search(linha)
+    if not match:
+        return (linha, None)
+    return (linha[:match.start()] + " " * (match.end() - match.start()) + linha[match.end():], match.group())
+
+
+def _resolver_linha_chamada(descricao: str, valores: Dict[str, List[str]], couberam: bool) -> Optional[Dict[str, Any]]:
+    """Converte os tokens de uma linha da chamada em revista, aplicando o reparo Rep/preço. None se não fechar."""
+    liquido = valores.get("preco_liquido", [])
+    preco_liquido = converter_moeda(liquido[0]) if len(liquido) == 1 else None
+    edicao = valores.get("numero_edicao", [])
+    if not (descricao and couberam and preco_liquido is not None and len(edicao) <= 1):
+        return None
+    numero_edicao = converter_inteiro(edicao[0]) if edicao else None
+    if edicao and numero_edicao is None:
+        return None
+
+    # Rep e Pço.Capa são vizinhos: quando colam, o token pode cair em qualquer uma das duas colunas
+    rep_capa = valores.get("qtd_estoque", []) + valores.get("preco_capa", [])
+    if len(rep_capa) == 2 and converter_inteiro(rep_capa[0]) is not None and converter_moeda(rep_capa[1]) is not None:
+        (qtd_estoque, preco_capa) = (converter_inteiro(rep_capa[0]), converter_moeda(rep_capa[1]))
+    elif len(rep_capa) == 1 and (reparado := reparar_rep_preco(rep_capa[0], preco_liquido)):
+        (qtd_estoque, preco_capa) = reparado
+    else:
+        return None
+
+    return {
+        "id_revista": None,
+        "nome": descricao,
+        "apelido_revista": None,
+        "numero_edicao": numero_edicao,
+        "codigo_barras": None,
+        "data_entrega": None,
+        "qtd_estoque": qtd_estoque,
+        "preco_capa": preco_capa,
+        "preco_liquido": preco_liquido,
+        "url_revista": None,
+    }
+
+
+def _linhas_tabela_chamada(linhas: List[str], avisos: List[str]) -> Tuple[List[Dict[str, Any]], List[str], int, Optional[str]]:
+    """
+    Interpreta as linhas de produtos de uma página da chamada.
+    Retorna (revistas, textos_pendentes, linhas_candidatas, linha_de_titulos).
+    """
+    cabecalho = _localizar_cabecalho(linhas, _COLUNAS_DEVOLUCAO)
+    if cabecalho is None:
+        pendentes = [l.strip() for l in linhas if not _RE_TOTAL.match(l) and any(_RE_MOEDA.match(t) for t, _, _ in _tokens(l))]
+        if pendentes:
+            avisos.append(f"{len(pendentes)} linha(s) com valores em página sem cabeçalho de tabela.")
+        return ([], pendentes, len(pendentes), None)
+
+    indice, colunas = cabecalho
+    numericas = [c for c in colunas if c.nome in _COLUNAS_DEVOLUCAO]
+    inicio_numeros = min(c.inicio for c in numericas) - _TOLERANCIA_COLUNA
+    colunas_valores = [c for c in colunas if c.fim > inicio_numeros]
+
+    revistas: List[Dict[str, Any]] = []
+    pendentes: List[str] = []
+    candidatas = 0
+    descricao_pendente = ""
+    codigo_pendente: Optional[str] = None
+    ultima: Optional[Dict[str, Any]] = None
+    for linha in linhas[indice + 1:]:
+        if not linha.strip():
+            continue
+        if _RE_TOTAL.match(linha):
+            break
+
+        (sem_codigo, codigo) = _apagar(linha, _RE_CODIGO_BARRAS)
+        (sem_data, data) = _apagar(sem_codigo, _RE_DATA)
+        descricao, valores, couberam = _separar_linha(sem_data, colunas_valores, inicio_numeros)
+
+        if not valores:
+            if codigo and not descricao:
+                # Código de barras "sob o produto": completa a última revista (ou a próxima)
+                if ultima is not None and ultima["codigo_barras"] is None:
+                    ultima["codigo_barras"] = codigo
+                else:
+                    codigo_pendente = codigo
+            else:
+                # Nome quebrado ou categoria/autores/variante (decidido pela próxima linha)
+                descricao_pendente = descricao
+            continue
+
+        candidatas += 1
+        revista = _resolver_linha_chamada(descricao or descricao_pendente, valores, couberam)
+        if revista is None:
+            avisos.append(f"Linha não interpretada: '{linha.strip()}'")
+            pendentes.append("\n".join(t for t in (descricao_pendente, linha.strip()) if t))
+            ultima = None
+        else:
+            revista["codigo_barras"] = codigo or codigo_pendente
+            if data:
+                dia, mes, ano = _RE_DATA.match(data).groups()
+                revista["data_entrega"] = f"{ano}-{mes}-{dia}"
+            revistas.append(revista)
+            ultima = revista
+        descricao_pendente = ""
+        codigo_pendente = None
+    return (revistas, pendentes, candidatas, linhas[indice])
+
+
+def interpretar_chamada_devolucao(documento: DocumentoPdf) -> ResultadoParser:
+    """
+    Monta, sem IA, o JSON {"chamadasdevolucao": ..., "revistas": [...]} de uma chamada de encalhe,
+    aplicando em código os reparos que antes eram regras do prompt (Rep colado no preço, proporção capa/líquido,
+    "Ponto4 :8507"). Linhas que não fecham ficam em 'pendentes' para a IA.
+    Confiança = linhas interpretadas / linhas com valores; 0 se faltar a data da chamada ou a tabela.
+    """
+    avisos: List[str] = []
+    revistas: List[Dict[str, Any]] = []
+    pendentes: List[str] = []
+    candidatas = 0
+    titulos: Optional[str] = None
+    for pagina in documento.paginas:
+        (da_pagina, pendentes_pagina, c, titulos_pagina) = _linhas_tabela_chamada(pagina.split("\n"), avisos)
+        revistas.extend(da_pagina)
+        pendentes.extend(pendentes_pagina)
+        candidatas += c
+        titulos = titulos or titulos_pagina
+
+    dados = {
+        "chamadasdevolucao": {
+            "id_chamada_devolucao": None,
+            "id_usuario": None,
+            "ponto_venda_id": documento.ponto_venda,
+            "data_limite": documento.data_chamada,
+            "url_documento": None,
+            "status": "pendente",
+        },
+        "revistas": revistas,
+    }
+
+    contexto = _contexto_para_ia(documento, titulos)
+
+    if not documento.data_chamada or titulos is None or candidatas == 0:
+        avisos.append("Data da chamada ou tabela de produtos não encontrada.")
+        return ResultadoParser(dados, 0.0, avisos, pendentes, contexto)
+
+    return ResultadoParser(dados, round(len(revistas) / candidatas, 3), avisos, pendentes, contexto)
+
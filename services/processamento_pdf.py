@@ -0,0 +1,88 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+from settings.settings import importar_configs
+
+st = importar_configs()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_vagas: Optional[asyncio.Semaphore] = None
+
+def iniciar_pool_pdf() -> ProcessPoolExecutor:
+    """
+    Cria o pool de processos para a extração de texto dos PDFs (chamado no lifespan da aplicação).
+    Usa 'spawn' para não herdar threads/conexões do processo da API.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=st.PDF_MAX_PROCESSOS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+def encerrar_pool_pdf():
+    """Encerra os processos do pool, descartando trabalhos que ainda estão na fila."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _obter_vagas() -> asyncio.Semaphore:
+    global _vagas
+    if _vagas is None:
+        _vagas = asyncio.Semaphore(st.PDF_MAX_PROCESSOS)
+    return _vagas
+
+def _reciclar_pool(pool: ProcessPoolExecutor):
+    """
+    Descarta o pool e mata os processos dele. shutdown() sozinho não interrompe um worker ocupado,
+    e um PDF travado seguraria o processo para sempre. terminate_workers() só existe a partir do Python 3.14;
+    antes disso, os processos são encerrados diretamente.
+    """
+    global _pool
+    if _pool is pool:
+        _pool = None
+    if hasattr(pool, "terminate_workers"):
+        pool.terminate_workers()
+        return
+    processos = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for processo in processos:
+        if processo.is_alive():
+            processo.terminate()
+
+async def executar_em_processo(funcao: Callable[..., Any], *args) -> Any:
+    """
+    Roda uma função CPU-bound (leitura dos PDFs) no pool de processos, sem travar o event loop.
+    - No máximo PDF_MAX_PROCESSOS trabalhos rodam ao mesmo tempo; os demais esperam a vez no event loop.
+    - Cada trabalho tem até PDF_TIMEOUT_SEGUNDOS; estourando, o pool é reciclado (o worker travado é morto)
+      antes de liberar a vaga, e levanta ValueError.
+    - Trabalhos de outras requisições que estavam no pool reciclado são repetidos uma vez no pool novo.
+    'funcao' precisa ser definida no nível de um módulo (é enviada ao processo por referência).
+    """
+    async with _obter_vagas():
+        loop = asyncio.get_running_loop()
+        for tentativa in range(2):
+            pool = _pool or iniciar_pool_pdf()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(pool, partial(funcao, *args)),
+                    timeout=st.PDF_TIMEOUT_SEGUNDOS,
+                )
+            except asyncio.TimeoutError:
+                print(f"[ERRO] Leitura de PDF passou de {st.PDF_TIMEOUT_SEGUNDOS:g}s, reciclando o pool de processos.")
+                _reciclar_pool(pool)
+                raise ValueError(f"Tempo limite de {st.PDF_TIMEOUT_SEGUNDOS:g}s excedido ao ler o PDF.")
+            except BrokenProcessPool:
+                if pool is not _pool and tentativa == 0:
+                    # O pool foi reciclado por outro trabalho (timeout) enquanto este rodava: tenta de novo no pool novo
+                    continue
+                # Um processo morreu (ex.: falta de memória): recria o pool para as próximas requisições
+                print("[ERRO] Pool de processos de PDF quebrado, recriando.")
+                _reciclar_pool(pool)
+                raise ValueError("Falha no processo de leitura do PDF.")
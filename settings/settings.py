@@ -8,6 +8,35 @@ class Settings(BaseSettings):
     API_KEY: str
     MODEL_NAME: str
     BUCKET_REVISTAS: str
+    CATALOGO_TTL_SEGUNDOS: int = 300
+    SUPABASE_TIMEOUT_SEGUNDOS: float = 30
+    SUPABASE_MAX_CONEXOES: int = 50
+    SUPABASE_MAX_CONEXOES_KEEPALIVE: int = 20
+    SUPABASE_KEEPALIVE_SEGUNDOS: float = 60
+    PDF_MAX_PROCESSOS: int = 2
+    PDF_TIMEOUT_SEGUNDOS: float = 60
+    PARSER_CONFIANCA_MINIMA: float = 0.95
+    CACHE_EXTRACAO_ARQUIVO: str = "cache_extracao.sqlite3"
+    CACHE_EXTRACAO_MAX_ITENS: int = 500
+    LLM_BACKEND: str = "gemini"
+    LLM_FIXTURES_DIR: str = "fixtures/llm"
+    LLM_MAX_CONCORRENCIA: int = 4
+    LLM_TIMEOUT_SEGUNDOS: float = 90
+    LLM_TENTATIVAS: int = 3
+    LLM_BACKOFF_SEGUNDOS: float = 1
+    LLM_FALHAS_PARA_ABRIR: int = 5
+    LLM_CIRCUITO_SEGUNDOS: float = 30
+    PROMPT_COMPACTAR: bool = True
+    LLM_PAGINAS_POR_PARTE: int = 2
+    LLM_PARTES_SIMULTANEAS: int = 4
+    LLM_STREAMING: bool = False
+    LLM_STREAMING_LOTE: int = 20
+    # Cancelar a extração de um duplicado não interrompe a chamada à IA já enviada nem a leitura do PDF
+    EXTRACAO_ESPECULATIVA: bool = True
+    JOBS_MAX_SIMULTANEOS: int = 4
+    JOBS_RETENCAO_SEGUNDOS: int = 3600
+    ENTREGAS_LOTE_MAX_ARQUIVOS: int = 100
+    ENTREGAS_LOTE_MAX_SIMULTANEOS: int = 4
 
     class Config:
         env_file = ".env"
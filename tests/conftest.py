@@ -0,0 +1,125 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+PASTA_FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+sys.path.insert(0, str(RAIZ))
+
+# Os módulos de services leem as configurações ao serem importados; nos testes nada chega ao Supabase nem à IA,
+# então valores fictícios bastam para as variáveis obrigatórias (um .env de verdade tem precedência)
+for variavel, valor in {
+    "SUPABASE_URL": "https://teste.supabase.co",
+    "SUPABASE_API_KEY": "teste",
+    "SUPABASE_JWT": "teste",
+    "API_KEY": "teste",
+    "MODEL_NAME": "teste",
+    "BUCKET_REVISTAS": "teste",
+}.items():
+    os.environ.setdefault(variavel, valor)
+
+
+@pytest.fixture
+def ler_fixture():
+    """Texto de um arquivo de tests/fixtures (o texto de página do pdfplumber com layout=True)."""
+    def ler(nome: str) -> str:
+        return (PASTA_FIXTURES / nome).read_text(encoding="utf-8")
+    return ler
+
+
+class _Resposta:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Consulta:
+    """Encadeamento table(...).insert/select/update/delete(...).eq/in_(...).execute() sobre listas em memória."""
+
+    def __init__(self, banco: "SupabaseFalso", tabela: str):
+        self._banco = banco
+        self._tabela = tabela
+        self._operacao = "select"
+        self._valores = None
+        self._filtros = []
+
+    def select(self, *_args, **_kwargs):
+        return self
+
+    def insert(self, valores):
+        self._operacao, self._valores = "insert", valores
+        return self
+
+    def update(self, valores):
+        self._operacao, self._valores = "update", valores
+        return self
+
+    def delete(self):
+        self._operacao = "delete"
+        return self
+
+    def eq(self, coluna, valor):
+        self._filtros.append(lambda linha: linha.get(coluna) == valor)
+        return self
+
+    def in_(self, coluna, valores):
+        self._filtros.append(lambda linha: linha.get(coluna) in valores)
+        return self
+
+    async def execute(self):
+        linhas = self._banco.tabelas.setdefault(self._tabela, [])
+        if self._operacao == "insert":
+            novas = []
+            for valores in self._valores if isinstance(self._valores, list) else [self._valores]:
+                nova = dict(valores)
+                chave = self._banco.chaves.get(self._tabela)
+                if chave and chave not in nova:
+                    nova[chave] = next(self._banco.sequencia)
+                linhas.append(nova)
+                novas.append(dict(nova))
+            return _Resposta(novas)
+        afetadas = [linha for linha in linhas if all(filtro(linha) for filtro in self._filtros)]
+        if self._operacao == "update":
+            for linha in afetadas:
+                linha.update(self._valores)
+        elif self._operacao == "delete":
+            self._banco.tabelas[self._tabela] = [linha for linha in linhas if linha not in afetadas]
+        return _Resposta([dict(linha) for linha in afetadas])
+
+
+class _Rpc:
+    def __init__(self, banco: "SupabaseFalso", funcao: str, parametros: dict):
+        self._banco, self._funcao, self._parametros = banco, funcao, parametros
+
+    async def execute(self):
+        if self._funcao != "incrementar_estoque_revistas":
+            raise NotImplementedError(self._funcao)
+        resultado = []
+        for item in self._parametros["itens"]:
+            for revista in self._banco.tabelas.get("revistas", []):
+                if revista["id_revista"] == item["id_revista"]:
+                    revista["qtd_estoque"] += item["qtd"]
+                    resultado.append({"id_revista": revista["id_revista"], "qtd_estoque": revista["qtd_estoque"]})
+        return _Resposta(resultado)
+
+
+class SupabaseFalso:
+    """Cliente do Supabase em memória, só com o que as rotas de entrega usam (tabelas e a RPC de estoque)."""
+
+    def __init__(self):
+        self.tabelas = {}
+        self.chaves = {"revistas": "id_revista", "documentos_entrega": "id_documento_entrega"}
+        self.sequencia = iter(range(1000, 10**6))
+
+    def table(self, tabela: str) -> _Consulta:
+        return _Consulta(self, tabela)
+
+    def rpc(self, funcao: str, parametros: dict) -> _Rpc:
+        return _Rpc(self, funcao, parametros)
+
+
+@pytest.fixture
+def supabase_falso():
+    return SupabaseFalso()
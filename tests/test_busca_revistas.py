@@ -0,0 +1,41 @@
+from rapidfuzz import fuzz
+
+from services.busca_revistas import IndiceBusca
+
+REVISTAS = [
+    {"id_revista": 1, "nome": "Turma da Monica Jovem", "apelido_revista": None},
+    {"id_revista": 2, "nome": "Monica", "apelido_revista": "Turma Monica"},
+    {"id_revista": 3, "nome": "Turma da Monica", "apelido_revista": None},
+    {"id_revista": 4, "nome": "Quatro Rodas", "apelido_revista": None},
+    {"id_revista": 5, "nome": "Monica Parque", "apelido_revista": "Turma Parque Monica"},
+]
+
+
+def _referencia(consulta, corte=0):
+    """Busca como era antes do índice: token_sort_ratio contra nome e apelido, o maior vale."""
+    resultados = []
+    for r in REVISTAS:
+        score = max(
+            fuzz.token_sort_ratio(consulta.lower().strip(), str(r["nome"]).lower().strip()),
+            fuzz.token_sort_ratio(consulta.lower().strip(), str(r.get("apelido_revista") or "").lower().strip()),
+        )
+        if score >= corte:
+            resultados.append((r["id_revista"], score))
+    return sorted(resultados, key=lambda item: -item[1])
+
+
+def test_scores_e_ordem_iguais_ao_token_sort_ratio():
+    indice = IndiceBusca(REVISTAS, versao_nomes=1)
+    for consulta in ("turma monica", "monica da turma", "rodas", "parque"):
+        resultados, total = indice.buscar(consulta, corte=0, limite=len(REVISTAS))
+        assert resultados == _referencia(consulta)
+        assert total == len(REVISTAS)
+
+
+def test_paginacao_e_corte():
+    indice = IndiceBusca(REVISTAS, versao_nomes=1)
+    esperado = _referencia("turma da monica", corte=70)
+    primeira, total = indice.buscar("turma da monica", corte=70, limite=2)
+    segunda, _ = indice.buscar("turma da monica", corte=70, limite=2, deslocamento=2)
+    assert total == len(esperado)
+    assert primeira + segunda == esperado[:4]
@@ -0,0 +1,74 @@
+import asyncio
+import itertools
+
+import services.cache_extracao as modulo_cache
+from services.cache_extracao import CacheExtracao, chave_cache, versao_extracao
+
+
+def test_versao_muda_com_qualquer_parte():
+    assert versao_extracao("entrada", "prompt", 1) == versao_extracao("entrada", "prompt", 1)
+    assert versao_extracao("entrada", "prompt", 1) != versao_extracao("entrada", "prompt", 2)
+    assert versao_extracao("entrada", "prompt") != versao_extracao("devolucao", "prompt")
+
+
+def test_chave_pelo_conteudo_e_pela_versao():
+    assert chave_cache(b"%PDF-1", "v1") == chave_cache(b"%PDF-1", "v1")
+    assert chave_cache(b"%PDF-1", "v1") != chave_cache(b"%PDF-2", "v1")
+    assert chave_cache(b"%PDF-1", "v1") != chave_cache(b"%PDF-1", "v2")
+
+
+def test_guarda_e_obtem(tmp_path):
+    cache = CacheExtracao(str(tmp_path / "cache.sqlite3"), max_itens=10)
+    dados = {"notasentrega": {"data": "2025-11-05"}, "revistas": [{"nome": "Mônica", "qtd_estoque": 2}]}
+
+    async def cenario():
+        assert await cache.obter("a") is None
+        await cache.guardar("a", dados)
+        return await cache.obter("a")
+
+    assert asyncio.run(cenario()) == dados
+
+
+def test_persiste_entre_instancias(tmp_path):
+    arquivo = str(tmp_path / "cache.sqlite3")
+    asyncio.run(CacheExtracao(arquivo, max_itens=10).guardar("a", {"revistas": []}))
+    assert asyncio.run(CacheExtracao(arquivo, max_itens=10).obter("a")) == {"revistas": []}
+
+
+def test_descarta_o_menos_usado(tmp_path, monkeypatch):
+    # Relógio que sempre avança: a ordem de uso não depende da resolução do time.time()
+    relogio = itertools.count(1)
+    monkeypatch.setattr(modulo_cache.time, "time", lambda: float(next(relogio)))
+    cache = CacheExtracao(str(tmp_path / "cache.sqlite3"), max_itens=2)
+
+    async def cenario():
+        await cache.guardar("a", {"n": 1})
+        await cache.guardar("b", {"n": 2})
+        await cache.obter("a")  # "a" passa a ser a mais recente
+        await cache.guardar("c", {"n": 3})
+        return [await cache.obter(chave) for chave in ("a", "b", "c")]
+
+    assert asyncio.run(cenario()) == [{"n": 1}, None, {"n": 3}]
+
+
+def test_desligado(tmp_path):
+    cache = CacheExtracao(str(tmp_path / "cache.sqlite3"), max_itens=0)
+
+    async def cenario():
+        await cache.guardar("a", {"n": 1})
+        return await cache.obter("a")
+
+    assert not cache.ativo
+    assert asyncio.run(cenario()) is None
+    assert not (tmp_path / "cache.sqlite3").exists()
+
+
+def test_falha_do_cache_nao_propaga(tmp_path):
+    # Diretório no lugar do arquivo: o SQLite não abre, e o upload segue como se não houvesse cache
+    cache = CacheExtracao(str(tmp_path), max_itens=10)
+
+    async def cenario():
+        await cache.guardar("a", {"n": 1})
+        return await cache.obter("a")
+
+    assert asyncio.run(cenario()) is None
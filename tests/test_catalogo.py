@@ -0,0 +1,57 @@
+import asyncio
+
+from services.catalogo import CatalogoRevistas
+
+
+def _catalogo_com_banco(banco, ao_ler=None):
+    """Catálogo sobre uma lista em memória; 'ao_ler' roda no meio da leitura (depois da consulta, antes de voltar)."""
+    leituras = {"n": 0}
+
+    async def carregar():
+        leituras["n"] += 1
+        linhas = [dict(linha) for linha in banco]
+        await asyncio.sleep(0)
+        if ao_ler is not None:
+            ao_ler(leituras["n"])
+        return linhas
+    return CatalogoRevistas(carregar, ttl_segundos=60), leituras
+
+
+def test_recarga_que_cruza_escrita_e_refeita():
+    banco = [{"id_revista": 1, "nome": "VEJA", "qtd_estoque": 2}]
+    catalogo = None
+
+    def escrever_durante_a_segunda_leitura(n):
+        # Outra requisição grava no banco e faz o write-through enquanto a recarga ainda lê
+        if n == 2:
+            banco[0]["qtd_estoque"] = 5
+            catalogo.atualizar(1, qtd_estoque=5)
+
+    catalogo, leituras = _catalogo_com_banco(banco, escrever_durante_a_segunda_leitura)
+
+    async def cenario():
+        await catalogo.snapshot()
+        catalogo.invalidar()
+        return await catalogo.obter(1)
+
+    assert asyncio.run(cenario())["qtd_estoque"] == 5
+    assert leituras["n"] == 3
+
+
+def test_escritas_sem_parar_deixam_o_catalogo_para_recarregar():
+    banco = [{"id_revista": 1, "nome": "VEJA", "qtd_estoque": 2}]
+    catalogo = None
+
+    def escrever_sempre(n):
+        catalogo.invalidar()
+
+    catalogo, leituras = _catalogo_com_banco(banco, escrever_sempre)
+
+    async def cenario():
+        primeira = await catalogo.obter(1)
+        return primeira, catalogo._expirado()
+
+    (revista, expirado) = asyncio.run(cenario())
+    assert revista["qtd_estoque"] == 2
+    assert expirado
+    assert leituras["n"] == 3
@@ -0,0 +1,67 @@
+import pytest
+
+from services.compactacao import colapsar_espacos, compactar_paginas, estimar_tokens
+
+
+@pytest.fixture
+def paginas(ler_fixture):
+    # Uma página por trecho separado por quebra de página (form feed), como o pdfplumber lê página a página
+    return ler_fixture("nota_entrega_duas_paginas.txt").split("\f")
+
+
+def test_colapsar_espacos():
+    assert colapsar_espacos("VEJA      2915   2\n\n   Ponto : 48507  \n") == "VEJA | 2915 | 2\nPonto : 48507"
+
+
+def test_estimar_tokens():
+    assert estimar_tokens("") == 0
+    assert estimar_tokens("abcd") == 1
+    assert estimar_tokens("abcde") == 2
+
+
+def test_mantem_cabecalho_uma_vez_e_so_os_produtos(paginas):
+    compactado = compactar_paginas(paginas)
+
+    assert compactado.texto.splitlines() == [
+        "Distribuidora Exemplo Ltda | Nota Nº 123456",
+        "Ponto : 48507 | Data : 05/11/2025",
+        "Produto | Edição | Quant. | Pço.Capa",
+        "VEJA | 2915 | 2 | 13,90",
+        "TURMA DA MONICA ALMANAQUE ESPECIAL | 12 | 10 | 6,99",
+        "PLACAR EDICAO DE COLECIONADOR | 45 | 1 | 213,90",
+        "QUATRO RODAS | 789 | 3 | 1.213,90",
+    ]
+    assert compactado.tokens_depois < compactado.tokens_antes
+    assert 0 < compactado.reducao < 1
+
+
+def test_continuacao_do_nome_vai_para_a_coluna_do_nome(paginas):
+    linhas_por_pagina = compactar_paginas(paginas).linhas_por_pagina
+    assert linhas_por_pagina[0][1] == "TURMA DA MONICA ALMANAQUE ESPECIAL | 12 | 10 | 6,99"
+    assert linhas_por_pagina[1][0] == "PLACAR EDICAO DE COLECIONADOR | 45 | 1 | 213,90"
+
+
+def test_categoria_antes_do_primeiro_produto_sai(paginas):
+    texto = compactar_paginas(paginas).texto
+    assert "REVISTAS SEMANAIS" not in texto
+    assert "ESPORTES" not in texto
+
+
+def test_partes_repetem_o_cabecalho(paginas):
+    compactado = compactar_paginas(paginas)
+    partes = compactado.partes(1)
+
+    assert len(partes) == 2
+    assert all(parte.startswith(compactado.cabecalho + "\n") for parte in partes)
+    assert partes[0].endswith("TURMA DA MONICA ALMANAQUE ESPECIAL | 12 | 10 | 6,99")
+    assert partes[1].endswith("QUATRO RODAS | 789 | 3 | 1.213,90")
+    # Páginas suficientes numa parte só: o texto inteiro
+    assert compactado.partes(2) == [compactado.texto]
+    assert compactado.partes(0) == [compactado.texto]
+
+
+def test_sem_titulos_de_tabela_so_colapsa_os_espacos():
+    compactado = compactar_paginas(["Relatório      de vendas\n\nVEJA     2   13,90"])
+    assert compactado.texto == "Relatório | de vendas\nVEJA | 2 | 13,90"
+    assert compactado.cabecalho == ""
+    assert compactado.partes(1) == [compactado.texto]
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import routers.entradas as entradas
+from services.extracao import DocumentoPdf
+
+REVISTAS = [{"nome": f"REVISTA {i}", "numero_edicao": i, "qtd_estoque": 1, "preco_capa": 9.9} for i in range(6)]
+INVALIDA = {"linha": {"nome": "PLACAR", "numero_edicao": "dez"}, "erro": "numero_edicao: Input should be a valid integer"}
+DOCUMENTO = DocumentoPdf(paginas=["Ponto : 48507   Data : 05/11/2025"], total_paginas=1, data="2025-11-05", ponto_venda="48507")
+
+
+@pytest.fixture(autouse=True)
+def fluxo(monkeypatch):
+    monkeypatch.setattr(entradas.st, "LLM_STREAMING", True)
+    monkeypatch.setattr(entradas.st, "LLM_STREAMING_LOTE", 2)
+
+
+def _extracao_em_fluxo(revistas, linhas_invalidas):
+    """Simula a IA em fluxo: entrega as revistas válidas uma a uma e devolve o JSON final com as descartadas."""
+    async def processar(documento, arquivo_bytes, ao_receber_revista=None):
+        for revista in revistas:
+            ao_receber_revista(dict(revista))
+            await asyncio.sleep(0)
+        return {
+            "notasentrega": {"nota_entrega_id": "1", "ponto_venda_id": "48507", "data": "2025-11-05"},
+            "revistas": revistas,
+            "linhas_invalidas": linhas_invalidas,
+        }
+    return processar
+
+
+def _catalogo(supabase_falso, falhar_na_chamada=None):
+    chamadas = {"n": 0}
+
+    async def pegar_revistas():
+        chamadas["n"] += 1
+        if chamadas["n"] == falhar_na_chamada:
+            raise HTTPException(status_code=500, detail="Erro ao ler o catálogo")
+        return type("Resposta", (), {"data": [dict(r) for r in supabase_falso.tabelas.get("revistas", [])]})()
+    return pegar_revistas
+
+
+def test_linhas_descartadas_no_fluxo_aparecem_em_erros(monkeypatch, supabase_falso):
+    monkeypatch.setattr(entradas, "processar_pdf_para_json", _extracao_em_fluxo(REVISTAS[:3], [INVALIDA]))
+    monkeypatch.setattr(entradas, "pegar_revistas", _catalogo(supabase_falso))
+
+    resposta = asyncio.run(entradas._processar_entrega(DOCUMENTO, b"%PDF", {"sub": "u1"}, supabase_falso))
+
+    assert resposta["data"]["qtd_novas_revistas_criadas"] == 3
+    assert resposta["data"]["erros"] == [{
+        "nome": "PLACAR",
+        "numero_edicao": "dez",
+        "linha": INVALIDA["linha"],
+        "erro": f"Linha fora do esquema, ignorada: {INVALIDA['erro']}",
+    }]
+
+
+def test_falha_no_segundo_lote_desfaz_a_entrega(monkeypatch, supabase_falso):
+    monkeypatch.setattr(entradas, "processar_pdf_para_json", _extracao_em_fluxo(REVISTAS, []))
+    monkeypatch.setattr(entradas, "pegar_revistas", _catalogo(supabase_falso, falhar_na_chamada=2))
+
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(entradas._processar_entrega(DOCUMENTO, b"%PDF", {"sub": "u1"}, supabase_falso))
+
+    assert erro.value.status_code == 500
+    assert "Erro ao ler o catálogo" in erro.value.detail
+    # O primeiro lote foi gravado e desfeito; o documento também foi apagado
+    assert supabase_falso.tabelas["revistas"] == []
+    assert supabase_falso.tabelas["documentos_entrega"] == []
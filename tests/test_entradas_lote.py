@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import HTTPException
+
+import routers.entradas as entradas
+from services.extracao import DocumentoPdf
+
+
+class _Arquivo:
+    def __init__(self, nome: str, conteudo: bytes):
+        self.filename = nome
+        self._conteudo = conteudo
+
+    async def read(self) -> bytes:
+        return self._conteudo
+
+
+def _preparar(monkeypatch):
+    """Cabeçalho e extração pelo conteúdo do arquivo (b"<data>"), sem PDF nem IA."""
+    async def ler_cabecalho(conteudo):
+        data = conteudo.decode()
+        return (DocumentoPdf(paginas=[data], total_paginas=1, data=data, ponto_venda="48507"), data, "48507")
+
+    async def interpretar(documento, conteudo):
+        revistas = [{"nome": f"REVISTA {documento.data}", "numero_edicao": 1, "qtd_estoque": 2, "preco_capa": 9.9}]
+        return ({"notasentrega": {"data": documento.data}, "revistas": revistas, "linhas_invalidas": []}, documento.data)
+
+    monkeypatch.setattr(entradas, "_ler_cabecalho_entrega", ler_cabecalho)
+    monkeypatch.setattr(entradas, "_interpretar_entrega", interpretar)
+
+
+def test_falha_ao_gravar_revistas_apaga_os_documentos_do_lote(monkeypatch, supabase_falso):
+    _preparar(monkeypatch)
+
+    async def pegar_revistas():
+        raise HTTPException(status_code=500, detail="Erro ao ler o catálogo")
+    monkeypatch.setattr(entradas, "pegar_revistas", pegar_revistas)
+
+    arquivos = [_Arquivo("a.pdf", b"2025-11-05"), _Arquivo("b.pdf", b"2025-11-06")]
+    resposta = asyncio.run(entradas.cadastrar_entregas_lote(arquivos, {"sub": "u1"}, supabase_falso))
+
+    assert resposta["data"]["qtd_entregas_cadastradas"] == 0
+    assert [item["status"] for item in resposta["data"]["arquivos"]] == ["erro", "erro"]
+    assert all("Erro ao ler o catálogo" in item["detalhe"] for item in resposta["data"]["arquivos"])
+    # Os documentos inseridos antes da falha foram apagados: o reenvio não é recusado como duplicata
+    assert supabase_falso.tabelas["documentos_entrega"] == []
+
+
+def test_lote_cadastra_cada_arquivo(monkeypatch, supabase_falso):
+    _preparar(monkeypatch)
+
+    async def pegar_revistas():
+        return type("Resposta", (), {"data": []})()
+    monkeypatch.setattr(entradas, "pegar_revistas", pegar_revistas)
+
+    arquivos = [_Arquivo("a.pdf", b"2025-11-05"), _Arquivo("b.pdf", b"2025-11-06")]
+    resposta = asyncio.run(entradas.cadastrar_entregas_lote(arquivos, {"sub": "u1"}, supabase_falso))
+
+    assert resposta["data"]["qtd_entregas_cadastradas"] == 2
+    assert len(supabase_falso.tabelas["documentos_entrega"]) == 2
+    assert [item["qtd_novas_revistas_criadas"] for item in resposta["data"]["arquivos"]] == [1, 1]
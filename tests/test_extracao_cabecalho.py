@@ -0,0 +1,29 @@
+from services.extracao import DocumentoPdf, _extrair_data_entrega, _extrair_pdv, _ler_paginas
+
+
+def test_pdv_com_e_sem_digito_colado():
+    assert _extrair_pdv("Ponto : 48507") == "48507"
+    assert _extrair_pdv("CHAMADA DE ENCALHE      Ponto4 :8507") == "48507"
+
+
+def test_pdv_nao_engole_a_coluna_numerica_seguinte(ler_fixture):
+    texto = ler_fixture("cabecalho_colunas.txt")
+    assert _extrair_pdv(texto) == "48507"
+    assert _extrair_data_entrega(texto) == "2025-11-05"
+
+
+def test_pdv_nao_atravessa_linhas(ler_fixture):
+    # "Ponto :" sem valor: os números da linha de baixo não são o PDV
+    assert _extrair_pdv(ler_fixture("cabecalho_ponto_vazio.txt")) is None
+
+
+def test_data_malformada_vira_none_sem_derrubar_o_documento():
+    class _Pagina:
+        def extract_text(self, layout=True):
+            return "Ponto : 48507      Data : 05/11/2025\nData da chamada : 31/02/2025"
+
+    class _Pdf:
+        pages = [_Pagina()]
+
+    documento = _ler_paginas(DocumentoPdf(paginas=[], total_paginas=1), _Pdf(), ("data", "ponto_venda", "data_chamada"), ate_o_fim=True)
+    assert (documento.data, documento.ponto_venda, documento.data_chamada) == ("2025-11-05", "48507", None)
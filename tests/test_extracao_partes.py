@@ -0,0 +1,73 @@
+from services.compactacao import compactar_paginas
+from services.extracao_partes import juntar_partes
+
+VEJA = {"nome": "VEJA", "numero_edicao": 2915, "qtd_estoque": 2, "preco_capa": 13.9}
+PLACAR = {"nome": "PLACAR", "numero_edicao": 45, "qtd_estoque": 1, "preco_capa": 213.9}
+# Linha do cabeçalho lida como produto (o cabeçalho vai em todas as partes)
+FANTASMA = {"nome": "Distribuidora Exemplo Ltda", "numero_edicao": None, "qtd_estoque": None, "preco_capa": None}
+
+CABECALHO = "Distribuidora Exemplo Ltda | Nota Nº 123456\nProduto | Edição | Quant. | Pço.Capa"
+
+
+def test_cabecalho_pelo_primeiro_valor_nao_nulo():
+    resultados = [
+        {"notasentrega": {"data": "2025-11-05", "ponto_venda_id": None}, "revistas": []},
+        {"notasentrega": {"data": "2025-11-06", "ponto_venda_id": "48507"}, "revistas": []},
+    ]
+    assert juntar_partes(resultados, "notasentrega")["notasentrega"] == {"data": "2025-11-05", "ponto_venda_id": "48507"}
+
+
+def test_mesmo_produto_em_paginas_diferentes_fica_nas_duas():
+    resultados = [
+        {"notasentrega": {}, "revistas": [VEJA]},
+        {"notasentrega": {}, "revistas": [VEJA, PLACAR]},
+    ]
+    textos_partes = ["\nVEJA | 2915 | 2 | 13,90", "\nVEJA | 2915 | 2 | 13,90\nPLACAR | 45 | 1 | 213,90"]
+
+    juntado = juntar_partes(resultados, "notasentrega", CABECALHO, textos_partes)
+    assert juntado["revistas"] == [VEJA, VEJA, PLACAR]
+
+
+def test_revista_lida_do_cabecalho_entra_uma_vez():
+    resultados = [
+        {"notasentrega": {}, "revistas": [FANTASMA, VEJA]},
+        {"notasentrega": {}, "revistas": [FANTASMA, PLACAR]},
+    ]
+    textos_partes = ["\nVEJA | 2915 | 2 | 13,90", "\nPLACAR | 45 | 1 | 213,90"]
+
+    juntado = juntar_partes(resultados, "notasentrega", CABECALHO, textos_partes)
+    assert juntado["revistas"] == [FANTASMA, VEJA, PLACAR]
+
+
+def test_repeticao_dentro_da_mesma_parte_fica():
+    resultados = [{"notasentrega": {}, "revistas": [FANTASMA, FANTASMA]}, {"notasentrega": {}, "revistas": [FANTASMA]}]
+    textos_partes = ["", ""]
+
+    assert juntar_partes(resultados, "notasentrega", CABECALHO, textos_partes)["revistas"] == [FANTASMA, FANTASMA]
+
+
+def test_sem_textos_das_partes_nada_e_removido():
+    resultados = [{"notasentrega": {}, "revistas": [FANTASMA]}, {"notasentrega": {}, "revistas": [FANTASMA]}]
+    assert juntar_partes(resultados, "notasentrega")["revistas"] == [FANTASMA, FANTASMA]
+
+
+def test_linhas_invalidas_de_todas_as_partes():
+    resultados = [
+        {"notasentrega": {}, "revistas": [], "linhas_invalidas": [{"linha": "a", "erro": "x"}]},
+        {"notasentrega": {}, "revistas": []},
+        {"notasentrega": {}, "revistas": [], "linhas_invalidas": [{"linha": "b", "erro": "y"}]},
+    ]
+    assert [l["linha"] for l in juntar_partes(resultados, "notasentrega")["linhas_invalidas"]] == ["a", "b"]
+
+
+def test_com_as_partes_da_compactacao(ler_fixture):
+    compactado = compactar_paginas(ler_fixture("nota_entrega_duas_paginas.txt").split("\f"))
+    partes = compactado.partes(1)
+    textos_partes = [parte[len(compactado.cabecalho):] for parte in partes]
+    resultados = [
+        {"notasentrega": {"data": "2025-11-05"}, "revistas": [FANTASMA, VEJA]},
+        {"notasentrega": {}, "revistas": [FANTASMA, PLACAR]},
+    ]
+
+    juntado = juntar_partes(resultados, "notasentrega", compactado.cabecalho, textos_partes)
+    assert juntado["revistas"] == [FANTASMA, VEJA, PLACAR]
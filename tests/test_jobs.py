@@ -0,0 +1,51 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from services import jobs
+from services.jobs import CONCLUIDO, ERRO, GerenciadorJobs
+
+
+def _rodar(processamentos, cancelar=False):
+    """Enfileira os processamentos, (opcionalmente) encerra o gerenciador e devolve os jobs."""
+    async def cenario():
+        gerenciador = GerenciadorJobs()
+        lista = [gerenciador.enfileirar("entrega", "u1", p) for p in processamentos]
+        await asyncio.sleep(0.01)
+        if cancelar:
+            await gerenciador.encerrar()
+        else:
+            await asyncio.gather(*gerenciador._tarefas, return_exceptions=True)
+        return lista
+    return asyncio.run(cenario())
+
+
+def test_todo_fim_de_job_atualiza_atualizado_em(monkeypatch):
+    monkeypatch.setattr(jobs.st, "JOBS_MAX_SIMULTANEOS", 1)
+
+    async def ok(job):
+        return {"ok": True}
+
+    async def recusa(job):
+        raise HTTPException(status_code=409, detail="duplicado")
+
+    async def quebra(job):
+        raise RuntimeError("falhou")
+
+    for processamento, situacao in ((ok, CONCLUIDO), (recusa, ERRO), (quebra, ERRO)):
+        (job,) = _rodar([processamento])
+        assert job.situacao == situacao
+        assert job.atualizado_em > job.criado_em
+
+
+def test_cancelamento_encerra_job_em_andamento_e_na_fila(monkeypatch):
+    monkeypatch.setattr(jobs.st, "JOBS_MAX_SIMULTANEOS", 1)
+
+    async def demorado(job):
+        await asyncio.sleep(60)
+
+    em_andamento, na_fila = _rodar([demorado, demorado], cancelar=True)
+    for job in (em_andamento, na_fila):
+        assert job.situacao == ERRO
+        assert job.erro["status_code"] == 503
+        assert job.atualizado_em > job.criado_em
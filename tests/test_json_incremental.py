@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from services.json_incremental import LeitorJsonIncremental
+
+# A mesma resposta que o backend fixo da IA devolve (LLM_BACKEND=fixo)
+RESPOSTA_ENTRADA = (Path(__file__).resolve().parent.parent / "fixtures" / "llm" / "RespostaEntradaIA.json").read_text(encoding="utf-8")
+
+
+def _ler_em_pedacos(leitor: LeitorJsonIncremental, texto: str, tamanho: int):
+    lidos = []
+    for inicio in range(0, len(texto), tamanho):
+        lidos.extend(leitor.alimentar(texto[inicio:inicio + tamanho]))
+    return lidos
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 3, 7, 64, 10_000])
+def test_cada_revista_sai_inteira_qualquer_que_seja_o_pedaco(tamanho):
+    leitor = LeitorJsonIncremental()
+    assert _ler_em_pedacos(leitor, RESPOSTA_ENTRADA, tamanho) == json.loads(RESPOSTA_ENTRADA)["revistas"]
+    assert leitor.texto == RESPOSTA_ENTRADA
+
+
+def test_revista_sai_assim_que_fecha():
+    leitor = LeitorJsonIncremental()
+    assert leitor.alimentar('{"notasentrega": {"data": "2025-11-05"}, "revistas": [{"nome": "VEJA"') == []
+    assert leitor.alimentar('}, {"nome": "PLA') == [{"nome": "VEJA"}]
+    assert leitor.alimentar('CAR"}]}') == [{"nome": "PLACAR"}]
+
+
+def test_chaves_e_escapes_dentro_de_strings():
+    documento = {
+        "notasentrega": {"nota_entrega_id": "N {1} [2]", "revistas": "não é a lista"},
+        "revistas": [{"nome": 'A "}]{' + "\\", "qtd_estoque": 1}, {"nome": "B", "variantes": [1, {"x": [2]}]}],
+    }
+    assert _ler_em_pedacos(LeitorJsonIncremental(), json.dumps(documento), 3) == documento["revistas"]
+
+
+def test_so_a_lista_do_primeiro_nivel():
+    texto = json.dumps({"extra": {"revistas": [{"nome": "aninhada"}]}, "outras": [{"nome": "x"}], "revistas": [{"nome": "VEJA"}]})
+    assert LeitorJsonIncremental().alimentar(texto) == [{"nome": "VEJA"}]
+
+
+def test_outra_chave_de_lista():
+    texto = json.dumps({"revistas": [{"nome": "VEJA"}], "chamadas": [{"id": 1}, {"id": 2}]})
+    assert LeitorJsonIncremental("chamadas").alimentar(texto) == [{"id": 1}, {"id": 2}]
+
+
+def test_resposta_interrompida_devolve_so_o_que_fechou():
+    leitor = LeitorJsonIncremental()
+    assert leitor.alimentar('{"revistas": [{"nome": "VEJA"}, {"nome": "PLA') == [{"nome": "VEJA"}]
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(leitor.texto)
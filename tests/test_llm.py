@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import pytest
+
+from services import llm
+from services.llm import ClienteLLM, ErroLLM, LLMIndisponivel
+
+
+class _BackendControlado:
+    """Falha enquanto 'falhar' for True; com 'liberar' definido, cada chamada espera por ele antes de responder."""
+    erros_transitorios = (ConnectionError,)
+
+    def __init__(self):
+        self.falhar = True
+        self.liberar = None
+        self.chamadas = 0
+
+    def gerar(self, conteudo, timeout, esquema=None):
+        self.chamadas += 1
+        if self.liberar is not None:
+            self.liberar.wait(5)
+        if self.falhar:
+            raise ConnectionError("fora do ar")
+        return "ok"
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(llm.st, "LLM_TENTATIVAS", 1)
+    monkeypatch.setattr(llm.st, "LLM_FALHAS_PARA_ABRIR", 2)
+    monkeypatch.setattr(llm.st, "LLM_CIRCUITO_SEGUNDOS", 0)
+    cliente = ClienteLLM(_BackendControlado())
+    yield cliente
+    cliente.encerrar()
+
+
+async def _abrir_circuito(cliente):
+    for _ in range(2):
+        with pytest.raises(ErroLLM):
+            await cliente.gerar("x")
+
+
+def test_meio_aberto_deixa_passar_uma_chamada_de_teste(cliente):
+    async def cenario():
+        await _abrir_circuito(cliente)
+        cliente.backend.falhar = False
+        cliente.backend.liberar = threading.Event()
+        teste = asyncio.ensure_future(cliente.gerar("x"))
+        await asyncio.sleep(0.05)
+        # Intervalo já passou, mas a chamada de teste ainda não terminou: as demais são recusadas
+        with pytest.raises(LLMIndisponivel):
+            await cliente.gerar("x")
+        cliente.backend.liberar.set()
+        assert await teste == "ok"
+        # Teste bem-sucedido fecha o circuito
+        assert await cliente.gerar("x") == "ok"
+
+    asyncio.run(cenario())
+    assert cliente.backend.chamadas == 4
+
+
+def test_falha_na_chamada_de_teste_reabre_o_circuito(cliente, monkeypatch):
+    async def cenario():
+        await _abrir_circuito(cliente)
+        monkeypatch.setattr(llm.st, "LLM_CIRCUITO_SEGUNDOS", 60)
+        with pytest.raises(ErroLLM) as erro:
+            await cliente.gerar("x")
+        assert not isinstance(erro.value, LLMIndisponivel)
+        with pytest.raises(LLMIndisponivel):
+            await cliente.gerar("x")
+
+    asyncio.run(cenario())
+    assert cliente.backend.chamadas == 3
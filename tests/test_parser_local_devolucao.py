@@ -0,0 +1,65 @@
+from services.extracao import DocumentoPdf
+from services.parser_local import interpretar_chamada_devolucao, reparar_rep_preco
+
+
+def _chamada(texto: str, **cabecalho) -> DocumentoPdf:
+    return DocumentoPdf(paginas=[texto], total_paginas=1, **{"ponto_venda": "48507", "data_chamada": "2025-11-20", **cabecalho})
+
+
+def test_reparar_rep_preco_proporcao_ja_fecha():
+    # 13,90 / 9,73 ~ 1.428: o preço está certo e o Rep ficou vazio
+    assert reparar_rep_preco("13,90", 9.73) == (None, 13.9)
+
+
+def test_reparar_rep_preco_um_digito_colado():
+    assert reparar_rep_preco("169,90", 48.93) == (1, 69.9)
+
+
+def test_reparar_rep_preco_dois_digitos_colados():
+    assert reparar_rep_preco("1213,90", 9.73) == (12, 13.9)
+
+
+def test_reparar_rep_preco_prefere_um_digito():
+    # 1 + 213,90 já fecha com o líquido 149,73; não tenta 12 + 13,90
+    assert reparar_rep_preco("1213,90", 149.73) == (1, 213.9)
+
+
+def test_reparar_rep_preco_zerado():
+    assert reparar_rep_preco("0,00", 0.0) == (None, 0.0)
+
+
+def test_reparar_rep_preco_sem_solucao():
+    assert reparar_rep_preco("99,99", 1.0) is None
+    assert reparar_rep_preco("abc", 9.73) is None
+
+
+def test_linhas_da_chamada(ler_fixture):
+    resultado = interpretar_chamada_devolucao(_chamada(ler_fixture("chamada_devolucao.txt")))
+
+    revistas = [
+        (r["nome"], r["numero_edicao"], r["codigo_barras"], r["data_entrega"], r["qtd_estoque"], r["preco_capa"], r["preco_liquido"])
+        for r in resultado.dados["revistas"]
+    ]
+    assert revistas == [
+        ("VEJA", 2915, "7891234567890", "2025-11-01", 2, 13.9, 9.73),
+        # Rep colado no preço de capa (169,90 = 1 + 69,90)
+        ("TURMA DA MONICA", 12, "7899999999999", "2025-11-03", 1, 69.9, 48.93),
+        # Nome quebrado: a linha só com texto vira o nome da linha de valores seguinte
+        ("PLACAR ESPECIAL", 45, None, "2025-11-03", 1, 213.9, 149.73),
+        # Código de barras no começo da linha
+        ("ALBUM COPA", 3, "7890000000017", "2025-11-04", None, 0.0, 0.0),
+    ]
+    assert resultado.dados["chamadasdevolucao"]["data_limite"] == "2025-11-20"
+
+
+def test_linha_que_nao_fecha_fica_pendente_para_a_ia(ler_fixture):
+    resultado = interpretar_chamada_devolucao(_chamada(ler_fixture("chamada_devolucao.txt")))
+
+    assert resultado.pendentes == ["MISTERIO                         77  04/11/2025    xx      99,99      1,00"]
+    assert resultado.confianca == 0.8
+    assert resultado.contexto.splitlines()[-1].startswith("Produto")
+
+
+def test_sem_data_da_chamada_confianca_zero(ler_fixture):
+    resultado = interpretar_chamada_devolucao(_chamada(ler_fixture("chamada_devolucao.txt"), data_chamada=None))
+    assert resultado.confianca == 0.0
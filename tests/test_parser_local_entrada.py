@@ -0,0 +1,61 @@
+from services.extracao import DocumentoPdf
+from services.parser_local import converter_inteiro, converter_moeda, interpretar_nota_entrega
+
+
+def _nota(texto: str, **cabecalho) -> DocumentoPdf:
+    return DocumentoPdf(paginas=[texto], total_paginas=1, **{"ponto_venda": "48507", "data": "2025-11-05", **cabecalho})
+
+
+def test_converter_moeda():
+    assert converter_moeda("13,90") == 13.9
+    assert converter_moeda("1.213,90") == 1213.9
+    assert converter_moeda("13,9") is None
+    assert converter_moeda("12") is None
+
+
+def test_converter_inteiro():
+    assert converter_inteiro("2915") == 2915
+    assert converter_inteiro("x") is None
+    assert converter_inteiro("1,5") is None
+
+
+def test_linhas_pelas_colunas(ler_fixture):
+    resultado = interpretar_nota_entrega(_nota(ler_fixture("nota_entrega.txt")))
+
+    revistas = [(r["nome"], r["numero_edicao"], r["qtd_estoque"], r["preco_capa"]) for r in resultado.dados["revistas"]]
+    assert revistas == [
+        ("VEJA", 2915, 2, 13.9),
+        ("TURMA DA MONICA", 12, 10, 6.99),
+        # Nome longo que invade a coluna "Edição" continua sendo nome
+        ("PLACAR EDICAO ESPECIAL DE COLECIONADORES", 45, 1, 213.9),
+        ("QUATRO RODAS", 789, 3, 1213.9),
+    ]
+    assert resultado.dados["notasentrega"]["nota_entrega_id"] == "123456"
+
+
+def test_linha_que_nao_fecha_fica_pendente_para_a_ia(ler_fixture):
+    resultado = interpretar_nota_entrega(_nota(ler_fixture("nota_entrega.txt")))
+
+    assert resultado.pendentes == ["REVISTA RASURADA                         12   x    3      13,90"]
+    assert resultado.confianca == 0.8
+    # Cabeçalho e títulos da tabela vão junto das linhas pendentes
+    assert resultado.contexto.splitlines()[0].startswith("Distribuidora Exemplo Ltda")
+    assert resultado.contexto.splitlines()[-1].startswith("Produto")
+
+
+def test_total_encerra_a_tabela(ler_fixture):
+    resultado = interpretar_nota_entrega(_nota(ler_fixture("nota_entrega.txt")))
+    assert all(not r["nome"].lower().startswith("total") for r in resultado.dados["revistas"])
+
+
+def test_sem_campo_do_cabecalho_confianca_zero(ler_fixture):
+    resultado = interpretar_nota_entrega(_nota(ler_fixture("nota_entrega.txt"), data=None))
+    assert resultado.confianca == 0.0
+    assert any("data" in aviso for aviso in resultado.avisos)
+
+
+def test_pagina_sem_titulos_vai_inteira_para_a_ia():
+    resultado = interpretar_nota_entrega(_nota("VEJA   2915   2   13,90"))
+    assert resultado.dados["revistas"] == []
+    assert resultado.pendentes == ["VEJA   2915   2   13,90"]
+    assert resultado.confianca == 0.0